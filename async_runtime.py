@@ -0,0 +1,213 @@
+"""Serving mode of the backend, chosen by SERVER_MODE.
+
+- dev:    Werkzeug development server with Socket.IO in threading mode; one OS
+          thread per HTTP request and per Socket.IO connection (default)
+- gevent: gevent WSGI server; requests and Socket.IO connections are
+          greenlets, so hundreds of dashboard clients cost no OS threads
+
+In gevent mode the standard library is monkey-patched when this module is
+imported, so it has to be imported before anything else. Work that holds the
+CPU for long (capture, batch processing, inference) would stall every greenlet
+and runs on native threads instead: `start_thread` for long-running loops,
+`native_executor` for pools and `run_native` for single calls. Socket.IO emits
+and DB writes from those threads are handed to the event loop with
+`call_in_hub`.
+
+gevent's locks, conditions and events only work between greenlets of one
+thread. State shared by native threads is guarded with `native_threading`, an
+unpatched copy of the threading module, and native loops wait with
+`native_sleep`. Both are the plain modules in dev mode.
+"""
+
+import importlib.util
+import multiprocessing
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SERVER_MODES = {"dev": "threading", "gevent": "gevent"}
+
+SERVER_MODE = os.getenv("SERVER_MODE", "dev").lower()
+if SERVER_MODE not in SERVER_MODES:
+    raise ValueError(f"Unknown SERVER_MODE: {SERVER_MODE}")
+ASYNC_MODE = SERVER_MODES[SERVER_MODE]
+# Spawned workers import the parent's main module before parent_process() is set
+WORKER_PROCESS = (
+    multiprocessing.parent_process() is not None
+    or "--multiprocessing-fork" in getattr(sys, "orig_argv", ())
+)
+if WORKER_PROCESS:
+    # Worker processes (the inference pool) serve nothing and stay unpatched
+    ASYNC_MODE = "threading"
+
+
+def _unpatched_threading():
+    """A private copy of the threading module, executed before patching so its
+    primitives keep the native locks."""
+    spec = importlib.util.find_spec("threading")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+if ASYNC_MODE == "gevent":
+    native_threading = _unpatched_threading()
+
+    from gevent import monkey
+
+    monkey.patch_all()
+
+    import gevent
+    import gevent.event
+
+    native_sleep = monkey.get_original("time", "sleep")
+    _native_ident = monkey.get_original("_thread", "get_ident")
+    # gevent's queues are not shared between threads; this one blocks natively
+    _NativeQueue = monkey.get_original("queue", "SimpleQueue")
+    _hub = gevent.get_hub()
+    _hub_ident = _native_ident()
+else:
+    import threading as native_threading
+
+    native_sleep = time.sleep
+
+import logging
+import queue
+import signal
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+
+def start_thread(target, name: str, args=()):
+    """Start `target` on its own daemon OS thread; returns the thread."""
+    thread = native_threading.Thread(target=target, args=args, daemon=True, name=name)
+    thread.start()
+    return thread
+
+
+class NativeFuture(Future):
+    """Future that native threads can wait on in gevent mode."""
+
+    def __init__(self):
+        super().__init__()
+        self._condition = native_threading.Condition()
+
+
+class NativeExecutor(Executor):
+    """Fixed pool of native threads. Unlike gevent's own thread pool it accepts
+    work from any thread, e.g. the ensemble members submitted by a batch
+    worker."""
+
+    def __init__(self, max_workers: int, name: str):
+        self._work = _NativeQueue()
+        self._threads = [
+            start_thread(self._worker, f"{name}-{i}") for i in range(max_workers)
+        ]
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = NativeFuture()
+        self._work.put((future, fn, args, kwargs))
+        return future
+
+    def _worker(self):
+        while True:
+            item = self._work.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        if cancel_futures:
+            while True:
+                try:
+                    item = self._work.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        for _ in self._threads:
+            self._work.put(None)
+
+
+def native_executor(max_workers: int, name: str):
+    """Thread pool whose workers are OS threads in every mode."""
+    if ASYNC_MODE == "gevent":
+        return NativeExecutor(max_workers, name)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+
+def run_native(fn, *args):
+    """Call `fn` on a native thread in gevent mode, letting other greenlets run
+    while it does; a plain call otherwise."""
+    if ASYNC_MODE == "gevent" and _native_ident() == _hub_ident:
+        return _hub.threadpool.apply(fn, args)
+    return fn(*args)
+
+
+def call_in_hub(fn, *args, **kwargs):
+    """Run `fn` in a greenlet of the event loop when called from a native
+    thread in gevent mode, else call it directly."""
+    if ASYNC_MODE == "gevent" and _native_ident() != _hub_ident:
+        _hub.loop.run_callback_threadsafe(partial(gevent.spawn, fn, *args, **kwargs))
+        return
+    return fn(*args, **kwargs)
+
+
+def wait_for_hub_calls(timeout: float = None) -> bool:
+    """In the event loop in gevent mode, wait until the `call_in_hub` calls
+    queued so far by native threads have started; they run in order."""
+    if ASYNC_MODE != "gevent" or _native_ident() != _hub_ident:
+        return True
+    done = gevent.event.Event()
+    _hub.loop.run_callback_threadsafe(gevent.spawn, done.set)
+    return done.wait(timeout)
+
+
+def submit_in_hub(submit, *args) -> Future:
+    """Call `submit(*args)`, which returns a Future, in the event loop in gevent
+    mode and return a Future the calling native thread can wait on. For
+    executors whose bookkeeping runs in the hub, e.g. a process pool."""
+    if ASYNC_MODE != "gevent" or _native_ident() == _hub_ident:
+        return submit(*args)
+    result = NativeFuture()
+
+    def copy(future):
+        if future.cancelled():
+            result.cancel()
+            result.set_running_or_notify_cancel()
+        elif future.exception() is not None:
+            result.set_exception(future.exception())
+        else:
+            result.set_result(future.result())
+
+    def start():
+        try:
+            future = submit(*args)
+        except BaseException as e:
+            result.set_exception(e)
+        else:
+            future.add_done_callback(copy)
+
+    _hub.loop.run_callback_threadsafe(gevent.spawn, start)
+    return result
+
+
+def on_signal(signum, handler):
+    """Install `handler(signum, frame)`; in gevent mode it runs in a greenlet,
+    where it may block (e.g. to flush the DB writer)."""
+    if ASYNC_MODE == "gevent":
+        gevent.signal_handler(signum, handler, signum, None)
+    else:
+        signal.signal(signum, handler)
@@ -0,0 +1,149 @@
+"""NumPy runtime for the dense autoencoder in Model/autoencoder.h5.
+
+The Keras model is exported once to plain weight arrays (autoencoder_weights.npz)
+and the forward pass plus the MAE threshold check then run in NumPy, without
+the Keras predict loop or importing TensorFlow at all.
+
+Parity check of the checked-in weights against Keras (needs TensorFlow); with
+--export the weights are re-exported from the .h5 model first:
+
+    python autoencoder_numpy.py [--export]
+"""
+
+import hashlib
+import logging
+import sys
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = Path(__file__).parent / "Model"
+H5_PATH = MODEL_DIR / "autoencoder.h5"
+WEIGHTS_PATH = MODEL_DIR / "autoencoder_weights.npz"
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "tanh": np.tanh,
+}
+
+
+class NumpyAutoencoder:
+    """Stack of dense layers evaluated in float32, like the Keras model."""
+
+    def __init__(self, layers: list, source_sha256: str = ""):
+        self.layers = layers  # [(kernel, bias, activation name), ...]
+        self.source_sha256 = source_sha256
+
+    @classmethod
+    def load(cls, path: Path = WEIGHTS_PATH) -> "NumpyAutoencoder":
+        data = np.load(path)
+        activations = data["activations"].tolist()
+        layers = [
+            (data[f"kernel_{i}"], data[f"bias_{i}"], name)
+            for i, name in enumerate(activations)
+        ]
+        return cls(layers, str(data["source_sha256"]))
+
+    def predict(self, data: np.ndarray) -> np.ndarray:
+        x = np.asarray(data, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            x = ACTIVATIONS[activation](x @ kernel + bias)
+        return x
+
+    def reconstruction_error(self, data: np.ndarray) -> np.ndarray:
+        """Per-row mean absolute error, as tf.keras.losses.mae"""
+        data = np.asarray(data, dtype=np.float32)
+        return np.mean(np.abs(data - self.predict(data)), axis=-1)
+
+
+def file_sha256(path: Path) -> str:
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def export_weights(
+    keras_model, path: Path = WEIGHTS_PATH, source: Path = H5_PATH
+) -> Path:
+    """Save the Dense layers of a Keras model as plain arrays, tagged with the
+    hash of the .h5 file they came from."""
+    arrays = {}
+    activations = []
+    for layer in keras_model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue  # InputLayer
+        if layer.__class__.__name__ != "Dense":
+            raise ValueError(f"Unsupported layer for NumPy export: {layer.name}")
+        activation = layer.get_config()["activation"]
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"Unsupported activation {activation} in {layer.name}")
+
+        kernel, bias = weights
+        i = len(activations)
+        arrays[f"kernel_{i}"] = kernel.astype(np.float32)
+        arrays[f"bias_{i}"] = bias.astype(np.float32)
+        activations.append(activation)
+
+    np.savez(
+        path,
+        activations=np.array(activations),
+        source_sha256=np.array(file_sha256(source)),
+        **arrays,
+    )
+    logger.info(f"Exported {len(activations)} autoencoder layers to {path}")
+    return path
+
+
+def parity_check(
+    keras_model, numpy_model, data: np.ndarray, threshold: float, atol: float = 1e-5
+) -> bool:
+    """True if both runtimes reconstruct every row within `atol` and take the
+    same threshold decision for it."""
+    import tensorflow as tf
+
+    data = np.asarray(data, dtype=np.float32)
+    reconstructions = keras_model.predict(data, verbose=0)
+    numpy_reconstructions = numpy_model.predict(data)
+    keras_preds = (tf.keras.losses.mae(reconstructions, data).numpy() < threshold)
+    numpy_preds = numpy_model.reconstruction_error(data) < threshold
+
+    max_diff = float(np.max(np.abs(reconstructions - numpy_reconstructions)))
+    if max_diff > atol:
+        logger.error(f"NumPy autoencoder output differs from Keras by {max_diff}")
+    mismatches = int(np.sum(keras_preds != numpy_preds))
+    if mismatches:
+        logger.error(f"NumPy autoencoder disagrees with Keras on {mismatches} rows")
+    return max_diff <= atol and mismatches == 0
+
+
+def parity_samples(
+    numpy_model, threshold: float, rows: int = 20000, seed: int = 0
+) -> np.ndarray:
+    """Scaled inputs covering the MinMax range plus points near the decision threshold."""
+    features = numpy_model.layers[0][0].shape[0]
+    rng = np.random.default_rng(seed)
+    uniform = rng.random((rows, features), dtype=np.float32)
+    small = rng.random((rows, features), dtype=np.float32) * np.float32(threshold * 4)
+    return np.vstack([uniform, small])
+
+
+if __name__ == "__main__":
+    from tensorflow.keras.models import load_model
+
+    logging.basicConfig(level=logging.INFO)
+    keras_model = load_model(H5_PATH, compile=False)
+    threshold = np.load(MODEL_DIR / "autoencoder_train_info.npz")["threshold"].item()
+
+    if "--export" in sys.argv[1:]:
+        export_weights(keras_model)
+    numpy_model = NumpyAutoencoder.load()
+    if numpy_model.source_sha256 != file_sha256(H5_PATH):
+        print(f"{WEIGHTS_PATH.name} was exported from another {H5_PATH.name}")
+        raise SystemExit(1)
+    samples = parity_samples(numpy_model, threshold)
+    ok = parity_check(keras_model, numpy_model, samples, threshold)
+    print("parity OK" if ok else "parity FAILED")
+    raise SystemExit(0 if ok else 1)
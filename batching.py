@@ -0,0 +1,107 @@
+"""Batching policies deciding when the capture pipeline closes a packet batch.
+
+- count:    close after `max_packets` packets
+- time:     close `max_seconds` after the first packet of the batch
+- hybrid:   whichever of the two comes first
+- adaptive: hybrid, with a batch size that grows under backlog (fewer, larger
+            batches amortise per-batch overhead) and shrinks back when the
+            workers keep up (lower detection latency)
+"""
+
+from async_runtime import native_threading
+
+
+class CountPolicy:
+    name = "count"
+
+    def __init__(self, max_packets: int = 5000, max_seconds: float = None):
+        self.max_packets = max_packets
+        self.max_seconds = max_seconds
+        self.last_processing_time = None
+        self.last_queue_depth = 0
+
+    def should_close(self, packet_count: int, age: float) -> bool:
+        return packet_count >= self.max_packets
+
+    def record(self, packet_count: int, processing_time: float, queue_depth: int):
+        """Feedback after a batch has been processed."""
+        self.last_processing_time = processing_time
+        self.last_queue_depth = queue_depth
+
+    def describe(self) -> dict:
+        return {
+            "policy": self.name,
+            "max_packets": self.max_packets,
+            "max_seconds": self.max_seconds,
+            "last_processing_time": self.last_processing_time,
+            "last_queue_depth": self.last_queue_depth,
+        }
+
+
+class TimePolicy(CountPolicy):
+    name = "time"
+
+    def should_close(self, packet_count: int, age: float) -> bool:
+        return packet_count > 0 and age >= self.max_seconds
+
+
+class HybridPolicy(CountPolicy):
+    name = "hybrid"
+
+    def should_close(self, packet_count: int, age: float) -> bool:
+        return packet_count >= self.max_packets or (
+            packet_count > 0 and age >= self.max_seconds
+        )
+
+
+class AdaptivePolicy(HybridPolicy):
+    name = "adaptive"
+
+    GROW = 1.5
+    SHRINK = 0.8
+
+    def __init__(
+        self,
+        max_packets: int = 5000,
+        max_seconds: float = 30,
+        min_packets: int = 500,
+        limit_packets: int = 50000,
+    ):
+        super().__init__(max_packets, max_seconds)
+        self.min_packets = min_packets
+        self.limit_packets = limit_packets
+        self._lock = native_threading.Lock()
+
+    def record(self, packet_count: int, processing_time: float, queue_depth: int):
+        super().record(packet_count, processing_time, queue_depth)
+        with self._lock:
+            if queue_depth > 1 or processing_time > self.max_seconds:
+                size = self.max_packets * self.GROW
+            elif queue_depth == 0 and processing_time < self.max_seconds / 2:
+                size = self.max_packets * self.SHRINK
+            else:
+                return
+            self.max_packets = int(min(max(size, self.min_packets), self.limit_packets))
+
+    def describe(self) -> dict:
+        return {
+            **super().describe(),
+            "min_packets": self.min_packets,
+            "limit_packets": self.limit_packets,
+        }
+
+
+POLICIES = {
+    "count": CountPolicy,
+    "time": TimePolicy,
+    "hybrid": HybridPolicy,
+    "adaptive": AdaptivePolicy,
+}
+
+
+def make_policy(name: str, **kwargs):
+    """Create a batching policy by name; raises ValueError for unknown names."""
+    try:
+        return POLICIES[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown batching policy: {name}")
@@ -0,0 +1,139 @@
+"""Packets/second ceiling of the capture-side accounting.
+
+Drives function2.add_frame, the per-packet path of both capture backends,
+against an in-memory database, with the live feed and the ingest queue
+replaced by stubs that only count. Runs it alone, and with a second thread
+calling function2.flush_batch every millisecond, the way batch_timer closes
+batches under the time/hybrid policies. Each closed batch is copied out of its
+buffer by enqueue_batch on the thread that closed it, as in the server.
+Besides the packets/second ceiling, the report shows the per-packet latency
+tail, where a capture thread stalled behind another lock holder shows up.
+
+The switch interval is shortened for the run. With the default 5 ms, the timer
+thread only gets the GIL when the capture thread releases it while copying out
+a full batch, so it never finds a partial batch to close.
+
+    python benchmarks/capture_accounting_bench.py [packets] [batch_size]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+FRAME = bytes(range(256)) * 2 + bytes(88)  # 600-byte frame
+CLOSE_INTERVAL = 0.001
+SWITCH_INTERVAL = 0.0002
+REPEAT = 3
+
+
+class StubFeed:
+    def record(self, size, protocol, entry):
+        pass
+
+
+class StubQueue:
+    """Counts the batches that enqueue_batch hands over."""
+
+    def __init__(self):
+        self.batches = 0
+        self.packets = 0
+
+    def put(self, item, packets):
+        self.batches += 1
+        self.packets += packets
+        return True
+
+    def stats(self) -> dict:
+        return {"batches": self.batches, "packets": self.packets}
+
+
+def load_pipeline(batch_size: int):
+    # In-memory database, no ingest workers or pool: only the capture path runs
+    import mongomock
+    import pymongo
+
+    pymongo.MongoClient = mongomock.MongoClient
+    os.environ["MONGO_URI"] = "mongodb://localhost"
+    os.environ["BATCH_POLICY"] = "count"
+    os.environ["BATCH_MAX_PACKETS"] = str(batch_size)
+    os.environ["INGEST_WORKERS"] = "0"
+    os.environ["INFERENCE_WORKERS"] = "0"
+    os.environ["STREAMING_FLOWS"] = "0"
+    # function2 logs to ./app.log and creates its batch directories
+    os.chdir(tempfile.mkdtemp(prefix="capture_bench_"))
+    import function2
+
+    function2.live_feed = StubFeed()
+    return function2
+
+
+def run(pipeline, packets, contended):
+    queue = pipeline.batch_queue = StubQueue()
+    stop = threading.Event()
+
+    def closer():
+        while not stop.wait(CLOSE_INTERVAL):
+            pipeline.flush_batch()
+
+    timer = threading.Thread(target=closer, daemon=True)
+    if contended:
+        timer.start()
+
+    add = pipeline.add_frame
+    linktype = pipeline.LINKTYPE_ETHERNET
+    describe = lambda: None  # noqa: E731
+    clock = time.perf_counter
+    latencies = np.empty(packets)
+    ts = time.time()
+    started = clock()
+    for i in range(packets):
+        t = clock()
+        add(FRAME, ts, linktype, 6, describe)
+        latencies[i] = clock() - t
+    elapsed = clock() - started
+
+    stop.set()
+    if contended:
+        timer.join()
+    pipeline.flush_batch()
+    assert queue.packets == packets, "packets were lost between batches"
+    p99, p999 = np.percentile(latencies, (99, 99.9)) * 1e6
+    return packets / elapsed, p99, p999, latencies.max() * 1e6, queue.batches
+
+
+def main():
+    packets = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    pipeline = load_pipeline(batch_size)
+    sys.setswitchinterval(SWITCH_INTERVAL)
+
+    print(f"{packets} packets of {len(FRAME)} bytes, batches of {batch_size}")
+    print(
+        f"  {'':<20} {'packets/s':>12} {'p99 us':>8} {'p99.9 us':>9} "
+        f"{'max us':>9} {'batches':>8}"
+    )
+    for contended in (False, True):
+        label = "with timer closes" if contended else "capture only"
+        # Best of REPEAT runs, to keep scheduler noise out of the comparison
+        runs = [run(pipeline, packets, contended) for _ in range(REPEAT)]
+        rate, p99, p999, worst, batches = max(runs)
+        if contended:
+            # Otherwise the timer only ever found empty batches
+            assert batches > packets // batch_size + 1, "the timer closed no batch"
+        print(
+            f"  {label:<20} {rate:>12,.0f} {p99:>8.2f} {p999:>9.2f} "
+            f"{worst:>9.1f} {batches:>8}"
+        )
+    # The database writer and live feed threads are daemons of a throwaway run
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Load test of a running backend with many dashboard clients.
+
+Opens `sockets` Socket.IO connections (websocket transport, joined to the live
+feed like the dashboard does) and runs `clients` HTTP pollers that request the
+dashboard's read endpoints in a loop, one poll per second each. Reports
+request throughput, latency percentiles, errors and the Socket.IO events
+received; with the server's pid it also samples the server's OS thread count
+and resident memory, which is where SERVER_MODE=dev (a thread per connection)
+and SERVER_MODE=gevent (greenlets) differ most.
+
+    python benchmarks/dashboard_load.py [url] [clients] [sockets] [seconds] [server_pid]
+
+Needs `pip install "python-socketio[client]" requests`.
+"""
+
+import sys
+import threading
+import time
+
+import numpy as np
+import psutil
+import requests
+import socketio
+
+ENDPOINTS = (
+    "/api/status",
+    "/api/batches/all",
+    "/api/flows/summary",
+    "/api/model/current",
+)
+# The backend only accepts Socket.IO connections from the dashboard's origin
+ORIGIN = "http://localhost:3000"
+POLL_INTERVAL = 1.0
+SAMPLE_INTERVAL = 0.5
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.not_modified = 0
+        self.events = 0
+        self.connected = 0
+        self.connect_failures = 0
+        self.threads = []
+        self.rss = []
+
+
+def poller(url: str, results: Results, stop: threading.Event):
+    """One dashboard polling the read endpoints, revalidating with ETags."""
+    session = requests.Session()
+    etags = {}
+    while not stop.is_set():
+        started = time.perf_counter()
+        for endpoint in ENDPOINTS:
+            headers = {"If-None-Match": etags[endpoint]} if endpoint in etags else {}
+            t = time.perf_counter()
+            try:
+                response = session.get(url + endpoint, headers=headers, timeout=30)
+                latency = time.perf_counter() - t
+                ok = response.status_code in (200, 304)
+                if response.headers.get("ETag"):
+                    etags[endpoint] = response.headers["ETag"]
+            except requests.RequestException:
+                latency, ok = None, False
+            with results.lock:
+                if ok:
+                    results.latencies.append(latency)
+                    results.not_modified += response.status_code == 304
+                else:
+                    results.errors += 1
+        stop.wait(max(0.0, POLL_INTERVAL - (time.perf_counter() - started)))
+
+
+def socket_client(url: str, results: Results, stop: threading.Event):
+    client = socketio.Client(
+        reconnection=False, websocket_extra_options={"origin": ORIGIN}
+    )
+
+    @client.on("*")
+    def on_event(event, *args):
+        with results.lock:
+            results.events += 1
+
+    try:
+        client.connect(url, transports=["websocket"], wait_timeout=30)
+    except Exception:
+        with results.lock:
+            results.connect_failures += 1
+        return
+    with results.lock:
+        results.connected += 1
+    stop.wait()
+    client.disconnect()
+
+
+def sampler(pid: int, results: Results, stop: threading.Event):
+    process = psutil.Process(pid)
+    while not stop.wait(SAMPLE_INTERVAL):
+        try:
+            results.threads.append(process.num_threads())
+            results.rss.append(process.memory_info().rss)
+        except psutil.Error:
+            return
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://localhost:5000"
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    sockets = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 30
+    pid = int(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    results = Results()
+    stop = threading.Event()
+    workers = []
+    if pid:
+        workers.append(threading.Thread(target=sampler, args=(pid, results, stop)))
+    workers += [
+        threading.Thread(target=socket_client, args=(url, results, stop))
+        for _ in range(sockets)
+    ]
+    workers += [
+        threading.Thread(target=poller, args=(url, results, stop))
+        for _ in range(clients)
+    ]
+
+    print(f"{url}: {clients} HTTP pollers, {sockets} Socket.IO clients, {seconds}s")
+    started = time.perf_counter()
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    elapsed = time.perf_counter() - started
+    for worker in workers:
+        worker.join(timeout=10)
+
+    latencies = np.array(results.latencies) * 1000
+    print(f"  requests/s        {len(latencies) / elapsed:>10.1f}")
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+        print(f"  latency ms        p50 {p50:.1f}  p95 {p95:.1f}  p99 {p99:.1f}")
+    print(f"  304 responses     {results.not_modified:>10}")
+    print(f"  errors            {results.errors:>10}")
+    print(f"  sockets connected {results.connected:>10}")
+    print(f"  connect failures  {results.connect_failures:>10}")
+    print(f"  socket events     {results.events:>10}")
+    if results.threads:
+        print(f"  server threads    max {max(results.threads)}")
+        print(f"  server RSS MB     max {max(results.rss) / 2**20:.0f}")
+
+
+if __name__ == "__main__":
+    main()
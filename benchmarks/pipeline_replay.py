@@ -0,0 +1,347 @@
+"""Offline replay benchmark of the capture and detection pipeline.
+
+Replays pcap files through handle_packet, so batches are closed, queued and
+processed by the ingest workers with process_packet_batch exactly as during a
+live capture, against an in-memory mongomock database. A synthetic pcap of
+`packets` packets (TCP/UDP flows between a few hosts plus a SYN flood) is
+generated with Scapy and replayed first, followed by any pcap files given.
+
+Per pcap it reports capture packets/second (handle_packet only, which blocks
+while the ingest queue is full), end-to-end packets/second until the last
+batch is processed, per-batch latency and per-stage percentiles from the
+batches' `timings_ms` and the peak resident memory. Afterwards every detector
+(autoencoder, kmeans, svm) scores the replayed flows on its own to report its
+inference cost per batch and per flow. Results are written as JSON; `compare`
+prints the relative change between two result files.
+
+    python benchmarks/pipeline_replay.py [packets] [model] [output.json] [pcap ...]
+    python benchmarks/pipeline_replay.py compare <old.json> <new.json>
+
+The backend's configuration applies (BATCH_MAX_PACKETS, default 2000 here,
+FLOW_EXTRACTOR, SCORING_MODE, INGEST_WORKERS, INFERENCE_WORKERS, AU_BACKEND).
+Needs `pip install mongomock`.
+"""
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import psutil  # noqa: E402
+
+DETECTOR_NAMES = ("autoencoder", "kmeans", "svm")
+PERCENTILES = (50, 95, 99)
+SAMPLE_INTERVAL = 0.05
+REPEAT = 5
+DRAIN_TIMEOUT = 600
+
+
+def synthetic_pcap(path: Path, packets: int, seed: int = 0):
+    """Write `packets` packets: request/response flows between a few clients
+    and servers, with a SYN flood against one server in the middle 10%."""
+    from scapy.all import IP, TCP, UDP, Ether, Raw, wrpcap
+
+    rng = np.random.default_rng(seed)
+    clients = [f"10.0.0.{i}" for i in range(2, 42)]
+    servers = [
+        ("192.168.1.10", 80, "tcp"),
+        ("192.168.1.11", 443, "tcp"),
+        ("192.168.1.12", 53, "udp"),
+        ("192.168.1.13", 1883, "tcp"),
+    ]
+    flows = [
+        (
+            clients[rng.integers(len(clients))],
+            int(rng.integers(1024, 65535)),
+            *servers[rng.integers(len(servers))],
+        )
+        for _ in range(max(1, packets // 20))
+    ]
+    flood = range(int(packets * 0.45), int(packets * 0.55))
+
+    frames = []
+    ts = 1_700_000_000.0
+    for i in range(packets):
+        ts += float(rng.exponential(0.002))
+        if i in flood:
+            src = f"172.16.{rng.integers(256)}.{rng.integers(256)}"
+            pkt = Ether() / IP(src=src, dst="192.168.1.10") / TCP(
+                sport=int(rng.integers(1024, 65535)), dport=80, flags="S"
+            )
+        else:
+            client, sport, server, dport, proto = flows[rng.integers(len(flows))]
+            src, dst, sp, dp = client, server, sport, dport
+            if rng.random() < 0.4:
+                src, dst, sp, dp = server, client, dport, sport
+            payload = Raw(bytes(int(rng.integers(0, 1200))))
+            if proto == "udp":
+                l4 = UDP(sport=sp, dport=dp)
+            else:
+                l4 = TCP(sport=sp, dport=dp, flags="PA")
+            pkt = Ether() / IP(src=src, dst=dst) / l4 / payload
+        pkt.time = ts
+        frames.append(pkt)
+    wrpcap(str(path), frames)
+
+
+def percentiles(values) -> dict:
+    if not len(values):
+        return None
+    values = np.asarray(values, dtype=float)
+    points = np.percentile(values, PERCENTILES)
+    result = {f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, points)}
+    result["mean"] = round(float(values.mean()), 3)
+    result["max"] = round(float(values.max()), 3)
+    return result
+
+
+class MemorySampler:
+    """Peak resident memory of this process while it runs."""
+
+    def __init__(self):
+        self.process = psutil.Process()
+        self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def wait_for_batches(pipeline):
+    """Block until every enqueued batch has been processed and written."""
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    while time.monotonic() < deadline:
+        stats = pipeline.batch_queue.stats()
+        if stats["depth"] == 0 and stats["in_progress"] == 0:
+            break
+        time.sleep(0.01)
+    else:
+        raise TimeoutError(f"Batches still pending after {DRAIN_TIMEOUT}s")
+
+
+def replay(pipeline, pcap: Path) -> dict:
+    from scapy.all import rdpcap
+
+    packets = rdpcap(str(pcap))
+    for name in ("batches", "flows", "alerts", "flow_rollups"):
+        pipeline.db[name].delete_many({})
+
+    with MemorySampler() as memory:
+        started = time.perf_counter()
+        for packet in packets:
+            pipeline.handle_packet(packet)
+        capture_elapsed = time.perf_counter() - started
+        pipeline.flush_batch()
+        wait_for_batches(pipeline)
+        elapsed = time.perf_counter() - started
+        pipeline.db_writer.flush(DRAIN_TIMEOUT)
+
+    batches = list(pipeline.db.batches.find({}, {"timings_ms": 1}))
+    timings = [b["timings_ms"] for b in batches if b.get("timings_ms")]
+    stages = sorted({s for t in timings for s in t if s != "total"})
+    return {
+        "pcap": pcap.name,
+        "packets": len(packets),
+        "batches": len(batches),
+        "flows": pipeline.db.flows.count_documents({}),
+        "alerts": pipeline.db.alerts.count_documents({}),
+        "capture_packets_per_s": round(len(packets) / capture_elapsed, 1),
+        "end_to_end_packets_per_s": round(len(packets) / elapsed, 1),
+        "elapsed_s": round(elapsed, 3),
+        "batch_latency_ms": percentiles([t["total"] for t in timings]),
+        "stage_ms": {s: percentiles([t.get(s, 0.0) for t in timings]) for s in stages},
+        "peak_rss_mb": round(memory.peak / 2**20, 1),
+    }
+
+
+def inference_costs(pipeline) -> dict:
+    """Cost of each detector on the flows of the last replay, once per batch
+    on the aggregated row and once on one row per flow."""
+    from detectors import registry, run_detection
+
+    flows = pd.DataFrame(list(pipeline.db.flows.find({}, {"_id": 0})))
+    if flows.empty or "batch_index" not in flows:
+        return {}
+    tables = [df for _, df in flows.groupby("batch_index")]
+
+    results = {}
+    for name in DETECTOR_NAMES:
+        started = time.perf_counter()
+        bundle = registry.get(name)
+        load_ms = (time.perf_counter() - started) * 1000
+        per_batch, per_flow, rows = [], [], 0
+        for table in tables:
+            aggregated = pipeline.aggregate_features(table, name)
+            by_flow = pipeline.flow_features(table, name)
+            for _ in range(REPEAT):
+                if aggregated is not None:
+                    t = time.perf_counter()
+                    run_detection(name, aggregated, bundle)
+                    per_batch.append((time.perf_counter() - t) * 1000)
+                if by_flow is not None:
+                    t = time.perf_counter()
+                    run_detection(name, by_flow, bundle)
+                    per_flow.append((time.perf_counter() - t) * 1000)
+            rows += len(by_flow) if by_flow is not None else 0
+        scored = rows * REPEAT
+        results[name] = {
+            "load_ms": round(load_ms, 1),
+            "aggregated_batch_ms": percentiles(per_batch),
+            "per_flow_batch_ms": percentiles(per_flow),
+            "us_per_flow": round(sum(per_flow) * 1000 / scored, 3) if scored else None,
+        }
+    return results
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(packets: int, model: str, output: Path, pcaps: list):
+    # In-memory database; the pipeline must not see the real MONGO_URI
+    import mongomock
+    import pymongo
+
+    pymongo.MongoClient = mongomock.MongoClient
+    os.environ["MONGO_URI"] = "mongodb://localhost"
+    os.environ.setdefault("BATCH_MAX_PACKETS", "2000")
+    os.environ["BATCH_POLICY"] = "count"
+
+    workdir = Path(tempfile.mkdtemp(prefix="pipeline_replay_"))
+    # function2 logs to ./app.log and keeps batch artifacts in BATCH_DIR
+    os.chdir(workdir)
+    import function2 as pipeline
+    from model_state import set_model
+
+    pipeline.BATCH_DIR = workdir / "batches"
+    pipeline.BATCH_DIR.mkdir()
+    set_model(model)
+
+    synthetic = workdir / f"synthetic_{packets}.pcap"
+    print(f"Generating {packets} synthetic packets")
+    synthetic_pcap(synthetic, packets)
+
+    # Model loading is reported separately, not as the first batch's latency
+    started = time.perf_counter()
+    pipeline.model_bundles(model)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    runs = []
+    for pcap in [synthetic] + [Path(p) for p in pcaps]:
+        print(f"Replaying {pcap.name}")
+        result = replay(pipeline, pcap)
+        runs.append(result)
+        latency = result["batch_latency_ms"] or {}
+        print(
+            f"  {result['packets']} packets, {result['batches']} batches, "
+            f"{result['flows']} flows: capture {result['capture_packets_per_s']:,.0f} "
+            f"pkt/s, end to end {result['end_to_end_packets_per_s']:,.0f} pkt/s, "
+            f"batch p50 {latency.get('p50')} / p95 {latency.get('p95')} ms, "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+
+    print("Inference cost per detector")
+    inference = inference_costs(pipeline)
+    for name, cost in inference.items():
+        aggregated = cost["aggregated_batch_ms"] or {}
+        print(
+            f"  {name:<12} aggregated row p50 {aggregated.get('p50')} ms, "
+            f"one row per flow {cost['us_per_flow']} us/flow"
+        )
+
+    report = {
+        "version": git_version(),
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "model": model,
+            "model_load_ms": round(load_ms, 1),
+            "batch_max_packets": pipeline.BATCH_MAX_PACKETS,
+            "flow_extractor": pipeline.FLOW_EXTRACTOR,
+            "scoring_mode": pipeline.SCORING_MODE,
+            "ingest_workers": pipeline.INGEST_WORKERS,
+            "inference_workers": pipeline.INFERENCE_WORKERS,
+            "au_backend": os.getenv("AU_BACKEND"),
+        },
+        "runs": runs,
+        "inference": inference,
+    }
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+    if pipeline.inference_pool is not None:
+        pipeline.inference_pool.shutdown()
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+def flatten(value, prefix=""):
+    if isinstance(value, dict):
+        items = {}
+        for key, item in value.items():
+            items.update(flatten(item, f"{prefix}.{key}" if prefix else key))
+        return items
+    return {prefix: value}
+
+
+def compare(old_path: str, new_path: str):
+    """Relative change of every number shared by two result files."""
+    old, new = (json.loads(Path(p).read_text()) for p in (old_path, new_path))
+    print(f"{old.get('version')} -> {new.get('version')}")
+    sections = {
+        "runs": lambda report: {r["pcap"]: r for r in report["runs"]},
+        "inference": lambda report: report["inference"],
+    }
+    for section, index in sections.items():
+        before, after = flatten(index(old)), flatten(index(new))
+        for key in before:
+            a, b = before[key], after.get(key)
+            if isinstance(a, (int, float)) and isinstance(b, (int, float)) and a:
+                change = (b - a) / a
+                print(f"  {section}.{key:<60} {a:>12.6g} {b:>12.6g} {change:>+8.1%}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        compare(sys.argv[2], sys.argv[3])
+        return
+    packets = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    model = sys.argv[2] if len(sys.argv) > 2 else "kmeans"
+    output = Path(sys.argv[3] if len(sys.argv) > 3 else "pipeline_replay.json")
+    output = output.resolve()
+    pcaps = [str(Path(p).resolve()) for p in sys.argv[4:]]
+    run(packets, model, output, pcaps)
+
+
+if __name__ == "__main__":
+    main()
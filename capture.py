@@ -0,0 +1,246 @@
+"""Pluggable packet capture backends.
+
+- scapy:     scapy.sniff, every packet fully dissected (portable, default)
+- af_packet: Linux AF_PACKET raw socket with kernel timestamps, optionally
+             reading from a TPACKET_V3 memory-mapped ring (no copy per recv)
+- pcap:      replay of a classic pcap file, as fast as possible or paced by
+             the original inter-arrival times
+
+The af_packet and pcap backends deliver raw frames as (frame, ts, linktype)
+to `on_frame` without dissecting them; scapy delivers Packet objects to
+`on_packet`. run() blocks until `stop` is set (or the pcap file is exhausted).
+"""
+
+import logging
+import mmap
+import select
+import socket
+import struct
+import time
+
+from scapy.all import sniff
+
+from async_runtime import native_sleep
+from packet_records import LINKTYPE_ETHERNET, LINKTYPE_RAW, read_pcap
+
+logger = logging.getLogger(__name__)
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+TPACKET3_HDRLEN = 48
+PACKET_OUTGOING = 4
+SO_TIMESTAMP = getattr(socket, "SO_TIMESTAMP", 29)
+ARPHRD_NONE = 0xFFFE
+POLL_TIMEOUT_MS = 500
+
+
+class ScapyCapture:
+    name = "scapy"
+
+    def __init__(self, iface: str = None, on_packet=None, **kwargs):
+        self.iface = iface
+        self.on_packet = on_packet
+
+    def run(self, stop):
+        sniff(
+            iface=self.iface,
+            # Packets still delivered after a stop would race the next capture
+            prn=lambda x: None if stop.is_set() else self.on_packet(x),
+            store=False,
+            stop_filter=lambda x: stop.is_set(),
+        )
+
+    def describe(self) -> dict:
+        return {"backend": self.name, "iface": self.iface}
+
+
+class AFPacketCapture:
+    name = "af_packet"
+
+    def __init__(
+        self,
+        iface: str = None,
+        on_frame=None,
+        tpacket_v3: bool = False,
+        block_size: int = 1 << 20,
+        block_count: int = 64,
+        block_timeout_ms: int = 100,
+        **kwargs,
+    ):
+        if not hasattr(socket, "AF_PACKET"):
+            raise ValueError("The af_packet capture backend needs Linux")
+        self.iface = iface
+        self.on_frame = on_frame
+        self.tpacket_v3 = tpacket_v3
+        self.block_size = block_size
+        self.block_count = block_count
+        self.block_timeout_ms = block_timeout_ms
+
+    def _open(self) -> socket.socket:
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        if self.iface:
+            sock.bind((self.iface, 0))
+        return sock
+
+    def _skip(self, pkttype: int) -> bool:
+        # On loopback every packet is seen once outgoing and once incoming
+        return pkttype == PACKET_OUTGOING and self.iface == "lo"
+
+    def run(self, stop):
+        sock = self._open()
+        try:
+            if self.tpacket_v3:
+                self._run_ring(sock, stop)
+            else:
+                self._run_socket(sock, stop)
+        finally:
+            sock.close()
+
+    def _run_socket(self, sock, stop):
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMP, 1)
+        sock.settimeout(POLL_TIMEOUT_MS / 1000)
+        ancillary = socket.CMSG_SPACE(struct.calcsize("ll"))
+        while not stop.is_set():
+            try:
+                frame, ancdata, _, address = sock.recvmsg(65535, ancillary)
+            except socket.timeout:
+                continue
+            if stop.is_set() or self._skip(address[2]):
+                continue
+            ts = None
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMP:
+                    sec, usec = struct.unpack("ll", data[: struct.calcsize("ll")])
+                    ts = sec + usec / 1_000_000
+            linktype = LINKTYPE_RAW if address[3] == ARPHRD_NONE else LINKTYPE_ETHERNET
+            self.on_frame(frame, ts if ts is not None else time.time(), linktype)
+
+    def _run_ring(self, sock, stop):
+        """Read blocks of frames from a TPACKET_V3 ring shared with the kernel."""
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        frame_size = 2048
+        req = struct.pack(
+            "IIIIIII",
+            self.block_size,
+            self.block_count,
+            frame_size,
+            self.block_size * self.block_count // frame_size,
+            self.block_timeout_ms,
+            0,
+            0,
+        )
+        sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        ring = mmap.mmap(
+            sock.fileno(),
+            self.block_size * self.block_count,
+            mmap.MAP_SHARED,
+            mmap.PROT_READ | mmap.PROT_WRITE,
+        )
+        poller = select.poll()
+        poller.register(sock, select.POLLIN | select.POLLERR)
+        block = 0
+
+        try:
+            while not stop.is_set():
+                base = block * self.block_size
+                # struct tpacket_block_desc: version, offset_to_priv, tpacket_hdr_v1
+                status, num_pkts, offset = struct.unpack_from("III", ring, base + 8)
+                if not status & TP_STATUS_USER:
+                    poller.poll(POLL_TIMEOUT_MS)
+                    continue
+
+                for _ in range(num_pkts):
+                    pkt = base + offset
+                    # struct tpacket3_hdr
+                    next_offset, sec, nsec, snaplen, _, _, mac = struct.unpack_from(
+                        "IIIIIIH", ring, pkt
+                    )
+                    # struct sockaddr_ll follows the 48-byte aligned header
+                    hatype, pkttype = struct.unpack_from(
+                        "HB", ring, pkt + TPACKET3_HDRLEN + 8
+                    )
+                    offset += next_offset
+                    if self._skip(pkttype):
+                        continue
+                    self.on_frame(
+                        ring[pkt + mac : pkt + mac + snaplen],
+                        sec + nsec / 1_000_000_000,
+                        LINKTYPE_RAW if hatype == ARPHRD_NONE else LINKTYPE_ETHERNET,
+                    )
+
+                struct.pack_into("I", ring, base + 8, TP_STATUS_KERNEL)
+                block = (block + 1) % self.block_count
+        finally:
+            poller.unregister(sock)
+            ring.close()
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.name,
+            "iface": self.iface,
+            "tpacket_v3": self.tpacket_v3,
+        }
+
+
+class PcapReplay:
+    name = "pcap"
+
+    def __init__(self, pcap_path: str = None, on_frame=None, speed: float = 0, **kwargs):
+        """`speed` 0 replays as fast as possible, 1 in real time, 2 twice as fast..."""
+        if not pcap_path:
+            raise ValueError("pcap_path is required for the pcap capture backend")
+        self.pcap_path = pcap_path
+        self.on_frame = on_frame
+        try:
+            # Also given as a string in the capture settings request
+            self.speed = float(speed)
+        except (TypeError, ValueError):
+            raise ValueError(f"speed must be a number, got {speed!r}")
+        if not self.speed >= 0:
+            raise ValueError(f"speed must not be negative, got {speed!r}")
+        self.replayed = 0
+
+    def run(self, stop):
+        started = time.perf_counter()
+        first_ts = None
+        for frame, ts, linktype in read_pcap(self.pcap_path):
+            if stop.is_set():
+                break
+            if self.speed > 0:
+                if first_ts is None:
+                    first_ts = ts
+                delay = (ts - first_ts) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    native_sleep(delay)
+            self.on_frame(frame, ts, linktype)
+            self.replayed += 1
+        logger.info(f"Replayed {self.replayed} packets from {self.pcap_path}")
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.name,
+            "pcap_path": self.pcap_path,
+            "speed": self.speed,
+            "replayed": self.replayed,
+        }
+
+
+BACKENDS = {
+    "scapy": ScapyCapture,
+    "af_packet": AFPacketCapture,
+    "pcap": PcapReplay,
+}
+
+
+def make_capture(name: str, **kwargs):
+    """Create a capture backend by name; raises ValueError for unknown names."""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown capture backend: {name}")
+    return backend(**kwargs)
@@ -0,0 +1,272 @@
+"""Write-behind MongoDB persistence.
+
+Batch workers hand documents (or whole flow DataFrames, or other bulk write
+requests such as upserts) to DbWriter and return immediately; a writer thread
+drains the queue, coalesces the writes queued for each collection, possibly
+from several batches, into unordered bulk writes, and retries failed writes
+with exponential backoff.
+
+Document ids are assigned when a document is queued, so callers get the id at
+once and a retried insert cannot create duplicates: duplicate key errors of a
+retry count as written. After a partial failure only the failed requests are
+retried. Other requests (e.g. $inc upserts) are written in their own bulk
+writes and are only retried when the server reported them as failed: after an
+error that leaves open whether they were applied they are given up, rather
+than risk applying them twice. When more than `max_docs` documents are
+waiting, new writes are dropped (and counted) rather than blocking the caller.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+from bson import ObjectId
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from async_runtime import call_in_hub, run_native, wait_for_hub_calls
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+def frame_documents(df: pd.DataFrame, fields: dict = None) -> list:
+    """DataFrame rows as documents, NaN stored as null, plus constant `fields`."""
+    docs = df.astype(object).where(df.notna(), None).to_dict(orient="records")
+    for doc in docs:
+        if fields:
+            doc.update(fields)
+        doc["_id"] = ObjectId()
+    return docs
+
+
+class DbWriter:
+    def __init__(
+        self,
+        db,
+        max_docs: int = 200_000,
+        bulk_size: int = 5000,
+        flush_interval: float = 0.5,
+        retries: int = 5,
+        backoff: float = 0.5,
+        write_seconds=None,
+    ):
+        self.db = db
+        self.max_docs = max_docs
+        self.bulk_size = bulk_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.backoff = backoff
+        # Histogram (see metrics.py) of bulk write durations by collection
+        self.write_seconds = write_seconds
+
+        # (collection, docs or DataFrame, extra fields, size) in arrival order
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._pending_docs = 0
+        self._busy = False
+        self._flushing = False
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried = 0
+        self.bulk_writes = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.listeners = []
+
+    def on_write(self, callback):
+        """Call `callback(collection)` after each bulk write to a collection."""
+        self.listeners.append(callback)
+
+    def insert_one(self, collection: str, doc: dict) -> ObjectId:
+        """Queue one document; returns the id it will be stored under."""
+        doc.setdefault("_id", ObjectId())
+        call_in_hub(self._put, collection, [doc], None, 1)
+        return doc["_id"]
+
+    def insert_many(self, collection: str, docs: list):
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+        call_in_hub(self._put, collection, docs, None, len(docs))
+
+    def bulk(self, collection: str, requests: list):
+        """Queue pymongo write requests (UpdateOne, ...) for `collection`."""
+        call_in_hub(self._put, collection, requests, None, len(requests))
+
+    def insert_frame(self, collection: str, df: pd.DataFrame, fields: dict = None):
+        """Queue the rows of `df`; they are converted to documents on the writer
+        thread."""
+        call_in_hub(self._put, collection, df, fields, len(df))
+
+    def _put(self, collection, docs, fields, size):
+        if not size:
+            return
+        with self._cond:
+            if self._pending_docs + size > self.max_docs:
+                self.dropped += size
+                logger.warning(
+                    f"DB write queue full, dropped {size} documents for {collection}"
+                )
+                return
+            self._items.append((collection, docs, fields, size))
+            self._pending_docs += size
+            self._cond.notify()
+
+    def _take(self) -> list:
+        """Wait for queued writes, then give the writes of up to one
+        flush_interval a chance to arrive and take them all."""
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            deadline = time.monotonic() + self.flush_interval
+            while self._pending_docs < self.bulk_size and not self._flushing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            items = list(self._items)
+            self._items.clear()
+            self._busy = True
+            return items
+
+    def run(self):
+        while True:
+            items = self._take()
+            try:
+                by_collection = {}
+                for collection, docs, fields, size in items:
+                    if isinstance(docs, pd.DataFrame):
+                        # CPU-bound; off the event loop in gevent mode
+                        docs = run_native(frame_documents, docs, fields)
+                    inserts, others = by_collection.setdefault(collection, ([], []))
+                    for doc in docs:
+                        if isinstance(doc, dict):
+                            inserts.append(InsertOne(doc))
+                        else:
+                            others.append(doc)
+
+                for collection, (inserts, others) in by_collection.items():
+                    for requests, idempotent in ((inserts, True), (others, False)):
+                        for start in range(0, len(requests), self.bulk_size):
+                            self._write(
+                                collection,
+                                requests[start : start + self.bulk_size],
+                                idempotent,
+                            )
+            except Exception as e:
+                logger.error(f"DB writer failed: {e}")
+            finally:
+                with self._cond:
+                    self._pending_docs -= sum(item[3] for item in items)
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _write(self, collection: str, requests: list, idempotent: bool = True):
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                self.db[collection].bulk_write(requests, ordered=False)
+                self._record(collection, len(requests), time.perf_counter() - started)
+                self._notify(collection)
+                return
+            except BulkWriteError as e:
+                # Duplicate keys were written by an earlier attempt that
+                # reported a failure; retry only the other failed requests
+                failed = [
+                    err["index"]
+                    for err in e.details.get("writeErrors", [])
+                    if err.get("code") != DUPLICATE_KEY
+                ]
+                latency = time.perf_counter() - started
+                self._record(collection, len(requests) - len(failed), latency)
+                self._notify(collection)
+                if not failed:
+                    return
+                requests = [requests[i] for i in failed]
+                error = e
+            except PyMongoError as e:
+                error = e
+                if not idempotent:
+                    # Some requests may have been applied
+                    break
+
+            if attempt < self.retries:
+                delay = self.backoff * 2**attempt
+                logger.warning(
+                    f"Bulk write of {len(requests)} requests to {collection} failed "
+                    f"({error}), retrying in {delay:.1f}s"
+                )
+                self.retried += 1
+                time.sleep(delay)
+
+        self.failed += len(requests)
+        logger.error(
+            f"Giving up on {len(requests)} requests for {collection} after "
+            f"{attempt + 1} attempts: {error}"
+        )
+
+    def _notify(self, collection: str):
+        for callback in self.listeners:
+            try:
+                callback(collection)
+            except Exception as e:
+                logger.error(f"DB write listener failed: {e}")
+
+    def _record(self, collection: str, count: int, latency: float):
+        if self.write_seconds is not None:
+            self.write_seconds.observe(latency, collection=collection)
+        self.written += count
+        self.bulk_writes += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until everything queued so far has been written (or given up)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not wait_for_hub_calls(timeout):
+            return False
+        with self._cond:
+            self._flushing = True
+            try:
+                while self._items or self._busy:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.notify_all()
+                    self._cond.wait(remaining)
+            finally:
+                self._flushing = False
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            queued_writes = len(self._items)
+            pending_docs = self._pending_docs
+        return {
+            "queued_writes": queued_writes,
+            "pending_documents": pending_docs,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retried": self.retried,
+            "bulk_writes": self.bulk_writes,
+            "last_latency": self.last_latency,
+            "max_latency": self.max_latency,
+            "avg_latency": (
+                self.total_latency / self.bulk_writes if self.bulk_writes else None
+            ),
+        }
+
+    def start(self):
+        # In gevent mode the writer is a greenlet, sharing the MongoDB client
+        # with the request handlers; writes queued by native threads reach its
+        # queue through call_in_hub
+        threading.Thread(target=self.run, daemon=True, name="db-writer").start()
+        return self
@@ -0,0 +1,278 @@
+"""Anomaly detectors (autoencoder, KMeans, OC-SVM) and their model files.
+
+Kept free of capture, MongoDB and Socket.IO state so it can also be imported
+by the inference worker processes (see inference_pool.py). Models are loaded
+lazily through `registry` (see model_registry.py); TensorFlow is only imported
+when the Keras autoencoder is loaded.
+"""
+
+import logging
+import os
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
+
+from autoencoder_numpy import (
+    NumpyAutoencoder,
+    export_weights,
+    file_sha256,
+    parity_check,
+    parity_samples,
+)
+
+from model_registry import ModelRegistry
+
+# "keras": tf.keras model.predict, "numpy": exported weights (see autoencoder_numpy.py)
+AU_BACKEND = os.getenv("AU_BACKEND", "keras").lower()
+
+# "ensemble" scores with every detector and combines their votes:
+# majority, any, or weighted (weighted vote share >= ENSEMBLE_THRESHOLD)
+ENSEMBLE = "ensemble"
+ENSEMBLE_MEMBERS = ("autoencoder", "kmeans", "svm")
+ENSEMBLE_RULE = os.getenv("ENSEMBLE_RULE", "majority").lower()
+_weights = os.getenv("ENSEMBLE_WEIGHTS", "autoencoder=1,kmeans=1,svm=1")
+ENSEMBLE_WEIGHTS = {
+    name.strip(): float(weight)
+    for name, weight in (item.split("=") for item in _weights.split(","))
+}
+ENSEMBLE_THRESHOLD = float(os.getenv("ENSEMBLE_THRESHOLD", "0.5"))
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = Path(__file__).parent / "Model"
+
+# Aggregated feature columns expected by each model
+MODEL_COLUMNS = {
+    "autoencoder": [
+        "Flow Duration_mean",
+        "Fwd IAT Tot_std",
+        "Fwd IAT Max_std",
+        "Fwd IAT Std_mean",
+        "Fwd IAT Std_std",
+        "Bwd IAT Max_mean",
+    ],
+    "kmeans": [
+        "Flow Duration_mean",
+        "Fwd IAT Tot_std",
+        "Fwd IAT Max_std",
+        "Fwd IAT Std_mean",
+        "Fwd IAT Std_std",
+        "Bwd IAT Max_mean",
+    ],
+    "svm": [
+        "Flow Duration_mean",
+        "Fwd IAT Tot_mean",
+        "Fwd IAT Tot_std",
+        "Bwd IAT Max_mean",
+        "Bwd IAT Std_mean",
+    ],
+}
+
+tf = None
+
+
+def import_tensorflow():
+    global tf
+    if tf is None:
+        import tensorflow
+
+        tf = tensorflow
+    return tf
+
+
+def load_numpy_autoencoder(model_dir: Path, threshold: float):
+    """Load the NumPy autoencoder, exporting it from the .h5 model first if the
+    exported weights are missing or were exported from another .h5 file. A
+    freshly exported model must take the same decisions as Keras, otherwise
+    the Keras model is used instead."""
+    h5_path = model_dir / "autoencoder.h5"
+    weights_path = model_dir / "autoencoder_weights.npz"
+    if weights_path.exists():
+        numpy_model = NumpyAutoencoder.load(weights_path)
+        if numpy_model.source_sha256 == file_sha256(h5_path):
+            return numpy_model
+
+    keras_model = import_tensorflow().keras.models.load_model(h5_path, compile=False)
+    export_weights(keras_model, weights_path, h5_path)
+    numpy_model = NumpyAutoencoder.load(weights_path)
+    samples = parity_samples(numpy_model, threshold)
+    if parity_check(keras_model, numpy_model, samples, threshold):
+        return numpy_model
+
+    weights_path.unlink()
+    logger.error("NumPy autoencoder failed the parity check, using Keras")
+    return keras_model
+
+
+def load_autoencoder(model_dir: Path = MODEL_DIR) -> dict:
+    threshold = np.load(model_dir / "autoencoder_train_info.npz")["threshold"].item()
+    if AU_BACKEND == "numpy":
+        model = load_numpy_autoencoder(model_dir, threshold)
+    else:
+        model = import_tensorflow().keras.models.load_model(
+            model_dir / "autoencoder.h5", compile=False
+        )
+    return {
+        "model": model,
+        "scaler": joblib.load(model_dir / "scaler_autoencoder.pkl"),
+        "threshold": threshold,
+    }
+
+
+def load_kmeans(model_dir: Path = MODEL_DIR) -> dict:
+    model = joblib.load(model_dir / "kmeans_model.pkl")
+    mapping = joblib.load(model_dir / "kmeans_label_mapping.pkl")
+    return {
+        "model": model,
+        "scaler": joblib.load(model_dir / "scaler_kmeans.pkl"),
+        # cluster id -> label as an array, so a whole flow matrix maps in one step
+        "lookup": np.array([mapping[c] for c in range(model.n_clusters)]),
+    }
+
+
+def load_svm(model_dir: Path = MODEL_DIR) -> dict:
+    # The OC-SVM was trained on unscaled features, so scaler_svm.pkl is not used
+    return {"model": joblib.load(model_dir / "ocsvm_model.joblib")}
+
+
+def warm_up(name: str, bundle: dict) -> bool:
+    """Run a dummy batch through the model so lazy initialisation happens now;
+    False if the model does not return one 0/1 verdict per row."""
+    columns = MODEL_COLUMNS[name]
+    dummy = pd.DataFrame(np.zeros((2, len(columns)), dtype=np.float32), columns=columns)
+    preds = np.asarray(DETECTORS[name](dummy, bundle))
+    return len(preds) == len(dummy) and bool(np.isin(preds, (0, 1)).all())
+
+
+def detect_anomalies_AU(features: pd.DataFrame, bundle: dict = None) -> np.ndarray:
+    try:
+        if features is None or features.empty:
+            return np.array([])
+
+        bundle = bundle or registry.get("autoencoder")
+        features = features[MODEL_COLUMNS["autoencoder"]].astype("float32")
+        features_scaled = bundle["scaler"].transform(features)
+
+        def predict(model, data, threshold):
+            if isinstance(model, NumpyAutoencoder):
+                loss = model.reconstruction_error(data)
+            else:
+                reconstructions = model.predict(data)
+                loss = import_tensorflow().keras.losses.mae(reconstructions, data).numpy()
+            return (loss < threshold).astype(int)
+
+        preds = predict(bundle["model"], features_scaled, bundle["threshold"])
+        logger.debug("Anomaly predictions: %s", preds.tolist())
+        return preds
+
+    except Exception as e:
+        logger.error("Anomaly detection failed: %s", e)
+        return np.array([])
+
+
+def detect_anomalies_KMEANS(features: pd.DataFrame, bundle: dict = None) -> np.ndarray:
+    """Detect anomalies using KMeans model with proper cluster-to-label mapping."""
+    try:
+        if features is None or features.empty:
+            return np.array([])
+
+        bundle = bundle or registry.get("kmeans")
+        features = features[MODEL_COLUMNS["kmeans"]]
+        features = features.replace([np.inf, -np.inf], np.nan).fillna(0)
+
+        features_scaled = bundle["scaler"].transform(features)
+
+        raw_predictions = bundle["model"].predict(features_scaled)
+        predictions = bundle["lookup"][raw_predictions]
+
+        logger.debug(f"KMeans raw clusters: {raw_predictions}")
+        logger.debug(f"KMeans mapped predictions: {predictions}")
+        return predictions
+
+    except Exception as e:
+        logger.error(f"KMeans detection failed: {str(e)}")
+        return np.array([])
+
+
+def detect_anomalies_SVM(features: pd.DataFrame, bundle: dict = None) -> np.ndarray:
+    try:
+        if features is None or features.empty:
+            return np.array([])
+
+        bundle = bundle or registry.get("svm")
+        features = features[MODEL_COLUMNS["svm"]]
+        features = features.astype(np.float32)
+
+        raw_preds = bundle["model"].predict(features)
+
+        # Map -1 → 1 (attack), 1 → 0 (benign)
+        predictions = (raw_preds == -1).astype(int)
+
+        logger.debug(f"OneClassSVM raw: {raw_preds}")
+        logger.debug(f"Mapped predictions: {predictions}")
+
+        return predictions
+
+    except Exception as e:
+        logger.error("Anomaly detection failed: %s", e)
+        return np.array([])
+
+
+DETECTORS = {
+    "autoencoder": detect_anomalies_AU,
+    "kmeans": detect_anomalies_KMEANS,
+    "svm": detect_anomalies_SVM,
+}
+
+registry = ModelRegistry(
+    {"autoencoder": load_autoencoder, "kmeans": load_kmeans, "svm": load_svm},
+    root=MODEL_DIR,
+    warmup=warm_up,
+)
+
+
+def model_members(model: str) -> tuple:
+    """Detectors scoring a batch for the selected `model`"""
+    return ENSEMBLE_MEMBERS if model == ENSEMBLE else (model,)
+
+
+def combine_votes(
+    votes: dict,
+    rule: str = ENSEMBLE_RULE,
+    weights: dict = ENSEMBLE_WEIGHTS,
+    threshold: float = ENSEMBLE_THRESHOLD,
+) -> np.ndarray:
+    """Combine per-detector 0/1 predictions of equal length into one verdict
+    per row. Detectors that failed (empty or mismatched output) do not vote."""
+    lengths = [len(v) for v in votes.values() if len(v)]
+    if not lengths:
+        return np.array([])
+    rows = max(set(lengths), key=lengths.count)
+    votes = {name: np.asarray(v) for name, v in votes.items() if len(v) == rows}
+    stacked = np.vstack(list(votes.values()))
+
+    if rule == "any":
+        return stacked.any(axis=0).astype(int)
+    if rule == "majority":
+        return (stacked.sum(axis=0) * 2 > len(votes)).astype(int)
+    if rule == "weighted":
+        w = np.array([weights.get(name, 1.0) for name in votes])
+        return ((w @ stacked) / w.sum() >= threshold).astype(int)
+    raise ValueError(f"Unknown ensemble rule: {rule}")
+
+
+def run_detection(model: str, features: pd.DataFrame, bundle: dict = None) -> np.ndarray:
+    """Run the selected model on aggregated features, with `bundle` if given
+    (a specific model version) or else the active version"""
+    logger.info(f"Using model: {model} for predictions")
+
+    if features is None:
+        return np.array([])
+    if model not in DETECTORS:
+        logger.error(f"Invalid model selected: {model}")
+        return np.array([])
+    return DETECTORS[model](features, bundle)
@@ -0,0 +1,383 @@
+"""In-process flow extractor producing CICFlowMeter-compatible flow tables.
+
+Builds bidirectional flows (5-tuple + flow timeout) directly from a list of
+captured packets, without writing a pcap or starting the CICFlowMeter JVM.
+Column names and semantics follow CICFlowMeter-4.0:
+
+- timestamps, durations and IATs are in microseconds
+- the first packet of a flow defines the forward direction
+- a flow is closed when a FIN packet is added to it, or a new flow is started
+  when a packet arrives more than FLOW_TIMEOUT_US after the flow start
+- lengths are transport payload bytes
+- standard deviations are sample standard deviations (n - 1), 0 when undefined
+"""
+
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scapy.all import IP, TCP, UDP
+
+from packet_records import PacketRecords, ip_strings
+
+logger = logging.getLogger(__name__)
+
+FLOW_TIMEOUT_US = 120_000_000
+TIMESTAMP_FORMAT = "%d/%m/%Y %I:%M:%S %p"
+
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+FIN, SYN, RST, PSH, ACK, URG, ECE, CWR = 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40, 0x80
+
+FLOW_COLUMNS = [
+    "Flow ID",
+    "Src IP",
+    "Src Port",
+    "Dst IP",
+    "Dst Port",
+    "Protocol",
+    "Timestamp",
+    "Flow Duration",
+    "Tot Fwd Pkts",
+    "Tot Bwd Pkts",
+    "TotLen Fwd Pkts",
+    "TotLen Bwd Pkts",
+    "Fwd Pkt Len Max",
+    "Fwd Pkt Len Min",
+    "Fwd Pkt Len Mean",
+    "Fwd Pkt Len Std",
+    "Bwd Pkt Len Max",
+    "Bwd Pkt Len Min",
+    "Bwd Pkt Len Mean",
+    "Bwd Pkt Len Std",
+    "Flow Byts/s",
+    "Flow Pkts/s",
+    "Flow IAT Mean",
+    "Flow IAT Std",
+    "Flow IAT Max",
+    "Flow IAT Min",
+    "Fwd IAT Tot",
+    "Fwd IAT Mean",
+    "Fwd IAT Std",
+    "Fwd IAT Max",
+    "Fwd IAT Min",
+    "Bwd IAT Tot",
+    "Bwd IAT Mean",
+    "Bwd IAT Std",
+    "Bwd IAT Max",
+    "Bwd IAT Min",
+    "Fwd PSH Flags",
+    "Bwd PSH Flags",
+    "Fwd URG Flags",
+    "Bwd URG Flags",
+    "Fwd Header Len",
+    "Bwd Header Len",
+    "Fwd Pkts/s",
+    "Bwd Pkts/s",
+    "Pkt Len Min",
+    "Pkt Len Max",
+    "Pkt Len Mean",
+    "Pkt Len Std",
+    "Pkt Len Var",
+    "FIN Flag Cnt",
+    "SYN Flag Cnt",
+    "RST Flag Cnt",
+    "PSH Flag Cnt",
+    "ACK Flag Cnt",
+    "URG Flag Cnt",
+    "ECE Flag Cnt",
+    "Down/Up Ratio",
+    "Pkt Size Avg",
+]
+
+
+def parse_timestamps(values) -> pd.Series:
+    """Flow Timestamp strings as datetimes (NaT where they do not parse)"""
+    return pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors="coerce")
+
+
+def header_fields(pkt):
+    """Decode (ts_us, src, dst, sport, dport, proto, payload, header, flags) from a
+    Scapy packet, or None when it is not an IPv4 TCP/UDP packet (like CICFlowMeter).
+    """
+    if not pkt.haslayer(IP):
+        return None
+    ip = pkt[IP]
+    if ip.haslayer(TCP):
+        l4 = ip[TCP]
+        l4_header = l4.dataofs * 4
+        l4_flags = int(l4.flags)
+    elif ip.haslayer(UDP):
+        l4 = ip[UDP]
+        l4_header = 8
+        l4_flags = 0
+    else:
+        return None
+
+    return (
+        int(round(float(pkt.time) * 1_000_000)),
+        ip.src,
+        ip.dst,
+        l4.sport,
+        l4.dport,
+        ip.proto,
+        max(ip.len - ip.ihl * 4 - l4_header, 0),
+        l4_header,
+        l4_flags,
+    )
+
+
+def packet_headers(packets) -> dict:
+    """Decode the header fields used for flow assembly from Scapy packets."""
+    rows = [f for f in map(header_fields, packets) if f is not None]
+    ts, src, dst, sport, dport, proto, payload, header, flags = (
+        zip(*rows) if rows else ([],) * 9
+    )
+
+    return {
+        "ts": np.asarray(ts, dtype=np.int64),
+        "src": np.asarray(src, dtype=object),
+        "dst": np.asarray(dst, dtype=object),
+        "sport": np.asarray(sport, dtype=np.int64),
+        "dport": np.asarray(dport, dtype=np.int64),
+        "proto": np.asarray(proto, dtype=np.int64),
+        "payload": np.asarray(payload, dtype=np.float64),
+        "header": np.asarray(header, dtype=np.int64),
+        "flags": np.asarray(flags, dtype=np.int64),
+    }
+
+
+def record_headers(records: PacketRecords) -> dict:
+    """Header fields used for flow assembly from compact packet records; the
+    addresses stay integers until the flow table is built."""
+    h = records.headers
+    h = h[h["l4"]]
+    return {
+        "ts": h["ts"].astype(np.int64),
+        "src": h["src"].astype(np.int64),
+        "dst": h["dst"].astype(np.int64),
+        "sport": h["sport"].astype(np.int64),
+        "dport": h["dport"].astype(np.int64),
+        "proto": h["proto"].astype(np.int64),
+        "payload": h["payload"].astype(np.float64),
+        "header": h["header"].astype(np.int64),
+        "flags": h["flags"].astype(np.int64),
+    }
+
+
+def _assign_flows(h: dict):
+    """Assign every packet to a flow, honouring flow timeout and FIN termination.
+
+    Returns (flow index per packet, index of the first packet of each flow).
+    """
+    n = len(h["ts"])
+    flow_of = np.empty(n, dtype=np.int64)
+    first_packet = []
+    flow_start = []
+    active = {}
+
+    ts = h["ts"].tolist()
+    src, dst = h["src"].tolist(), h["dst"].tolist()
+    sport, dport = h["sport"].tolist(), h["dport"].tolist()
+    proto = h["proto"].tolist()
+    fin = (h["flags"] & FIN).astype(bool).tolist()
+
+    for i in range(n):
+        a, b = (src[i], sport[i]), (dst[i], dport[i])
+        key = (a, b, proto[i]) if a <= b else (b, a, proto[i])
+
+        f = active.get(key)
+        if f is not None and ts[i] - flow_start[f] > FLOW_TIMEOUT_US:
+            # Timed out: the new flow keeps the direction of the old one
+            first = first_packet[f]
+            f = len(first_packet)
+            first_packet.append(first)
+            flow_start.append(ts[i])
+            active[key] = f
+        elif f is None:
+            f = len(first_packet)
+            first_packet.append(i)
+            flow_start.append(ts[i])
+            active[key] = f
+        elif fin[i]:
+            del active[key]
+        flow_of[i] = f
+
+    return flow_of, np.asarray(first_packet, dtype=np.int64)
+
+
+def _group_stats(values: np.ndarray, groups: np.ndarray, n_groups: int) -> dict:
+    """Per-group count/sum/mean/std/max/min; every statistic is 0 for empty groups."""
+    count = np.bincount(groups, minlength=n_groups)
+    total = np.bincount(groups, weights=values, minlength=n_groups)
+    mean = np.divide(total, count, out=np.zeros(n_groups), where=count > 0)
+    sq = np.bincount(groups, weights=(values - mean[groups]) ** 2, minlength=n_groups)
+    var = np.divide(sq, count - 1, out=np.zeros(n_groups), where=count > 1)
+
+    vmax = np.full(n_groups, -np.inf)
+    vmin = np.full(n_groups, np.inf)
+    np.maximum.at(vmax, groups, values)
+    np.minimum.at(vmin, groups, values)
+    vmax[count == 0] = 0
+    vmin[count == 0] = 0
+
+    return {
+        "count": count,
+        "sum": total,
+        "mean": mean,
+        "std": np.sqrt(var),
+        "var": var,
+        "max": vmax,
+        "min": vmin,
+    }
+
+
+def _iat_stats(ts, keys, n_groups: int) -> dict:
+    """IAT statistics between consecutive packets sharing the same keys.
+
+    `keys` is a tuple of per-packet arrays; the last one is the flow index.
+    """
+    order = np.lexsort((np.arange(len(ts)),) + keys)
+    same = np.ones(max(len(order) - 1, 0), dtype=bool)
+    for k in keys:
+        k = k[order]
+        same &= k[1:] == k[:-1]
+    ts = ts[order]
+    iat = (ts[1:] - ts[:-1])[same].astype(np.float64)
+    groups = keys[-1][order][1:][same]
+    return _group_stats(iat, groups, n_groups)
+
+
+def assemble_flows(h: dict) -> pd.DataFrame:
+    """Build the CICFlowMeter flow table from decoded packet headers."""
+    if len(h["ts"]) == 0:
+        return pd.DataFrame(columns=FLOW_COLUMNS)
+
+    flow_of, first = _assign_flows(h)
+    n_flows = len(first)
+
+    ts = h["ts"]
+    is_fwd = h["src"] == h["src"][first][flow_of]
+    fwd_groups = flow_of[is_fwd]
+    bwd_groups = flow_of[~is_fwd]
+    payload = h["payload"]
+    flags = h["flags"]
+
+    start = np.full(n_flows, np.iinfo(np.int64).max)
+    last = np.full(n_flows, np.iinfo(np.int64).min)
+    np.minimum.at(start, flow_of, ts)
+    np.maximum.at(last, flow_of, ts)
+    duration = (last - start).astype(np.float64)
+
+    pkt_len = _group_stats(payload, flow_of, n_flows)
+    fwd_len = _group_stats(payload[is_fwd], fwd_groups, n_flows)
+    bwd_len = _group_stats(payload[~is_fwd], bwd_groups, n_flows)
+    flow_iat = _iat_stats(ts, (flow_of,), n_flows)
+    fwd_iat = _iat_stats(ts[is_fwd], (fwd_groups,), n_flows)
+    bwd_iat = _iat_stats(ts[~is_fwd], (bwd_groups,), n_flows)
+
+    def flag_count(mask, groups=flow_of, selector=None):
+        hits = (flags if selector is None else flags[selector]) & mask
+        return np.bincount(groups, weights=(hits > 0), minlength=n_flows).astype(np.int64)
+
+    fwd_pkts = fwd_len["count"]
+    bwd_pkts = bwd_len["count"]
+    seconds = duration / 1_000_000
+    with np.errstate(divide="ignore", invalid="ignore"):
+        flow_bytes_s = (fwd_len["sum"] + bwd_len["sum"]) / seconds
+        flow_pkts_s = (fwd_pkts + bwd_pkts) / seconds
+        fwd_pkts_s = fwd_pkts / seconds
+        bwd_pkts_s = bwd_pkts / seconds
+    down_up = np.floor_divide(bwd_pkts, fwd_pkts, out=np.zeros(n_flows, dtype=np.int64), where=fwd_pkts > 0)
+
+    src = h["src"][first]
+    dst = h["dst"][first]
+    if src.dtype != object:
+        src, dst = ip_strings(src), ip_strings(dst)
+    sport = h["sport"][first]
+    dport = h["dport"][first]
+    proto = h["proto"][first]
+    flow_id = [f"{s}-{d}-{sp}-{dp}-{p}" for s, d, sp, dp, p in zip(src, dst, sport, dport, proto)]
+    timestamp = [
+        datetime.fromtimestamp(t / 1_000_000).strftime(TIMESTAMP_FORMAT) for t in start
+    ]
+
+    df = pd.DataFrame(
+        {
+            "Flow ID": flow_id,
+            "Src IP": src,
+            "Src Port": sport,
+            "Dst IP": dst,
+            "Dst Port": dport,
+            "Protocol": proto,
+            "Timestamp": timestamp,
+            "Flow Duration": duration.astype(np.int64),
+            "Tot Fwd Pkts": fwd_pkts,
+            "Tot Bwd Pkts": bwd_pkts,
+            "TotLen Fwd Pkts": fwd_len["sum"],
+            "TotLen Bwd Pkts": bwd_len["sum"],
+            "Fwd Pkt Len Max": fwd_len["max"],
+            "Fwd Pkt Len Min": fwd_len["min"],
+            "Fwd Pkt Len Mean": fwd_len["mean"],
+            "Fwd Pkt Len Std": fwd_len["std"],
+            "Bwd Pkt Len Max": bwd_len["max"],
+            "Bwd Pkt Len Min": bwd_len["min"],
+            "Bwd Pkt Len Mean": bwd_len["mean"],
+            "Bwd Pkt Len Std": bwd_len["std"],
+            "Flow Byts/s": flow_bytes_s,
+            "Flow Pkts/s": flow_pkts_s,
+            "Flow IAT Mean": flow_iat["mean"],
+            "Flow IAT Std": flow_iat["std"],
+            "Flow IAT Max": flow_iat["max"],
+            "Flow IAT Min": flow_iat["min"],
+            "Fwd IAT Tot": fwd_iat["sum"],
+            "Fwd IAT Mean": fwd_iat["mean"],
+            "Fwd IAT Std": fwd_iat["std"],
+            "Fwd IAT Max": fwd_iat["max"],
+            "Fwd IAT Min": fwd_iat["min"],
+            "Bwd IAT Tot": bwd_iat["sum"],
+            "Bwd IAT Mean": bwd_iat["mean"],
+            "Bwd IAT Std": bwd_iat["std"],
+            "Bwd IAT Max": bwd_iat["max"],
+            "Bwd IAT Min": bwd_iat["min"],
+            "Fwd PSH Flags": flag_count(PSH, fwd_groups, is_fwd),
+            "Bwd PSH Flags": flag_count(PSH, bwd_groups, ~is_fwd),
+            "Fwd URG Flags": flag_count(URG, fwd_groups, is_fwd),
+            "Bwd URG Flags": flag_count(URG, bwd_groups, ~is_fwd),
+            "Fwd Header Len": np.bincount(
+                fwd_groups, weights=h["header"][is_fwd], minlength=n_flows
+            ).astype(np.int64),
+            "Bwd Header Len": np.bincount(
+                bwd_groups, weights=h["header"][~is_fwd], minlength=n_flows
+            ).astype(np.int64),
+            "Fwd Pkts/s": fwd_pkts_s,
+            "Bwd Pkts/s": bwd_pkts_s,
+            "Pkt Len Min": pkt_len["min"],
+            "Pkt Len Max": pkt_len["max"],
+            "Pkt Len Mean": pkt_len["mean"],
+            "Pkt Len Std": pkt_len["std"],
+            "Pkt Len Var": pkt_len["var"],
+            "FIN Flag Cnt": flag_count(FIN),
+            "SYN Flag Cnt": flag_count(SYN),
+            "RST Flag Cnt": flag_count(RST),
+            "PSH Flag Cnt": flag_count(PSH),
+            "ACK Flag Cnt": flag_count(ACK),
+            "URG Flag Cnt": flag_count(URG),
+            "ECE Flag Cnt": flag_count(ECE),
+            "Down/Up Ratio": down_up,
+            "Pkt Size Avg": pkt_len["mean"],
+        },
+        columns=FLOW_COLUMNS,
+    )
+    logger.debug("Assembled %d flows from %d packets", n_flows, len(ts))
+    return df
+
+
+def extract_flows(packets) -> pd.DataFrame:
+    """Build the CICFlowMeter flow table directly from PacketRecords or a list
+    of Scapy packets."""
+    if isinstance(packets, PacketRecords):
+        return assemble_flows(record_headers(packets))
+    return assemble_flows(packet_headers(packets))
@@ -0,0 +1,156 @@
+"""Indexes and query planning for the `flows` collection.
+
+Flow documents carry `ts`, a real datetime parsed from their Timestamp
+string, and lists are sorted by (ts, _id) descending. Every filter of
+/api/flows has a compound index of the form (filter fields..., ts, _id), so a
+filtered, sorted page is one index range scan.
+
+Pages are addressed either by skip (cheap only for the first pages) or by an
+opaque keyset cursor holding the (ts, _id) of the last flow of the previous
+page, which costs the same for every page.
+"""
+
+import base64
+import json
+import logging
+from datetime import datetime
+
+import pandas as pd
+from bson import ObjectId
+from pymongo import DESCENDING, UpdateOne
+
+from flow_extractor import parse_timestamps
+
+logger = logging.getLogger(__name__)
+
+SORT = [("ts", DESCENDING), ("_id", DESCENDING)]
+
+FLOW_INDEXES = {
+    "ts": SORT,
+    "batch_index_ts": [("batch_index", 1), *SORT],
+    "src_ip_ts": [("Src IP", 1), *SORT],
+    "dst_ip_ts": [("Dst IP", 1), *SORT],
+    "protocol_label_ts": [("Protocol", 1), ("Label", 1), *SORT],
+    "label_ts": [("Label", 1), *SORT],
+}
+
+# Counting stops here in "estimated" mode; larger totals are reported as lower bounds
+COUNT_LIMIT = 10_000
+
+# Largest page /api/flows returns
+MAX_PAGE_SIZE = 1000
+
+
+def ensure_indexes(collection):
+    """Create the flow indexes that do not exist yet."""
+    existing = set(collection.index_information())
+    for name, keys in FLOW_INDEXES.items():
+        if name not in existing:
+            collection.create_index(keys, name=name, background=True)
+            logger.info(f"Created flow index {name}")
+
+
+def with_timestamps(df: pd.DataFrame) -> pd.DataFrame:
+    """Flow table with the `ts` column stored on flow documents"""
+    return df.assign(ts=parse_timestamps(df["Timestamp"]))
+
+
+def encode_cursor(flow: dict) -> str:
+    ts = flow.get("ts")
+    data = {"ts": ts.isoformat() if ts else None, "id": str(flow["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """(ts, _id) of a cursor; raises ValueError for malformed cursors."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        ts = datetime.fromisoformat(data["ts"]) if data["ts"] else None
+        return ts, ObjectId(data["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def after_cursor(query: dict, cursor: str) -> dict:
+    """`query` restricted to the flows sorted after the cursor position.
+    Flows without ts (stored before it existed) sort after all others."""
+    ts, _id = decode_cursor(cursor)
+    if ts is None:
+        position = {"ts": None, "_id": {"$lt": _id}}
+    else:
+        position = {
+            "$or": [
+                {"ts": {"$lt": ts}},
+                {"ts": ts, "_id": {"$lt": _id}},
+                {"ts": None},
+            ]
+        }
+    return {"$and": [query, position]} if query else position
+
+
+def count_flows(collection, query: dict, mode: str = "exact"):
+    """(total, exact) for `query`. "estimated" uses the collection metadata
+    without filters and stops counting at COUNT_LIMIT with filters; "none"
+    skips counting."""
+    if mode == "none":
+        return None, False
+    if mode == "estimated":
+        if not query:
+            return collection.estimated_document_count(), False
+        total = collection.count_documents(query, limit=COUNT_LIMIT)
+        return total, total < COUNT_LIMIT
+    if mode == "exact":
+        return collection.count_documents(query), True
+    raise ValueError(f"Unknown count mode: {mode}")
+
+
+def find_page(collection, query: dict, limit: int, skip: int = 0, cursor: str = None):
+    """One page of flows and the cursor of the next page (None on the last)."""
+    if cursor:
+        query = after_cursor(query, cursor)
+        skip = 0
+    flows = list(collection.find(query).sort(SORT).skip(skip).limit(limit + 1))
+    next_cursor = encode_cursor(flows[limit - 1]) if len(flows) > limit else None
+    return flows[:limit], next_cursor
+
+
+def backfill_timestamps(collection, chunk_size: int = 5000) -> int:
+    """Set `ts` on flow documents stored before it existed."""
+    updated = 0
+    docs = []
+    cursor = collection.find({"ts": {"$exists": False}}, {"Timestamp": 1})
+    for doc in cursor:
+        docs.append(doc)
+        if len(docs) >= chunk_size:
+            updated += _backfill_chunk(collection, docs)
+            docs = []
+    if docs:
+        updated += _backfill_chunk(collection, docs)
+    logger.info(f"Backfilled ts on {updated} flows")
+    return updated
+
+
+def _backfill_chunk(collection, docs: list) -> int:
+    times = parse_timestamps(pd.Series([doc.get("Timestamp") for doc in docs]))
+    updates = [
+        UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"ts": None if pd.isna(ts) else ts.to_pydatetime()}},
+        )
+        for doc, ts in zip(docs, times)
+    ]
+    return collection.bulk_write(updates, ordered=False).modified_count
+
+
+if __name__ == "__main__":
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    client = MongoClient(os.environ.get("MONGO_URI"))
+    flows = client["network_monitor"]["flows"]
+    backfill_timestamps(flows)
+    ensure_indexes(flows)
@@ -0,0 +1,224 @@
+"""Pre-aggregated flow counters for /api/flows/summary.
+
+Every flow table inserted into `flows` is also aggregated, per minute and per
+hour of its flows' Timestamp, into one `flow_rollups` document per bucket:
+
+    {"_id": "minute:2024-06-01T10:15", "granularity": "minute",
+     "bucket": datetime, "flows": n, "packets": n, "bytes": n,
+     "src_ips": {ip: n}, "dst_ips": {ip: n}, "dst_ports": {port: n},
+     "protocols": {proto: n}}
+
+The counters are applied with upserting $inc updates, so a summary only reads
+the buckets of the requested time range. Mongo field names cannot contain
+".", so it is stored as "_" in the IP keys.
+"""
+
+import logging
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pandas as pd
+from pymongo import UpdateOne
+
+from flow_extractor import parse_timestamps
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "flow_rollups"
+
+GRANULARITIES = {"minute": "min", "hour": "H"}
+
+# Rollup field -> flow table column
+KEYED_COUNTERS = {
+    "src_ips": "Src IP",
+    "dst_ips": "Dst IP",
+    "dst_ports": "Dst Port",
+    "protocols": "Protocol",
+}
+PACKET_COLUMNS = ("Tot Fwd Pkts", "Tot Bwd Pkts")
+BYTE_COLUMNS = ("TotLen Fwd Pkts", "TotLen Bwd Pkts")
+
+
+def encode_key(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # ports and protocols of a column with missing values
+    return str(value).replace(".", "_")
+
+
+def decode_key(key: str) -> str:
+    return key.replace("_", ".")
+
+
+def bucket_id(granularity: str, bucket: datetime) -> str:
+    return f"{granularity}:{bucket.isoformat(timespec='minutes')}"
+
+
+def rollup_updates(df: pd.DataFrame) -> list:
+    """One upserting $inc update per minute and per hour bucket of `df`."""
+    times = parse_timestamps(df["Timestamp"])
+    valid = times.notna()
+    if not valid.any():
+        return []
+    df = df[valid]
+    times = times[valid]
+
+    packets = sum(df[c] for c in PACKET_COLUMNS if c in df.columns)
+    size = sum(df[c] for c in BYTE_COLUMNS if c in df.columns)
+    frame = pd.DataFrame({"packets": packets, "bytes": size}, index=df.index)
+
+    updates = []
+    for granularity, freq in GRANULARITIES.items():
+        buckets = times.dt.floor(freq)
+        totals = frame.groupby(buckets).sum()
+        incs = {
+            bucket: {
+                "flows": int(flows),
+                "packets": int(totals.at[bucket, "packets"]),
+                "bytes": int(totals.at[bucket, "bytes"]),
+            }
+            for bucket, flows in buckets.value_counts().items()
+        }
+        for field, column in KEYED_COUNTERS.items():
+            if column not in df.columns:
+                continue
+            for (bucket, key), n in df.groupby([buckets, df[column]]).size().items():
+                incs[bucket][f"{field}.{encode_key(key)}"] = int(n)
+
+        for bucket, inc in incs.items():
+            bucket = bucket.to_pydatetime()
+            updates.append(
+                UpdateOne(
+                    {"_id": bucket_id(granularity, bucket)},
+                    {
+                        "$inc": inc,
+                        "$setOnInsert": {"granularity": granularity, "bucket": bucket},
+                    },
+                    upsert=True,
+                )
+            )
+    return updates
+
+
+class FlowRollups:
+    def __init__(self, db, writer=None):
+        """Updates go through `writer` (a DbWriter) when given, else straight
+        to `db`."""
+        self.db = db
+        self.writer = writer
+        self.collection = db[ROLLUP_COLLECTION]
+
+    def ensure_indexes(self):
+        self.collection.create_index([("granularity", 1), ("bucket", 1)])
+
+    def record(self, df: pd.DataFrame):
+        """Add the flows of `df` to the rollups."""
+        try:
+            updates = rollup_updates(df)
+        except Exception as e:
+            logger.error(f"Failed to roll up {len(df)} flows: {e}")
+            return
+        if not updates:
+            return
+        if self.writer is not None:
+            self.writer.bulk(ROLLUP_COLLECTION, updates)
+        else:
+            self.collection.bulk_write(updates, ordered=False)
+
+    def summary(
+        self,
+        start: datetime = None,
+        end: datetime = None,
+        granularity: str = None,
+        top: int = 10,
+    ) -> dict:
+        """Top talkers, protocols and traffic over time for [start, end).
+
+        Without a granularity, ranges of up to six hours are answered from the
+        minute buckets and longer or open ranges from the hour buckets."""
+        if granularity is None:
+            short = start is not None and (end or datetime.now()) - start <= timedelta(
+                hours=6
+            )
+            granularity = "minute" if short else "hour"
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+
+        query = {"granularity": granularity}
+        if start is not None or end is not None:
+            query["bucket"] = {}
+            if start is not None:
+                query["bucket"]["$gte"] = start
+            if end is not None:
+                query["bucket"]["$lt"] = end
+
+        counters = {field: Counter() for field in KEYED_COUNTERS}
+        traffic = []
+        totals = Counter()
+        for doc in self.collection.find(query).sort("bucket", 1):
+            for field, counter in counters.items():
+                counter.update(doc.get(field, {}))
+            traffic.append(
+                {
+                    "time": doc["bucket"].isoformat(),
+                    "count": doc.get("flows", 0),
+                    "packets": doc.get("packets", 0),
+                    "bytes": doc.get("bytes", 0),
+                }
+            )
+            for field in ("flows", "packets", "bytes"):
+                totals[field] += doc.get(field, 0)
+
+        def top_n(counter, decode=False):
+            return [
+                {"name": decode_key(k) if decode else k, "value": v}
+                for k, v in counter.most_common(top)
+            ]
+
+        return {
+            "top_source_ips": top_n(counters["src_ips"], decode=True),
+            "top_destination_ips": top_n(counters["dst_ips"], decode=True),
+            "top_destination_ports": top_n(counters["dst_ports"]),
+            "top_protocols": top_n(counters["protocols"]),
+            "traffic_over_time": traffic,
+            "total_flows": totals["flows"],
+            "total_packets": totals["packets"],
+            "total_bytes": totals["bytes"],
+            "granularity": granularity,
+        }
+
+    def rebuild(self, chunk_size: int = 50_000):
+        """Recompute the rollups from every document in `flows`, e.g. for flows
+        stored before the rollups existed."""
+        self.collection.delete_many({})
+        columns = ["Timestamp", *KEYED_COUNTERS.values(), *PACKET_COLUMNS, *BYTE_COLUMNS]
+        cursor = self.db["flows"].find({}, {"_id": 0, **{c: 1 for c in columns}})
+        rows = []
+        total = 0
+        for row in cursor:
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                self._rebuild_chunk(rows)
+                total += len(rows)
+                rows = []
+        if rows:
+            self._rebuild_chunk(rows)
+            total += len(rows)
+        logger.info(f"Rebuilt flow rollups from {total} flows")
+        return total
+
+    def _rebuild_chunk(self, rows: list):
+        updates = rollup_updates(pd.DataFrame(rows))
+        if updates:
+            self.collection.bulk_write(updates, ordered=False)
+
+
+if __name__ == "__main__":
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    logging.basicConfig(level=logging.INFO)
+    load_dotenv()
+    client = MongoClient(os.environ.get("MONGO_URI"))
+    FlowRollups(client["network_monitor"]).rebuild()
@@ -0,0 +1,248 @@
+"""Storage of the per-batch flow tables.
+
+- csv:     CICFlowMeter-style CSV (default, no extra dependency)
+- parquet: compressed columnar Parquet; readers load only the requested
+           columns and skip row groups that the filters rule out
+- arrow:   uncompressed Arrow IPC file, memory-mapped when read
+
+The columnar formats need pyarrow. CSV downloads are produced from whichever
+format a batch was stored in, on request.
+"""
+
+import io
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+
+# Rows per Parquet row group; the unit that predicate pushdown can skip
+ROW_GROUP_SIZE = 10_000
+
+# Rows parsed at a time when paging through a CSV flow table
+CSV_CHUNK_ROWS = 50_000
+
+pa = None
+
+
+def import_pyarrow():
+    global pa
+    if pa is None:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+
+        pa = pyarrow
+    return pa
+
+
+def store_format(name: str) -> str:
+    """Validated store format; columnar formats fall back to CSV without pyarrow."""
+    if name not in FORMATS:
+        raise ValueError(f"Unknown flow store format: {name}")
+    if name != "csv":
+        try:
+            import_pyarrow()
+        except ImportError:
+            logger.error(f"pyarrow is required for the {name} flow store, using csv")
+            return "csv"
+    return name
+
+
+def format_of(path) -> str:
+    suffix = Path(path).suffix
+    for name, ext in FORMATS.items():
+        if suffix == ext:
+            return name
+    raise ValueError(f"Unknown flow file type: {path}")
+
+
+def write_flows(df: pd.DataFrame, path: Path, fmt: str = "csv") -> Path:
+    """Write a flow table to `path` (its suffix replaced by the format's)."""
+    path = Path(path).with_suffix(FORMATS[fmt])
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return path
+
+    pa = import_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == "parquet":
+        pa.parquet.write_table(
+            table, path, compression="zstd", row_group_size=ROW_GROUP_SIZE
+        )
+    else:
+        with pa.OSFile(str(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    return path
+
+
+def flow_columns(path) -> list:
+    """Column names of a flow table, read from its header or schema only."""
+    fmt = format_of(path)
+    if fmt == "csv":
+        return pd.read_csv(path, nrows=0).columns.tolist()
+    pa = import_pyarrow()
+    if fmt == "parquet":
+        return pa.parquet.read_schema(str(path)).names
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+def filter_expression(filters):
+    """pyarrow.dataset expression for [(column, op, value), ...]"""
+    ds = import_pyarrow().dataset
+    expression = None
+    for column, op, value in filters:
+        if op == "in":
+            term = ds.field(column).isin(list(value))
+        else:
+            term = OPERATORS[op](ds.field(column), value)
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def filter_frame(df: pd.DataFrame, filters) -> pd.DataFrame:
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        if op == "in":
+            mask &= df[column].isin(list(value)).to_numpy()
+        else:
+            mask &= OPERATORS[op](df[column], value).to_numpy()
+    return df[mask]
+
+
+def csv_usecols(columns: list, filters):
+    """read_csv `usecols` for `columns` plus the columns `filters` need."""
+    if columns is None:
+        return None
+    wanted = set(columns) | {column for column, _, _ in filters or ()}
+    return lambda c: c in wanted
+
+
+def project_frame(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    if columns is None:
+        return df
+    return df[[c for c in columns if c in df.columns]]
+
+
+def dataset_frame(dataset, columns: list = None, filters=None) -> pd.DataFrame:
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    table = dataset.to_table(
+        columns=columns,
+        filter=filter_expression(filters) if filters else None,
+    )
+    return table.to_pandas()
+
+
+def dataset_page(dataset, columns: list, filters, skip: int, stop: int):
+    """Rows skip:stop of the filtered dataset, and the filtered row count."""
+    if columns is not None:
+        columns = [c for c in columns if c in dataset.schema.names]
+    expression = filter_expression(filters) if filters else None
+    total = dataset.count_rows(filter=expression)
+    stop = total if stop is None else min(stop, total)
+    scanner = dataset.scanner(columns=columns, filter=expression)
+    batches = []
+    seen = 0
+    if skip < stop:
+        for batch in scanner.to_batches():
+            end = seen + batch.num_rows
+            if end > skip:
+                start = max(skip, seen)
+                batches.append(batch.slice(start - seen, min(end, stop) - start))
+            seen = end
+            if seen >= stop:
+                break
+    schema = scanner.projected_schema
+    table = import_pyarrow().Table.from_batches(batches, schema=schema)
+    return table.to_pandas(), total
+
+
+def csv_page(path, columns: list, filters, skip: int, stop: int):
+    """Rows skip:stop of the filtered CSV file, parsed a chunk at a time so
+    that only the page is kept, and the filtered row count."""
+    usecols = csv_usecols(columns, filters)
+    total = 0
+    parts = []
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=CSV_CHUNK_ROWS):
+        if filters:
+            chunk = filter_frame(chunk, filters)
+        seen, total = total, total + len(chunk)
+        # The first chunk is kept even when empty, for its columns
+        if not parts or (total > skip and (stop is None or seen < stop)):
+            start = max(skip - seen, 0)
+            parts.append(chunk.iloc[start : None if stop is None else stop - seen])
+    if not parts:
+        # No rows at all; the header still gives the columns
+        parts.append(pd.read_csv(path, usecols=usecols, nrows=0))
+    df = pd.concat(parts) if len(parts) > 1 else parts[0]
+    return project_frame(df, columns).reset_index(drop=True), total
+
+
+def read_flows(path, columns: list = None, filters: list = None) -> pd.DataFrame:
+    """Read a flow table, optionally only `columns` and only the rows that
+    match all `filters` ([(column, op, value), ...], op one of ==, !=, <, <=,
+    >, >=, in). Filter columns need not be among `columns`."""
+    fmt = format_of(path)
+    if fmt == "csv":
+        df = pd.read_csv(path, usecols=csv_usecols(columns, filters))
+        if filters:
+            df = filter_frame(df, filters)
+        return project_frame(df, columns).reset_index(drop=True)
+
+    pa = import_pyarrow()
+    if fmt == "parquet":
+        dataset = pa.dataset.dataset(str(path), format="parquet")
+        return dataset_frame(dataset, columns, filters)
+    with pa.memory_map(str(path), "r") as source:
+        # The table points into the mapping; convert it before the file closes
+        dataset = pa.dataset.dataset(pa.ipc.open_file(source).read_all())
+        return dataset_frame(dataset, columns, filters)
+
+
+def read_flow_page(
+    path, columns: list = None, filters: list = None, skip: int = 0, limit: int = 0
+):
+    """`limit` rows (all when 0) from row `skip` on of what read_flows returns,
+    and the number of rows that match the filters. Rows before and after the
+    page are not kept, and the columnar formats do not convert them."""
+    stop = skip + limit if limit else None
+    fmt = format_of(path)
+    if fmt == "csv":
+        return csv_page(path, columns, filters, skip, stop)
+
+    pa = import_pyarrow()
+    if fmt == "parquet":
+        dataset = pa.dataset.dataset(str(path), format="parquet")
+        return dataset_page(dataset, columns, filters, skip, stop)
+    with pa.memory_map(str(path), "r") as source:
+        dataset = pa.dataset.dataset(pa.ipc.open_file(source).read_all())
+        return dataset_page(dataset, columns, filters, skip, stop)
+
+
+def flows_csv(path, label: str = None) -> io.BytesIO:
+    """The flow table as a CSV file object, with a batch-level `label` added
+    when the table has no per-flow Label column."""
+    df = read_flows(path)
+    if "Label" not in df.columns and label is not None:
+        df["Label"] = label
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return buffer
@@ -0,0 +1,289 @@
+"""Long-lived streaming flow table with per-packet running statistics.
+
+Packets are folded into their bidirectional flow as they arrive, keeping only
+running statistics (Welford mean/variance, min/max, counts), so finished flows
+can be scored continuously instead of waiting for a packet batch to fill.
+A flow is emitted when it sees a FIN or RST, when it has been idle for longer
+than the idle timeout, or when it has been active for longer than the active
+timeout. Emitted rows use the same columns as flow_extractor.FLOW_COLUMNS.
+"""
+
+import logging
+import math
+import time
+from datetime import datetime
+
+from async_runtime import native_threading
+from flow_extractor import (
+    ACK,
+    ECE,
+    FIN,
+    FLOW_COLUMNS,
+    FLOW_TIMEOUT_US,
+    PSH,
+    RST,
+    SYN,
+    TIMESTAMP_FORMAT,
+    URG,
+)
+
+logger = logging.getLogger(__name__)
+
+IDLE_TIMEOUT_US = 15_000_000
+
+
+class RunningStats:
+    """Welford running count/sum/mean/variance/min/max; statistics are 0 when undefined."""
+
+    __slots__ = ("n", "total", "mean", "m2", "max", "min")
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max = 0.0
+        self.min = 0.0
+
+    def add(self, x: float):
+        self.n += 1
+        self.total += x
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        if self.n == 1:
+            self.max = self.min = x
+        elif x > self.max:
+            self.max = x
+        elif x < self.min:
+            self.min = x
+
+    @property
+    def var(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+
+def _per_second(value: float, seconds: float) -> float:
+    if seconds > 0:
+        return value / seconds
+    return float("nan") if value == 0 else float("inf")
+
+
+class Flow:
+    """Running state of one bidirectional flow; the first packet defines forward."""
+
+    __slots__ = (
+        "src",
+        "dst",
+        "sport",
+        "dport",
+        "proto",
+        "start",
+        "last_seen",
+        "fwd_last_seen",
+        "bwd_last_seen",
+        "pkt_len",
+        "fwd_len",
+        "bwd_len",
+        "flow_iat",
+        "fwd_iat",
+        "bwd_iat",
+        "fwd_header",
+        "bwd_header",
+        "fwd_psh",
+        "bwd_psh",
+        "fwd_urg",
+        "bwd_urg",
+        "flag_counts",
+    )
+
+    def __init__(self, ts, src, dst, sport, dport, proto):
+        self.src, self.dst = src, dst
+        self.sport, self.dport = sport, dport
+        self.proto = proto
+        self.start = self.last_seen = ts
+        self.fwd_last_seen = self.bwd_last_seen = None
+        self.pkt_len = RunningStats()
+        self.fwd_len = RunningStats()
+        self.bwd_len = RunningStats()
+        self.flow_iat = RunningStats()
+        self.fwd_iat = RunningStats()
+        self.bwd_iat = RunningStats()
+        self.fwd_header = self.bwd_header = 0
+        self.fwd_psh = self.bwd_psh = self.fwd_urg = self.bwd_urg = 0
+        self.flag_counts = dict.fromkeys((FIN, SYN, RST, PSH, ACK, URG, ECE), 0)
+
+    def add(self, ts, src, payload, header, flags):
+        if self.pkt_len.n:
+            self.flow_iat.add(ts - self.last_seen)
+        self.last_seen = ts
+        self.pkt_len.add(payload)
+
+        if src == self.src:
+            if self.fwd_last_seen is not None:
+                self.fwd_iat.add(ts - self.fwd_last_seen)
+            self.fwd_last_seen = ts
+            self.fwd_len.add(payload)
+            self.fwd_header += header
+            self.fwd_psh += bool(flags & PSH)
+            self.fwd_urg += bool(flags & URG)
+        else:
+            if self.bwd_last_seen is not None:
+                self.bwd_iat.add(ts - self.bwd_last_seen)
+            self.bwd_last_seen = ts
+            self.bwd_len.add(payload)
+            self.bwd_header += header
+            self.bwd_psh += bool(flags & PSH)
+            self.bwd_urg += bool(flags & URG)
+
+        for mask in self.flag_counts:
+            if flags & mask:
+                self.flag_counts[mask] += 1
+
+    def to_row(self) -> dict:
+        duration = self.last_seen - self.start
+        seconds = duration / 1_000_000
+        fwd_pkts, bwd_pkts = self.fwd_len.n, self.bwd_len.n
+        values = [
+            f"{self.src}-{self.dst}-{self.sport}-{self.dport}-{self.proto}",
+            self.src,
+            self.sport,
+            self.dst,
+            self.dport,
+            self.proto,
+            datetime.fromtimestamp(self.start / 1_000_000).strftime(TIMESTAMP_FORMAT),
+            duration,
+            fwd_pkts,
+            bwd_pkts,
+            self.fwd_len.total,
+            self.bwd_len.total,
+            self.fwd_len.max,
+            self.fwd_len.min,
+            self.fwd_len.mean,
+            self.fwd_len.std,
+            self.bwd_len.max,
+            self.bwd_len.min,
+            self.bwd_len.mean,
+            self.bwd_len.std,
+            _per_second(self.fwd_len.total + self.bwd_len.total, seconds),
+            _per_second(fwd_pkts + bwd_pkts, seconds),
+            self.flow_iat.mean,
+            self.flow_iat.std,
+            self.flow_iat.max,
+            self.flow_iat.min,
+            self.fwd_iat.total,
+            self.fwd_iat.mean,
+            self.fwd_iat.std,
+            self.fwd_iat.max,
+            self.fwd_iat.min,
+            self.bwd_iat.total,
+            self.bwd_iat.mean,
+            self.bwd_iat.std,
+            self.bwd_iat.max,
+            self.bwd_iat.min,
+            self.fwd_psh,
+            self.bwd_psh,
+            self.fwd_urg,
+            self.bwd_urg,
+            self.fwd_header,
+            self.bwd_header,
+            _per_second(fwd_pkts, seconds),
+            _per_second(bwd_pkts, seconds),
+            self.pkt_len.min,
+            self.pkt_len.max,
+            self.pkt_len.mean,
+            self.pkt_len.std,
+            self.pkt_len.var,
+            self.flag_counts[FIN],
+            self.flag_counts[SYN],
+            self.flag_counts[RST],
+            self.flag_counts[PSH],
+            self.flag_counts[ACK],
+            self.flag_counts[URG],
+            self.flag_counts[ECE],
+            bwd_pkts // fwd_pkts if fwd_pkts else 0,
+            self.pkt_len.mean,
+        ]
+        return dict(zip(FLOW_COLUMNS, values))
+
+
+class FlowTable:
+    """Thread-safe table of active flows that emits finished flows to `on_flow`.
+
+    `on_flow(row, reason)` is called with the flow row and one of
+    "fin", "rst", "idle" or "active".
+    """
+
+    def __init__(
+        self,
+        on_flow,
+        idle_timeout_us: int = IDLE_TIMEOUT_US,
+        active_timeout_us: int = FLOW_TIMEOUT_US,
+    ):
+        self.on_flow = on_flow
+        self.idle_timeout_us = idle_timeout_us
+        self.active_timeout_us = active_timeout_us
+        self.flows = {}
+        self.emitted = 0
+        self._lock = native_threading.Lock()
+        # Offset between the wall clock and packet timestamps, so pcap replays
+        # expire flows on their own clock.
+        self._clock_offset = 0
+
+    def __len__(self):
+        return len(self.flows)
+
+    def update(self, fields):
+        """Fold one packet, given as flow_extractor.header_fields(), into its flow."""
+        ts, src, dst, sport, dport, proto, payload, header, flags = fields
+        a, b = (src, sport), (dst, dport)
+        key = (a, b, proto) if a <= b else (b, a, proto)
+        finished = []
+
+        with self._lock:
+            self._clock_offset = time.time() * 1_000_000 - ts
+            flow = self.flows.get(key)
+            if flow is not None and ts - flow.start > self.active_timeout_us:
+                finished.append((self.flows.pop(key), "active"))
+                flow = None
+            if flow is None:
+                flow = self.flows[key] = Flow(ts, src, dst, sport, dport, proto)
+            flow.add(ts, src, payload, header, flags)
+            if flags & (FIN | RST):
+                finished.append((self.flows.pop(key), "fin" if flags & FIN else "rst"))
+
+        self._emit(finished)
+
+    def expire(self, now_us: float = None):
+        """Emit flows past their idle or active timeout."""
+        finished = []
+        with self._lock:
+            if now_us is None:
+                now_us = time.time() * 1_000_000 - self._clock_offset
+            for key, flow in list(self.flows.items()):
+                if now_us - flow.last_seen > self.idle_timeout_us:
+                    finished.append((self.flows.pop(key), "idle"))
+                elif now_us - flow.start > self.active_timeout_us:
+                    finished.append((self.flows.pop(key), "active"))
+
+        self._emit(finished)
+        return len(finished)
+
+    def flush(self):
+        """Emit every active flow, e.g. when capture stops."""
+        with self._lock:
+            finished = [(flow, "idle") for flow in self.flows.values()]
+            self.flows.clear()
+        self._emit(finished)
+
+    def _emit(self, finished):
+        for flow, reason in finished:
+            self.emitted += 1
+            try:
+                self.on_flow(flow.to_row(), reason)
+            except Exception as e:
+                logger.error(f"Flow callback failed: {e}")
@@ -87,11 +87,7 @@ const AppContent = () => {
   }, []);
 
   useEffect(() => {
-    const handleNewPacket = (packet) => {
-      bufferRef.current.push(packet);
-      totalPacketCountRef.current += 1;
-      setTotalPacketCount(totalPacketCountRef.current);
-
+    const scheduleUpdate = () => {
       if (!updateTimerRef.current) {
         updateTimerRef.current = setTimeout(() => {
           setPackets((prev) => {
@@ -104,6 +100,24 @@ const AppContent = () => {
       }
     };
 
+    const handleNewPacket = (packet) => {
+      bufferRef.current.push(packet);
+      totalPacketCountRef.current += 1;
+      setTotalPacketCount(totalPacketCountRef.current);
+      scheduleUpdate();
+    };
+
+    const handlePacketFeed = (feed) => {
+      bufferRef.current.push(...[...feed.packets].reverse());
+      if (feed.total_packet_count != null) {
+        totalPacketCountRef.current = feed.total_packet_count;
+      } else {
+        totalPacketCountRef.current += feed.count;
+      }
+      setTotalPacketCount(totalPacketCountRef.current);
+      scheduleUpdate();
+    };
+
     const handleNewBatch = (batch) => {
       setBatches((prev) => [batch, ...prev]);
     };
@@ -127,7 +141,12 @@ const AppContent = () => {
       Notification.requestPermission();
     }
 
-    setupSocket(handleNewBatch, handleNewPacket, handleNewAlert).catch(
+    setupSocket(
+      handleNewBatch,
+      handleNewPacket,
+      handleNewAlert,
+      handlePacketFeed
+    ).catch(
       (error) => {
         console.error("Socket connection failed:", error);
       }
@@ -47,7 +47,7 @@ const Dashboard = forwardRef(
     const [iface, setIface] = useState("");
     const [ifaceList, setIfaceList] = useState([]);
     const [model, setModel] = useState("");
-    const [modelList] = useState(["autoencoder", "kmeans", "svm"]);
+    const [modelList] = useState(["autoencoder", "kmeans", "svm", "ensemble"]);
     const [filter, setFilter] = useState("");
 
     useEffect(() => {
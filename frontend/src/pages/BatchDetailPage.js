@@ -51,7 +51,7 @@ const BatchDetailPage = () => {
         setBatchMeta(batchData);
         setNote(batchData?.note || "");
 
-        if (batchData.csv_file_path) {
+        if (batchData.flows_file_path || batchData.csv_file_path) {
           try {
             const csvResult = await getCsvData(id);
             setColumns(csvResult?.columns ?? []);
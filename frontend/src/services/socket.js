@@ -2,7 +2,7 @@ import { io } from "socket.io-client";
 
 let socket = null;
 
-export const setupSocket = (onNewBatch, onNewPacket, onNewAlert) => {
+export const setupSocket = (onNewBatch, onNewPacket, onNewAlert, onPacketFeed) => {
   return new Promise((resolve, reject) => {
     if (!socket) {
       socket = io("http://localhost:5000", {
@@ -37,6 +37,13 @@ export const setupSocket = (onNewBatch, onNewPacket, onNewAlert) => {
       });
     }
 
+    if (onPacketFeed) {
+      // Sampled packets + counters, published every LIVE_FEED_INTERVAL
+      socket.on("packet_feed", (feed) => {
+        onPacketFeed(feed);
+      });
+    }
+
     if (onNewBatch) {
       socket.on("new_batch", (newBatch) => {
         console.log("🗂️ Received new batch");
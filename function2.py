@@ -1,18 +1,12 @@
 from datetime import datetime
-from scapy.all import sniff, wrpcap, IP, TCP, UDP, ICMP
+from scapy.all import sniff, IP
 import time
 import os
 import numpy as np
 import pandas as pd
 import subprocess
-import tensorflow as tf
-from tensorflow.keras.models import load_model
-import joblib
-from concurrent.futures import ThreadPoolExecutor
-import threading
 import logging
 from pathlib import Path
-from keras.losses import MeanSquaredError
 from pymongo import MongoClient
 from dotenv import load_dotenv
 from flask_socketio import SocketIO
@@ -20,6 +14,8 @@ from flask import Flask
 import sys
 from bson import ObjectId, json_util
 import shutil
+import psutil
+from collections import deque
 from datetime import datetime
 import pytz
 import shutil
@@ -28,15 +24,52 @@ import pytz
 from datetime import datetime
 from model_state import get_model
 from socket_instance import socketio, app
+from flow_extractor import FLOW_COLUMNS, extract_flows, header_fields
+from flow_table import FlowTable
+from batching import make_policy
+from ingest_queue import BatchQueue
+from packet_stats import batch_stats
+from live_feed import PROTOCOL_NAMES, VN_TZ, LiveFeed
+from db_writer import DbWriter
+from flow_queries import with_timestamps
+from flow_rollups import FlowRollups
+from flow_store import store_format, write_flows
+from packet_records import (
+    LINKTYPE_ETHERNET,
+    PacketBuffer,
+    PacketRecords,
+    decode_frame,
+    linktype_of,
+    write_pcap,
+)
+from detectors import (
+    ENSEMBLE,
+    ENSEMBLE_MEMBERS,
+    ENSEMBLE_RULE,
+    combine_votes,
+    model_members,
+    registry,
+    run_detection as run_local_detection,
+)
+from inference_pool import InferencePool
+from metrics import MetricsRegistry, StageTimer
+from async_runtime import (
+    WORKER_PROCESS,
+    native_executor,
+    native_sleep,
+    native_threading,
+    start_thread,
+)
 
 
+# Inference pool workers log to stdout only
+log_handlers = [logging.StreamHandler(sys.stdout)]
+if not WORKER_PROCESS:
+    log_handlers.append(logging.FileHandler("app.log", encoding="utf-8"))
 logging.basicConfig(
     level=logging.WARNING,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler("app.log", encoding="utf-8"),
-    ],
+    handlers=log_handlers,
 )
 logger = logging.getLogger(__name__)
 
@@ -47,37 +80,59 @@ CSV_OUTPUT_DIR = BASE_DIR / "csv_cicflowmeter"
 CICFLOWMETER_DIR = BASE_DIR / "CICFlowMeter-4.0" / "bin"
 CFM_PATH = CICFLOWMETER_DIR / "cfm.bat"
 BATCH_DIR = BASE_DIR / "batches"
-BATCH_DIR.mkdir(parents=True, exist_ok=True)
 MODEL_DIR = BASE_DIR / "Model"
 CHUNK_SIZE = 5000
 
-for directory in [OUTPUT_DIR, CSV_OUTPUT_DIR, BATCH_DIR, CICFLOWMETER_DIR, MODEL_DIR]:
-    directory.mkdir(parents=True, exist_ok=True)
+load_dotenv()
 
+# "native": in-process flow extractor, "cicflowmeter": legacy Java CICFlowMeter
+FLOW_EXTRACTOR = os.getenv("FLOW_EXTRACTOR", "native").lower()
 
-custom_objects = {"mse": MeanSquaredError()}
-try:
-    AU_MODEL = load_model(MODEL_DIR / "autoencoder.h5", compile=False)
-    KMEANS_MODEL = joblib.load(MODEL_DIR / "kmeans_model.pkl")
-    SVM_MODEL = joblib.load(MODEL_DIR / "ocsvm_model.joblib")
+# Streaming flow table: score finished flows continuously instead of per batch
+STREAMING_FLOWS = os.getenv("STREAMING_FLOWS", "0") == "1"
+FLOW_IDLE_TIMEOUT = float(os.getenv("FLOW_IDLE_TIMEOUT", 15))
+FLOW_ACTIVE_TIMEOUT = float(os.getenv("FLOW_ACTIVE_TIMEOUT", 120))
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", 1))
 
-    ANOMALY_DATA = np.load(MODEL_DIR / "autoencoder_train_info.npz")
-    AUTOENCODER_THRESHOLD = ANOMALY_DATA["threshold"].item()
+# Batching policy: "count", "time", "hybrid" or "adaptive" (see batching.py)
+BATCH_POLICY = os.getenv("BATCH_POLICY", "count").lower()
+BATCH_MAX_PACKETS = int(os.getenv("BATCH_MAX_PACKETS", CHUNK_SIZE))
+BATCH_MAX_SECONDS = float(os.getenv("BATCH_MAX_SECONDS", 30))
+BATCH_MIN_PACKETS = int(os.getenv("BATCH_MIN_PACKETS", 500))
+BATCH_TIMER_INTERVAL = 0.5
 
-    SCALER_AU = joblib.load(MODEL_DIR / "scaler_autoencoder.pkl")
-    SCALER_KMEANS = joblib.load(MODEL_DIR / "scaler_kmeans.pkl")
-    SCALER_SVM = joblib.load(MODEL_DIR / "scaler_svm.pkl")
+# Bounded queue between the sniffer and the batch workers (see ingest_queue.py)
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))
+INGEST_OVERFLOW = os.getenv("INGEST_OVERFLOW", "block").lower()
+INGEST_SAMPLE_RATE = float(os.getenv("INGEST_SAMPLE_RATE", 0.5))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 4))
+INGEST_STATS_INTERVAL = 2
 
-    KMEANS_MAPPING = joblib.load(MODEL_DIR / "kmeans_label_mapping.pkl")
-    logger.info("ML models loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load ML models: {e}")
-    raise
-load_dotenv()
+# Format the per-batch flow tables are stored in: "csv", "parquet" or "arrow"
+FLOW_STORE = store_format(os.getenv("FLOW_STORE", "csv").lower())
+
+# Write-behind MongoDB writer (see db_writer.py)
+DB_WRITE_MAX_DOCS = int(os.getenv("DB_WRITE_MAX_DOCS", 200_000))
+DB_WRITE_BULK_SIZE = int(os.getenv("DB_WRITE_BULK_SIZE", 5000))
+DB_WRITE_INTERVAL = float(os.getenv("DB_WRITE_INTERVAL", 0.5))
+DB_WRITE_RETRIES = int(os.getenv("DB_WRITE_RETRIES", 5))
+
+# Number of inference worker processes; 0 runs the models in the batch worker threads
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 0))
+
+# "batch": one aggregated row per batch, "flow": one verdict per flow
+SCORING_MODE = os.getenv("SCORING_MODE", "batch").lower()
+FLOW_WINDOW = int(os.getenv("FLOW_WINDOW", 1))
+
+# Live packet feed (see live_feed.py)
+LIVE_FEED_INTERVAL = float(os.getenv("LIVE_FEED_INTERVAL", 0.25))
+LIVE_FEED_SAMPLES = int(os.getenv("LIVE_FEED_SAMPLES", 20))
+LIVE_FEED_LEGACY = os.getenv("LIVE_FEED_LEGACY", "0") == "1"
 
 
 try:
-    client = MongoClient(os.environ.get("MONGO_URI"))
+    # Not connected in worker processes, which never use it
+    client = MongoClient(os.environ.get("MONGO_URI"), connect=not WORKER_PROCESS)
     db = client["network_monitor"]
     batches_collection = db["batches"]
     alerts_collection = db["alerts"]
@@ -86,16 +141,64 @@ except Exception as e:
     logger.error(f"Failed to connect to MongoDB: {e}")
     raise
 
+# Pipeline metrics served on /metrics (see metrics.py)
+metrics = MetricsRegistry("ids_")
+stage_seconds = metrics.histogram(
+    "batch_stage_seconds",
+    "Time spent in each stage of batch and streamed flow processing",
+    ("pipeline", "stage"),
+)
+batch_seconds = metrics.histogram(
+    "batch_seconds", "End-to-end processing time of a batch"
+)
+db_write_seconds = metrics.histogram(
+    "db_write_seconds", "Duration of MongoDB bulk writes", ("collection",)
+)
+packets_processed = metrics.counter(
+    "packets_processed_total", "Packets in processed batches"
+)
+batches_processed = metrics.counter(
+    "batches_total", "Processed batches by result (saved or failed)", ("result",)
+)
+flows_scored = metrics.counter("flows_total", "Flows scored", ("pipeline",))
+alerts_raised = metrics.counter(
+    "alerts_total", "Intrusion alerts raised", ("pipeline",)
+)
+
+db_writer = DbWriter(
+    db,
+    max_docs=DB_WRITE_MAX_DOCS,
+    bulk_size=DB_WRITE_BULK_SIZE,
+    flush_interval=DB_WRITE_INTERVAL,
+    retries=DB_WRITE_RETRIES,
+    write_seconds=db_write_seconds,
+)
+
+# Per-minute/hour flow counters behind /api/flows/summary (see flow_rollups.py)
+flow_rollups = FlowRollups(db, db_writer)
+
 packet_count = 0
-packet_buffer = []
+# Raw frames of the batch being filled (see packet_records.py). Closing a batch
+# swaps in a spare buffer; the full one is copied out after `lock` is released
+# and then becomes a spare again
+packet_buffer = PacketBuffer(BATCH_MAX_PACKETS)
+spare_buffers = deque([PacketBuffer(BATCH_MAX_PACKETS)])
+# Frames captured since the dashboard counter was last reset
+captured_packets = 0
 file_index = 0
 all_predictions = []
-executor = ThreadPoolExecutor(max_workers=12)
-lock = threading.Lock()
+executor = native_executor(12, "batch")
+lock = native_threading.Lock()
 sniff_thread = None
-sniff_control = threading.Event()
+sniff_control = native_threading.Event()
 is_sniffing = False
-total_packet_count = 0
+batch_started = 0.0
+batch_queue = BatchQueue(INGEST_QUEUE_SIZE, INGEST_OVERFLOW, INGEST_SAMPLE_RATE)
+
+policy_kwargs = {"max_packets": BATCH_MAX_PACKETS, "max_seconds": BATCH_MAX_SECONDS}
+if BATCH_POLICY == "adaptive":
+    policy_kwargs["min_packets"] = BATCH_MIN_PACKETS
+batch_policy = make_policy(BATCH_POLICY, **policy_kwargs)
 
 
 def extract_features_with_cicflowmeter(pcap_path: Path, output_dir: Path) -> Path:
@@ -128,81 +231,157 @@ def extract_features_with_cicflowmeter(pcap_path: Path, output_dir: Path) -> Pat
         return None
 
 
-def aggregate_features(csv_file: Path) -> pd.DataFrame:
-    """Aggregate network flow features"""
+def extract_flows_with_cicflowmeter(
+    pcap_path: Path, index: int, timer: StageTimer = None
+) -> pd.DataFrame:
+    """Flow table of a batch pcap from CICFlowMeter; its CSV output is only
+    read once and then deleted"""
+    timer = timer or StageTimer()
+    with timer.stage("flow_extract"):
+        csv_path = extract_features_with_cicflowmeter(pcap_path, CSV_OUTPUT_DIR)
+    if csv_path is None:
+        return None
     try:
-        data = pd.read_csv(csv_file)
-        if data.empty:
-            logger.warning("Empty CSV file: %s", csv_file)
+        with timer.stage("csv_parse"):
+            df = pd.read_csv(csv_path)
+        if df.empty:
+            logger.warning("No flows extracted from batch %d", index)
             return None
+        return df
+    finally:
+        try:
+            csv_path.unlink()
+        except Exception as e:
+            logger.warning(f"Could not delete temporary file {csv_path}: {e}")
 
-        model = get_model()
-        logger.info(f"Aggregating features for model: {model}")
 
-        if model == "autoencoder":
-            selected_cols = [
-                "Flow Duration_mean",
-                "Fwd IAT Tot_std",
-                "Fwd IAT Max_std",
-                "Fwd IAT Std_mean",
-                "Fwd IAT Std_std",
-                "Bwd IAT Max_mean",
-            ]
-            config = {
-                "Flow Duration": ["mean"],
-                "Fwd IAT Tot": ["std"],
-                "Fwd IAT Max": ["std"],
-                "Fwd IAT Std": ["mean", "std"],
-                "Bwd IAT Max": ["mean"],
-            }
-        elif model == "kmeans":
-            selected_cols = [
-                "Flow Duration_mean",
-                "Fwd IAT Tot_std",
-                "Fwd IAT Max_std",
-                "Fwd IAT Std_mean",
-                "Fwd IAT Std_std",
-                "Bwd IAT Max_mean",
-            ]
-            config = {
-                "Flow Duration": ["mean"],
-                "Fwd IAT Tot": ["std"],
-                "Fwd IAT Max": ["std"],
-                "Fwd IAT Std": ["mean", "std"],
-                "Bwd IAT Max": ["mean"],
-            }
-        elif model == "svm":
-            selected_cols = [
-                "Flow Duration_mean",
-                "Fwd IAT Tot_mean",
-                "Fwd IAT Tot_std",
-                "Bwd IAT Max_mean",
-                "Bwd IAT Std_mean",
-            ]
-            config = {
-                "Flow Duration": ["mean"],
-                "Fwd IAT Tot": ["mean", "std"],
-                "Bwd IAT Max": ["mean"],
-                "Bwd IAT Std": ["mean"],
-            }
-        else:
-            logger.error(f"Unknown model: {model}")
+def extract_features_native(packets, index: int) -> pd.DataFrame:
+    """Extract CICFlowMeter-compatible flows in-process"""
+    try:
+        df = extract_flows(packets)
+        if df.empty:
+            logger.warning("No flows extracted from batch %d", index)
             return None
 
-        # Check for missing columns
-        missing = [col for col in config if col not in data.columns]
-        if missing:
-            logger.warning("Missing columns in CSV: %s", missing)
+        logger.info("Extracted %d flows from batch %d", len(df), index)
+        return df
+    except Exception as e:
+        logger.error("Native flow extraction failed: %s", e)
+        return None
+
+
+# Aggregated feature columns each model was trained on, and the aggregations
+# over the flow table that produce them
+FEATURE_CONFIG = {
+    "autoencoder": {
+        "columns": [
+            "Flow Duration_mean",
+            "Fwd IAT Tot_std",
+            "Fwd IAT Max_std",
+            "Fwd IAT Std_mean",
+            "Fwd IAT Std_std",
+            "Bwd IAT Max_mean",
+        ],
+        "aggregations": {
+            "Flow Duration": ["mean"],
+            "Fwd IAT Tot": ["std"],
+            "Fwd IAT Max": ["std"],
+            "Fwd IAT Std": ["mean", "std"],
+            "Bwd IAT Max": ["mean"],
+        },
+    },
+    "kmeans": {
+        "columns": [
+            "Flow Duration_mean",
+            "Fwd IAT Tot_std",
+            "Fwd IAT Max_std",
+            "Fwd IAT Std_mean",
+            "Fwd IAT Std_std",
+            "Bwd IAT Max_mean",
+        ],
+        "aggregations": {
+            "Flow Duration": ["mean"],
+            "Fwd IAT Tot": ["std"],
+            "Fwd IAT Max": ["std"],
+            "Fwd IAT Std": ["mean", "std"],
+            "Bwd IAT Max": ["mean"],
+        },
+    },
+    "svm": {
+        "columns": [
+            "Flow Duration_mean",
+            "Fwd IAT Tot_mean",
+            "Fwd IAT Tot_std",
+            "Bwd IAT Max_mean",
+            "Bwd IAT Std_mean",
+        ],
+        "aggregations": {
+            "Flow Duration": ["mean"],
+            "Fwd IAT Tot": ["mean", "std"],
+            "Bwd IAT Max": ["mean"],
+            "Bwd IAT Std": ["mean"],
+        },
+    },
+}
+
+
+# Ensemble: union of the member feature sets, computed once per batch
+FEATURE_CONFIG[ENSEMBLE] = {
+    "columns": list(
+        dict.fromkeys(c for m in ENSEMBLE_MEMBERS for c in FEATURE_CONFIG[m]["columns"])
+    ),
+    "aggregations": {},
+}
+for member in ENSEMBLE_MEMBERS:
+    for col, aggs in FEATURE_CONFIG[member]["aggregations"].items():
+        merged = FEATURE_CONFIG[ENSEMBLE]["aggregations"].setdefault(col, [])
+        merged.extend(agg for agg in aggs if agg not in merged)
+
+
+def load_flow_table(csv_file) -> pd.DataFrame:
+    """Return the flow table given as a CSV path or an already loaded DataFrame"""
+    if isinstance(csv_file, pd.DataFrame):
+        return csv_file
+    return pd.read_csv(csv_file)
+
+
+def feature_config(data: pd.DataFrame, model: str) -> dict:
+    """FEATURE_CONFIG entry for `model`, or None if it cannot be built from `data`"""
+    config = FEATURE_CONFIG.get(model)
+    if config is None:
+        logger.error(f"Unknown model: {model}")
+        return None
+
+    # Check for missing columns
+    missing = [col for col in config["aggregations"] if col not in data.columns]
+    if missing:
+        logger.warning("Missing columns in CSV: %s", missing)
+        return None
+    return config
+
+
+def aggregate_features(csv_file, model: str = None) -> pd.DataFrame:
+    """Aggregate network flow features from a flow CSV path or DataFrame"""
+    try:
+        data = load_flow_table(csv_file)
+        if data.empty:
+            logger.warning("Empty flow table: %s", csv_file)
+            return None
+
+        model = model or get_model()
+        logger.info(f"Aggregating features for model: {model}")
+        config = feature_config(data, model)
+        if config is None:
             return None
 
         # Aggregation
         aggregated = {}
-        for col, aggs in config.items():
+        for col, aggs in config["aggregations"].items():
             for agg in aggs:
                 key = f"{col}_{agg}"
                 aggregated[key] = [data[col].agg(agg)]
 
-        df = pd.DataFrame(aggregated).reindex(columns=selected_cols)
+        df = pd.DataFrame(aggregated).reindex(columns=config["columns"])
         df = df.astype(np.float32)
         logger.debug(f"Aggregated features: {df}")
         return df
@@ -212,6 +391,49 @@ def aggregate_features(csv_file: Path) -> pd.DataFrame:
         return None
 
 
+def flow_features(csv_file, model: str = None, window: int = 1) -> pd.DataFrame:
+    """One feature row per flow, aggregated over a sliding window of the last
+    `window` flows (window=1 scores every flow on its own)"""
+    try:
+        data = load_flow_table(csv_file)
+        if data.empty:
+            logger.warning("Empty flow table: %s", csv_file)
+            return None
+
+        model = model or get_model()
+        config = feature_config(data, model)
+        if config is None:
+            return None
+
+        rolled = {}
+        for col, aggs in config["aggregations"].items():
+            rolling = data[col].astype(np.float64).rolling(window, min_periods=1)
+            for agg in aggs:
+                rolled[f"{col}_{agg}"] = getattr(rolling, agg)()
+
+        # std over a single flow is undefined
+        df = pd.DataFrame(rolled).reindex(columns=config["columns"]).fillna(0)
+        return df.astype(np.float32)
+
+    except Exception as e:
+        logger.error("Per-flow feature extraction failed: %s", e)
+        return None
+
+
+def build_features(csv_file, model: str) -> pd.DataFrame:
+    """Feature matrix for the configured SCORING_MODE"""
+    if SCORING_MODE == "flow":
+        return flow_features(csv_file, model, FLOW_WINDOW)
+    return aggregate_features(csv_file, model)
+
+
+def flow_labels(predictions: np.ndarray, flow_count: int, is_attack: bool):
+    """Per-flow labels in flow scoring mode, otherwise the batch verdict"""
+    if SCORING_MODE == "flow" and len(predictions) == flow_count:
+        return np.where(predictions == 1, "Attack", "Benign")
+    return "Attack" if is_attack else "Benign"
+
+
 def extract_basic_features(packets, model):
     # Định nghĩa danh sách feature cho từng model
     if model == "autoencoder" or model == "kmeans":
@@ -260,194 +482,76 @@ def extract_basic_features(packets, model):
     return {col: feature_dict.get(col, 0) for col in selected_cols}
 
 
-def detect_anomalies_AU(features: pd.DataFrame) -> np.ndarray:
-    try:
-        if features is None or features.empty:
-            return np.array([])
-
-        features = features.astype("float32")
-        features_scaled = SCALER_AU.transform(features)
-
-        def predict(model, data, threshold):
-            reconstructions = model.predict(data)
-            loss = tf.keras.losses.mae(reconstructions, data)
-            return (loss.numpy() < threshold).astype(int)
-
-        preds = predict(AU_MODEL, features_scaled, AUTOENCODER_THRESHOLD)
-        logger.debug("Anomaly predictions: %s", preds.tolist())
-        return preds
-
-    except Exception as e:
-        logger.error("Anomaly detection failed: %s", e)
-        return np.array([])
-
-def detect_anomalies_KMEANS(features: pd.DataFrame) -> np.ndarray:
-    """Detect anomalies using KMeans model with proper cluster-to-label mapping."""
-    try:
-        if features is None or features.empty:
-            return np.array([])
-
-        expected_columns = [
-            "Flow Duration_mean",
-            "Fwd IAT Tot_std",
-            "Fwd IAT Max_std",
-            "Fwd IAT Std_mean",
-            "Fwd IAT Std_std",
-            "Bwd IAT Max_mean",
-        ]
-
-        features = features[expected_columns]
-        features.replace([np.inf, -np.inf], np.nan, inplace=True)
-        features.fillna(0, inplace=True)
-
-        features_scaled = SCALER_KMEANS.transform(features)
-
-        raw_predictions = KMEANS_MODEL.predict(features_scaled)
-        predictions = np.array([KMEANS_MAPPING[c] for c in raw_predictions])
-
-        logger.debug(f"KMeans raw clusters: {raw_predictions}")
-        logger.debug(f"KMeans mapped predictions: {predictions}")
-        return predictions
-
-    except Exception as e:
-        logger.error(f"KMeans detection failed: {str(e)}")
-        return np.array([])
-
-
-def detect_anomalies_SVM(features: pd.DataFrame) -> np.ndarray:
-    try:
-        if features is None or features.empty:
-            return np.array([])
-
-        expected_columns = [
-            "Flow Duration_mean",
-            "Fwd IAT Tot_mean",
-            "Fwd IAT Tot_std",
-            "Bwd IAT Max_mean",
-            "Bwd IAT Std_mean",
-        ]
-
-        features = features[expected_columns]
-        features = features.astype(np.float32)
-
-        raw_preds = SVM_MODEL.predict(features)
-
-        # Map -1 → 1 (attack), 1 → 0 (benign)
-        predictions = np.array([1 if x == -1 else 0 for x in raw_preds])
-
-        logger.debug(f"OneClassSVM raw: {raw_preds}")
-        logger.debug(f"Mapped predictions: {predictions}")
-
-        return predictions
-
-    except Exception as e:
-        logger.error("Anomaly detection failed: %s", e)
-        return np.array([])
-
-
-def analyze_packet_stats(packets):
+def analyze_packet_stats(packets: PacketRecords) -> dict:
     """Analyze packet statistics"""
-    stats = {
-        "total_packets": len(packets),
-        "total_bytes": 0,
-        "protocol_distribution": {"TCP": 0, "UDP": 0, "ICMP": 0, "Other": 0},
-        "flag_count": {
-            flag: 0 for flag in ["SYN", "ACK", "FIN", "RST", "PSH", "URG", "ECE", "CWR"]
-        },
-        "src_ips": set(),
-        "dst_ips": set(),
-        "start_time": None,
-        "end_time": None,
-    }
-
-    if not packets:
-        return stats
-
-    stats["start_time"] = datetime.fromtimestamp(float(packets[0].time))
-    stats["end_time"] = datetime.fromtimestamp(float(packets[-1].time))
-
-    for pkt in packets:
-        stats["total_bytes"] += len(pkt)
-
-        if pkt.haslayer(TCP):
-            stats["protocol_distribution"]["TCP"] += 1
-            tcp_layer = pkt.getlayer(TCP)
-            for flag, mask in [
-                ("SYN", 0x02),
-                ("ACK", 0x10),
-                ("FIN", 0x01),
-                ("RST", 0x04),
-                ("PSH", 0x08),
-                ("URG", 0x20),
-                ("ECE", 0x40),
-                ("CWR", 0x80),
-            ]:
-                if tcp_layer.flags & mask:
-                    stats["flag_count"][flag] += 1
-        elif pkt.haslayer(UDP):
-            stats["protocol_distribution"]["UDP"] += 1
-        elif pkt.haslayer(ICMP):
-            stats["protocol_distribution"]["ICMP"] += 1
-        else:
-            stats["protocol_distribution"]["Other"] += 1
-
-        if pkt.haslayer(IP):
-            stats["src_ips"].add(pkt[IP].src)
-            stats["dst_ips"].add(pkt[IP].dst)
-
-    stats["src_ip_count"] = len(stats["src_ips"])
-    stats["dst_ip_count"] = len(stats["dst_ips"])
-    stats["average_packet_size"] = (
-        stats["total_bytes"] / stats["total_packets"]
-        if stats["total_packets"] > 0
-        else 0
-    )
-
-    del stats["src_ips"]
-    del stats["dst_ips"]
-
-    return stats
-
-
-def save_batch_to_db(pcap_path, packets, index, is_attack=False, csv_path: Path = None):
-    """Save batch to MongoDB with proper file handling"""
+    return batch_stats(packets)
+
+
+def new_batch_dir(index: int):
+    """Name and directory of a new batch; its artifacts are written there once"""
+    timestamp_str = datetime.now(VN_TZ).strftime("%Y%m%d_%H%M%S")
+    # The batch index keeps names unique when batches close within one second
+    batch_name = f"batch_{timestamp_str}_{index}"
+    batch_dir = BATCH_DIR / batch_name
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    return batch_name, batch_dir
+
+
+def save_batch_to_db(
+    batch_name: str,
+    batch_dir: Path,
+    pcap_file: Path,
+    packets,
+    index,
+    is_attack=False,
+    flows: pd.DataFrame = None,
+    model_info: dict = None,
+    timer: StageTimer = None,
+):
+    """Store the flow table next to the batch pcap and save the batch to
+    MongoDB. Per-flow labels are a Label column of `flows`; a batch-level
+    verdict is only kept on the batch document (`is_attack`), the stage
+    timings of `timer` up to this point as `timings_ms`."""
+    timer = timer or StageTimer()
     try:
-        stats = analyze_packet_stats(packets)
+        with timer.stage("packet_stats"):
+            stats = analyze_packet_stats(packets)
         vietnam_tz = pytz.timezone("Asia/Ho_Chi_Minh")
         current_time = datetime.now(vietnam_tz)
 
-        timestamp_str = current_time.strftime("%Y%m%d_%H%M%S")
-        batch_name = f"batch_{timestamp_str}"
-        batch_dir = BATCH_DIR / batch_name
-        batch_dir.mkdir(parents=True, exist_ok=True)
-
-        pcap_file = batch_dir / f"{batch_name}.pcap"
-        wrpcap(str(pcap_file), packets)
-
-        batch_csv = None
-        if csv_path and csv_path.exists():
-            batch_csv = batch_dir / f"{batch_name}.csv"
+        flows_file = None
+        attack_flows = None
+        if flows is not None:
             try:
-                shutil.copy2(str(csv_path), str(batch_csv))
+                with timer.stage("flow_store"):
+                    flows_file = write_flows(flows, batch_dir / batch_name, FLOW_STORE)
             except Exception as e:
-                logger.warning(f"Could not copy CSV file: {e}")
-        if batch_csv:
-            df = pd.read_csv(batch_csv)
-            df["Label"] = "Attack" if is_attack else "Benign"
-            df.to_csv(batch_csv, index=False)
+                logger.warning(f"Could not store flows of batch {index}: {e}")
+            if "Label" in flows.columns:
+                attack_flows = int((flows["Label"] == "Attack").sum())
+            else:
+                attack_flows = len(flows) if is_attack else 0
 
         batch_doc = {
             "batch_name": batch_name,
             "created_at": current_time,
             "pcap_file_path": str(pcap_file),
-            "csv_file_path": str(batch_csv) if batch_csv else None,
+            "csv_file_path": (
+                str(flows_file) if flows_file and FLOW_STORE == "csv" else None
+            ),
+            "flows_file_path": str(flows_file) if flows_file else None,
+            "flows_format": FLOW_STORE if flows_file else None,
             **stats,
             "note": f"Processed at {current_time.isoformat()}",
             "is_attack": is_attack,
+            "scoring_mode": "stream" if STREAMING_FLOWS else SCORING_MODE,
+            "attack_flow_count": attack_flows,
+            **(model_info or {}),
+            "timings_ms": timer.record(),
         }
 
-        result = batches_collection.insert_one(batch_doc)
-        batch_id = result.inserted_id
+        with timer.stage("db_queue"):
+            batch_id = db_writer.insert_one("batches", batch_doc)
 
         socket_batch = {
             **batch_doc,
@@ -463,7 +567,8 @@ def save_batch_to_db(pcap_path, packets, index, is_attack=False, csv_path: Path
             ),
         }
 
-        socketio.emit("new_batch", socket_batch)
+        with timer.stage("emit"):
+            socketio.emit("new_batch", socket_batch)
 
         if is_attack:
             alert_data = {
@@ -472,7 +577,13 @@ def save_batch_to_db(pcap_path, packets, index, is_attack=False, csv_path: Path
                 "severity": "high",
                 "timestamp": current_time.isoformat(),
             }
-            socketio.emit("intrusion_alert", alert_data)
+            with timer.stage("db_queue"):
+                db_writer.insert_one(
+                    "alerts", {**alert_data, "created_at": current_time}
+                )
+            with timer.stage("emit"):
+                socketio.emit("intrusion_alert", alert_data)
+            alerts_raised.inc(pipeline="batch")
 
         return batch_id
 
@@ -481,60 +592,149 @@ def save_batch_to_db(pcap_path, packets, index, is_attack=False, csv_path: Path
         return None
 
 
-io_executor = ThreadPoolExecutor(max_workers=8)
+io_executor = native_executor(8, "io")
 
+# Started by start_pipeline() when INFERENCE_WORKERS > 0
+inference_pool = None
+
+
+def run_detection(model: str, features: pd.DataFrame, bundle: dict = None) -> np.ndarray:
+    """Run the selected model, in the inference pool when one is configured.
+    With `bundle`, the batch is scored by that model version even if another
+    version is deployed meanwhile."""
+    if inference_pool is None or features is None:
+        return run_local_detection(model, features, bundle)
+    try:
+        return inference_pool.predict(model, features, bundle and bundle["version"])
+    except Exception as e:
+        logger.error(f"Inference pool failed: {e}")
+        return np.array([])
+
+
+ensemble_executor = native_executor(len(ENSEMBLE_MEMBERS), "ensemble")
+
+
+def model_bundles(model: str) -> dict:
+    """Active bundle of every detector used by `model`, pinned for one batch.
+    With an inference pool only the versions are pinned; the workers load the
+    models."""
+    if inference_pool is not None:
+        return {name: registry.pin(name) for name in model_members(model)}
+    return {name: registry.get(name) for name in model_members(model)}
 
-def process_packet_batch(buffer: list, index: int):
-    """Process packet batch with improved file handling"""
-    model = get_model()
 
-    pcap_path = None
-    csv_path = None
+def timed_detection(model: str, features: pd.DataFrame, bundle: dict):
+    started = time.perf_counter()
+    predictions = run_detection(model, features, bundle)
+    return predictions, time.perf_counter() - started
+
+
+def score_features(model: str, features: pd.DataFrame, bundles: dict):
+    """Score `features` with `model`; returns the predictions and the batch
+    document fields describing the models used. In ensemble mode all members
+    run concurrently on the shared feature matrix and their votes are combined
+    by ENSEMBLE_RULE; per-detector latency and verdicts are reported."""
+    if model != ENSEMBLE:
+        predictions = run_detection(model, features, bundles[model])
+        return predictions, {"model": model, "model_version": bundles[model]["version"]}
+
+    futures = {
+        name: ensemble_executor.submit(timed_detection, name, features, bundle)
+        for name, bundle in bundles.items()
+    }
+    votes = {}
+    detector_info = {}
+    for name, future in futures.items():
+        votes[name], seconds = future.result()
+        detector_info[name] = {
+            "version": bundles[name]["version"],
+            "latency_ms": round(seconds * 1000, 2),
+            "is_attack": bool(votes[name].any()),
+            "attack_count": int(votes[name].sum()),
+            "predictions": votes[name].tolist(),
+        }
 
     try:
-        pcap_path = OUTPUT_DIR / f"temp_capture_{index}.pcap"
-        wrpcap(str(pcap_path), buffer)
-        csv_path = extract_features_with_cicflowmeter(pcap_path, CSV_OUTPUT_DIR)
+        predictions = combine_votes(votes)
+    except Exception as e:
+        logger.error(f"Ensemble vote failed: {e}")
+        predictions = np.array([])
+
+    return predictions, {
+        "model": model,
+        "model_version": {name: info["version"] for name, info in detector_info.items()},
+        "ensemble_rule": ENSEMBLE_RULE,
+        "detectors": detector_info,
+    }
 
-        features = aggregate_features(csv_path) if csv_path else None
-        logger.info(f"Using model: {model} for predictions")
 
-        if model == "autoencoder":
-            predictions = (
-                detect_anomalies_AU(features) if features is not None else np.array([])
-            )
-        elif model == "kmeans":
-            predictions = (
-                detect_anomalies_KMEANS(features)
-                if features is not None
-                else np.array([])
-            )
-        elif model == "svm":
-            predictions = (
-                detect_anomalies_SVM(features) if features is not None else np.array([])
-            )
+def process_packet_batch(buffer: PacketRecords, index: int):
+    """Process packet batch with improved file handling"""
+    model = get_model()
+    batch_id = None
+    batch_name, batch_dir = new_batch_dir(index)
+    timer = StageTimer(stage_seconds, pipeline="batch")
+
+    try:
+        # The pcap is written once, into the batch directory it is kept in
+        pcap_file = batch_dir / f"{batch_name}.pcap"
+        with timer.stage("pcap_write"):
+            write_pcap(pcap_file, buffer)
+
+        if STREAMING_FLOWS:
+            # The streaming flow table scores, stores and counts every flow;
+            # the batch only keeps its pcap and packet statistics
+            flows = features = None
+            predictions, model_info = np.array([]), {"model": model}
         else:
-            logger.error(f"Invalid model selected: {model}")
-            predictions = np.array([])
+            # Model versions pinned for the whole batch; a deploy swaps them
+            # for the next one
+            with timer.stage("model_load"):
+                bundles = model_bundles(model)
+
+            # The flow table stays in memory for scoring, storage and the flow insert
+            if FLOW_EXTRACTOR == "cicflowmeter":
+                flows = extract_flows_with_cicflowmeter(pcap_file, index, timer)
+            else:
+                with timer.stage("flow_extract"):
+                    flows = extract_features_native(buffer, index)
 
-        logger.info(f"Using model: {model} for predictions")
+            with timer.stage("features"):
+                features = build_features(flows, model) if flows is not None else None
+            # Scaling happens inside the detectors, so it is part of "predict"
+            with timer.stage("predict"):
+                predictions, model_info = score_features(model, features, bundles)
 
         is_attack = bool(predictions.any())
 
-        batch_id = save_batch_to_db(pcap_path, buffer, index, is_attack, csv_path)
+        if flows is not None and SCORING_MODE == "flow" and len(predictions) == len(
+            flows
+        ):
+            flows["Label"] = flow_labels(predictions, len(flows), is_attack)
+
+        batch_id = save_batch_to_db(
+            batch_name,
+            batch_dir,
+            pcap_file,
+            buffer,
+            index,
+            is_attack,
+            flows,
+            model_info,
+            timer,
+        )
 
         if features is not None:
             try:
-                df = pd.read_csv(csv_path)
-                if not df.empty:
-                    flow_dicts = df.replace({np.nan: None}).to_dict(orient="records")
-                    for flow in flow_dicts:
-                        flow["batch_index"] = index
-                    flows_collection = db["flows"]
-                    flows_collection.insert_many(flow_dicts)
-                    logger.info(f"Inserted {len(flow_dicts)} flows for batch {index}")
+                with timer.stage("db_queue"):
+                    db_writer.insert_frame(
+                        "flows", with_timestamps(flows), {"batch_index": index}
+                    )
+                    flow_rollups.record(flows)
+                flows_scored.inc(len(flows), pipeline="batch")
+                logger.info(f"Queued {len(flows)} flows of batch {index} for insert")
             except Exception as e:
-                logger.error(f"Failed to insert flows for batch {index}: {e}")
+                logger.error(f"Failed to queue flows for batch {index}: {e}")
 
         batch_result = {
             "batch": index,
@@ -547,56 +747,407 @@ def process_packet_batch(buffer: list, index: int):
     except Exception as e:
         logger.error("Error processing batch %d: %s", index, e)
     finally:
+        packets_processed.inc(len(buffer))
+        batches_processed.inc(result="saved" if batch_id else "failed")
+        if batch_id is None:
+            # Nothing refers to the artifacts of a batch that was not saved
+            shutil.rmtree(batch_dir, ignore_errors=True)
 
-        for temp_file in [pcap_path, csv_path]:
-            if temp_file and temp_file.exists():
-                try:
-                    temp_file.unlink()
-                except Exception as e:
-                    logger.warning(f"Could not delete temporary file {temp_file}: {e}")
 
+finished_flows = []
+finished_lock = native_threading.Lock()
+stream_index = 0
 
-from model_state import get_total_packet_count, set_total_packet_count
 
+def on_flow_finished(row: dict, reason: str):
+    with finished_lock:
+        finished_flows.append(row)
 
-def handle_packet(packet):
-    global packet_count, packet_buffer, file_index
+
+flow_table = FlowTable(
+    on_flow_finished,
+    idle_timeout_us=int(FLOW_IDLE_TIMEOUT * 1_000_000),
+    active_timeout_us=int(FLOW_ACTIVE_TIMEOUT * 1_000_000),
+)
+
+
+def process_finished_flows(rows: list, index: int):
+    """Score flows emitted by the streaming flow table"""
+    timer = StageTimer(stage_seconds, pipeline="stream")
+    try:
+        model = get_model()
+        bundles = model_bundles(model)
+        df = pd.DataFrame(rows, columns=FLOW_COLUMNS)
+        with timer.stage("features"):
+            features = build_features(df, model)
+        with timer.stage("predict"):
+            predictions, model_info = score_features(model, features, bundles)
+        is_attack = bool(predictions.any())
+
+        df["Label"] = flow_labels(predictions, len(df), is_attack)
+        with timer.stage("db_queue"):
+            db_writer.insert_frame(
+                "flows",
+                with_timestamps(df),
+                {"stream_index": index, "model_version": model_info["model_version"]},
+            )
+            flow_rollups.record(df)
+        flows_scored.inc(len(df), pipeline="stream")
+
+        current_time = datetime.now(pytz.timezone("Asia/Ho_Chi_Minh"))
+        with timer.stage("emit"):
+            socketio.emit(
+                "flow_verdict",
+                {
+                    "stream_index": index,
+                    "flow_count": len(rows),
+                    **model_info,
+                    "is_attack": is_attack,
+                    "attack_flow_count": int((df["Label"] == "Attack").sum()),
+                    "timestamp": current_time.isoformat(),
+                },
+            )
+        if is_attack:
+            alert_data = {
+                "stream_index": index,
+                "message": f"Attack detected in {len(rows)} streamed flows",
+                "severity": "high",
+                "timestamp": current_time.isoformat(),
+            }
+            db_writer.insert_one("alerts", {**alert_data, "created_at": current_time})
+            socketio.emit("intrusion_alert", alert_data)
+            alerts_raised.inc(pipeline="stream")
+    except Exception as e:
+        logger.error(f"Failed to process streamed flows {index}: {e}")
+
+
+def stream_flows():
+    """Expire idle flows and submit finished ones for scoring every STREAM_INTERVAL"""
+    global stream_index
+
+    while True:
+        native_sleep(STREAM_INTERVAL)
+        flow_table.expire()
+
+        with finished_lock:
+            rows = finished_flows.copy()
+            finished_flows.clear()
+
+        if rows:
+            executor.submit(process_finished_flows, rows, stream_index)
+            stream_index += 1
+
+
+def run_batch(buffer: PacketRecords, index: int):
+    """Process a batch and feed its processing time back to the batching policy"""
+    started = time.perf_counter()
+    try:
+        process_packet_batch(buffer, index)
+    finally:
+        elapsed = time.perf_counter() - started
+        batch_seconds.observe(elapsed)
+        batch_policy.record(len(buffer), elapsed, batch_queue.pending() - 1)
+
+
+def ingest_worker():
+    """Consume batches from the bounded ingest queue"""
+    while True:
+        buffer, index = batch_queue.get()
+        try:
+            run_batch(buffer, index)
+        except Exception as e:
+            logger.error(f"Ingest worker failed on batch {index}: {e}")
+        finally:
+            batch_queue.task_done()
+
+
+def ingest_stats_reporter():
+    """Push ingest queue counters over Socket.IO whenever they change"""
+    last = None
+    while True:
+        native_sleep(INGEST_STATS_INTERVAL)
+        stats = batch_queue.stats()
+        if stats != last:
+            socketio.emit("ingest_stats", stats)
+            last = stats
+
+
+def close_batch():
+    """Swap a spare buffer in for the batch being filled; the caller must hold
+    `lock`.
+
+    The full buffer must be passed to enqueue_batch() after releasing `lock`:
+    copying the batch out of it and a blocking queue would otherwise stall the
+    capture thread.
+    """
+    global packet_buffer, packet_count, file_index
+
+    full_buffer = packet_buffer
+    try:
+        packet_buffer = spare_buffers.pop()
+    except IndexError:
+        # The previous batches are all still being copied out
+        packet_buffer = PacketBuffer(BATCH_MAX_PACKETS)
+    current_index = file_index
+    file_index += 1
+
+    packet_count = 0
+    return full_buffer, current_index
+
+
+def enqueue_batch(buffer: PacketBuffer, index: int):
+    """Copy a closed batch out of its buffer, recycle the buffer and queue the
+    batch for the ingest workers."""
+    records = buffer.take()
+    spare_buffers.append(buffer)
+    if not batch_queue.put((records, index), len(records)):
+        logger.warning(
+            f"Ingest queue full ({INGEST_OVERFLOW}), dropped batch {index} "
+            f"with {len(records)} packets"
+        )
+
+
+def batch_timer():
+    """Close partially filled batches once the policy's time limit is reached"""
+    while True:
+        native_sleep(BATCH_TIMER_INTERVAL)
+        batch = None
+        with lock:
+            if batch_policy.should_close(packet_count, time.time() - batch_started):
+                batch = close_batch()
+        if batch:
+            enqueue_batch(*batch)
+
+
+def batching_status() -> dict:
+    """Active batching policy, its live parameters and the current backlog"""
+    with lock:
+        return {
+            **batch_policy.describe(),
+            "buffered_packets": packet_count,
+            "buffered_bytes": packet_buffer.nbytes,
+            "batch_age": time.time() - batch_started if packet_count else 0,
+            "pending_batches": batch_queue.pending(),
+        }
+
+
+def ingest_status() -> dict:
+    return batch_queue.stats()
+
+
+def db_writer_status() -> dict:
+    return db_writer.stats()
+
+
+def stat_of(stats, key: str):
+    """Metric callback reading one field of a stats() dict"""
+    return lambda: stats()[key]
+
+
+metrics.gauge(
+    "ingest_queue_depth", "Batches waiting for a worker", fn=batch_queue.pending
+)
+metrics.gauge(
+    "ingest_in_progress",
+    "Batches being processed",
+    fn=stat_of(batch_queue.stats, "in_progress"),
+)
+metrics.counter(
+    "ingest_dropped_batches_total",
+    "Batches dropped by the ingest overflow policy",
+    fn=stat_of(batch_queue.stats, "dropped_batches"),
+)
+metrics.counter(
+    "ingest_dropped_packets_total",
+    "Packets in dropped batches",
+    fn=stat_of(batch_queue.stats, "dropped_packets"),
+)
+metrics.gauge(
+    "capture_buffer_packets",
+    "Packets buffered for the next batch",
+    fn=lambda: packet_count,
+)
+metrics.gauge(
+    "capture_buffer_bytes",
+    "Bytes buffered for the next batch",
+    fn=lambda: packet_buffer.nbytes,
+)
+metrics.gauge(
+    "db_pending_documents",
+    "Documents queued for MongoDB",
+    fn=stat_of(db_writer.stats, "pending_documents"),
+)
+metrics.counter(
+    "db_written_documents_total",
+    "Documents written to MongoDB",
+    fn=lambda: db_writer.written,
+)
+metrics.counter(
+    "db_dropped_documents_total",
+    "Documents dropped because the write queue was full",
+    fn=lambda: db_writer.dropped,
+)
+metrics.counter(
+    "db_failed_documents_total",
+    "Documents given up on after retries",
+    fn=lambda: db_writer.failed,
+)
+metrics.gauge(
+    "process_resident_memory_bytes",
+    "Resident memory of the server process",
+    fn=lambda: psutil.Process().memory_info().rss,
+)
+
+
+def total_packet_count() -> int:
+    return captured_packets
+
+
+def reset_total_packet_count():
+    global captured_packets
+    with lock:
+        captured_packets = 0
+
+
+metrics.counter(
+    "packets_captured_total",
+    "Captured packets (reset with the dashboard packet counter)",
+    fn=total_packet_count,
+)
+
+live_feed = LiveFeed(
+    socketio.emit,
+    interval=LIVE_FEED_INTERVAL,
+    max_samples=LIVE_FEED_SAMPLES,
+    total_count=total_packet_count,
+    legacy_events=LIVE_FEED_LEGACY,
+)
+
+
+def add_frame(frame: bytes, ts: float, linktype: int, protocol: int, describe):
+    """Append one captured frame to the current batch, count it on the live
+    feed and close the batch when the policy says so. `describe()` returns the
+    src/dst/protocol/info fields shown in the feed, None for non-IP frames."""
+    global packet_count, batch_started, captured_packets
+
+    batch = None
 
     with lock:
         packet_count += 1
+        if packet_count == 1:
+            batch_started = time.time()
+        captured_packets += 1
 
-        # ✅ increment total_packet_count via setter
-        current_total = get_total_packet_count()
-        set_total_packet_count(current_total + 1)
+        packet_buffer.append(frame, ts, linktype)
 
-        try:
-            if packet.haslayer(IP):
-                vietnam_tz = pytz.timezone("Asia/Ho_Chi_Minh")
-                vn_time = datetime.now(vietnam_tz)
-
-                packet_data = {
-                    "timestamp": vn_time.isoformat(),
-                    "src_ip": packet[IP].src,
-                    "dst_ip": packet[IP].dst,
-                    "protocol": packet[IP].proto,
-                    "length": len(packet),
-                    "info": packet.summary(),
-                    "total_packet_count": get_total_packet_count(),  # ✅ updated
-                }
-
-                socketio.emit("new_packet", packet_data)
+        if batch_policy.should_close(packet_count, time.time() - batch_started):
+            batch = close_batch()
 
-        except Exception as e:
-            logger.error(f"Error emitting packet: {e}")
+    def feed_entry():
+        info = describe()
+        if info is None:
+            return None
+        return {
+            "timestamp": datetime.fromtimestamp(ts, VN_TZ).isoformat(),
+            **info,
+            "length": len(frame),
+        }
+
+    live_feed.record(len(frame), protocol, feed_entry)
+
+    if batch:
+        enqueue_batch(*batch)
+
+
+def handle_packet(packet):
+    """Scapy capture path: the packet is already dissected"""
+    if STREAMING_FLOWS:
+        fields = header_fields(packet)
+        if fields is not None:
+            flow_table.update(fields)
+
+    def describe():
+        if not packet.haslayer(IP):
+            return None
+        return {
+            "src_ip": packet[IP].src,
+            "dst_ip": packet[IP].dst,
+            "protocol": packet[IP].proto,
+            "info": packet.summary(),
+        }
+
+    protocol = packet[IP].proto if packet.haslayer(IP) else None
+    frame = getattr(packet, "original", None) or bytes(packet)
+    add_frame(frame, float(packet.time), linktype_of(packet), protocol, describe)
+
+
+def handle_frame(frame: bytes, ts: float, linktype: int = LINKTYPE_ETHERNET):
+    """Raw capture path (see capture.py): only the IP/TCP/UDP headers are decoded"""
+    decoded = decode_frame(frame, linktype)
+    if decoded is None:
+        add_frame(frame, ts, linktype, None, lambda: None)
+        return
+
+    src, dst, proto, sport, dport, payload, header, flags, l4 = decoded
+    if STREAMING_FLOWS and l4:
+        ts_us = int(round(ts * 1_000_000))
+        flow_table.update(
+            (ts_us, src, dst, sport, dport, proto, payload, header, flags)
+        )
+
+    def describe():
+        name = PROTOCOL_NAMES.get(proto, str(proto))
+        if l4:
+            info = f"IP / {name} {src}:{sport} > {dst}:{dport}"
+        else:
+            info = f"IP / {name} {src} > {dst}"
+        return {"src_ip": src, "dst_ip": dst, "protocol": proto, "info": info}
+
+    add_frame(frame, ts, linktype, proto, describe)
+
+
+def flush_batch():
+    """Close the partially filled batch, e.g. when a pcap replay ends"""
+    with lock:
+        batch = close_batch() if packet_count else None
+    if batch:
+        enqueue_batch(*batch)
+
+
+def start_pipeline():
+    """Create the batch directories and indexes, start the database writer, the
+    batch and capture-side loops, the live feed and the inference pool."""
+    global inference_pool
+
+    dirs = [OUTPUT_DIR, CSV_OUTPUT_DIR, BATCH_DIR, CICFLOWMETER_DIR, MODEL_DIR]
+    for directory in dirs:
+        directory.mkdir(parents=True, exist_ok=True)
+
+    db_writer.start()
+    try:
+        flow_rollups.ensure_indexes()
+    except Exception as e:
+        logger.warning(f"Could not create flow rollup indexes: {e}")
+
+    if INFERENCE_WORKERS > 0:
+        inference_pool = InferencePool(
+            INFERENCE_WORKERS, preload=model_members(get_model())
+        )
 
-        packet_buffer.append(packet)
+    # Batch processing holds the CPU, so the workers are OS threads in every
+    # mode, and so are the loops sharing the capture and queue state with them
+    for i in range(INGEST_WORKERS):
+        start_thread(ingest_worker, f"ingest-{i}")
+    start_thread(ingest_stats_reporter, "ingest-stats")
+    if batch_policy.name != "count":
+        start_thread(batch_timer, "batch-timer")
+    if STREAMING_FLOWS:
+        start_thread(stream_flows, "flow-stream")
 
-        if packet_count >= CHUNK_SIZE:
-            current_buffer = packet_buffer.copy()
-            current_index = file_index
-            file_index += 1
+    live_feed.start()
 
-            packet_buffer.clear()
-            packet_count = 0
 
-            executor.submit(process_packet_batch, current_buffer, current_index)
+# Spawned inference pool workers import the server's main module, and with it
+# this one, but only use the detectors: nothing is started or connected there
+if not WORKER_PROCESS:
+    start_pipeline()
@@ -0,0 +1,110 @@
+"""Process pool running the anomaly detectors outside the server process.
+
+Each worker process loads a model from Model/ once, at start-up for the
+models passed as `preload` and otherwise on first use, and keeps it until a
+request names another version of the model (see model_registry.py). Feature
+matrices are handed over through shared memory, so only the block name, shape
+and column names are pickled per request. Model inference then no longer
+competes for the GIL with the sniffer, the batch workers and the Flask/Socket.IO
+threads.
+"""
+
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from async_runtime import submit_in_hub
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(preload: tuple):
+    import detectors
+
+    for name in preload:
+        detectors.registry.load(name)
+
+
+def _validate(model: str, version: str):
+    import detectors
+
+    detectors.registry.deploy(model, version, background=False, persist=False)
+
+
+def _score(
+    model: str, version: str, shm_name: str, shape: tuple, dtype: str, columns: list
+):
+    import detectors
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        data = np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+    bundle = detectors.registry.get(model, version)
+    return detectors.run_detection(model, pd.DataFrame(data, columns=columns), bundle)
+
+
+class InferencePool:
+    def __init__(self, workers: int, preload: tuple = ()):
+        self.workers = workers
+        # spawn: forking a process that already runs TensorFlow and threads is unsafe
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(tuple(preload),),
+        )
+        # Start the pool's management thread from here: in gevent mode it is a
+        # greenlet of the event loop, and the batch worker threads submit
+        # through the event loop rather than touching the pool's gevent locks
+        self._executor.submit(int)
+        logger.info(f"Started inference pool with {workers} worker processes")
+
+    def submit(self, model: str, features: pd.DataFrame, version: str = None) -> Future:
+        """Score `features` with `model` (the worker's active version unless
+        `version` is given) in a worker process."""
+        data = np.ascontiguousarray(features.to_numpy())
+        if data.dtype == object:
+            data = data.astype(np.float64)
+        shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+        try:
+            np.ndarray(data.shape, dtype=data.dtype, buffer=shm.buf)[...] = data
+            future = submit_in_hub(
+                self._executor.submit,
+                _score,
+                model,
+                version,
+                shm.name,
+                data.shape,
+                data.dtype.str,
+                list(features.columns),
+            )
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+
+        def release(_):
+            shm.close()
+            shm.unlink()
+
+        future.add_done_callback(release)
+        return future
+
+    def validate(self, model: str, version: str):
+        """Load and warm up `version` of `model` in a worker; raises if it is
+        unusable. The other workers load it when a request names it."""
+        submit_in_hub(self._executor.submit, _validate, model, version).result()
+
+    def predict(
+        self, model: str, features: pd.DataFrame, version: str = None
+    ) -> np.ndarray:
+        return self.submit(model, features, version).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
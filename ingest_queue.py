@@ -0,0 +1,110 @@
+"""Bounded batch queue between the sniffer and the batch workers.
+
+When the queue is full, the overflow mode decides what happens to a new batch:
+
+- block:       the producer (sniffer) waits for space, applying backpressure
+- drop_oldest: the oldest queued batch is discarded to make room
+- drop_newest: the new batch is discarded
+- sample:      the new batch replaces a random queued batch with probability
+               `sample_rate`, so the queue keeps a sample spread over the burst
+"""
+
+import random
+import time
+from collections import deque
+
+from async_runtime import native_threading
+
+OVERFLOW_MODES = ("block", "drop_oldest", "drop_newest", "sample")
+
+
+class BatchQueue:
+    def __init__(self, maxsize: int = 8, overflow: str = "block", sample_rate: float = 0.5):
+        if overflow not in OVERFLOW_MODES:
+            raise ValueError(f"Unknown overflow mode: {overflow}")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.sample_rate = sample_rate
+
+        self._items = deque()
+        self._cond = native_threading.Condition()
+        self.in_progress = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped_batches = 0
+        self.dropped_packets = 0
+        self.blocked_seconds = 0.0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+
+    def put(self, item, size: int = 0) -> bool:
+        """Enqueue `item` (holding `size` packets); returns False if it was dropped."""
+        entry = (time.time(), item, size)
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                if self.overflow == "block":
+                    started = time.perf_counter()
+                    while len(self._items) >= self.maxsize:
+                        self._cond.wait()
+                    self.blocked_seconds += time.perf_counter() - started
+                elif self.overflow == "drop_oldest":
+                    self._drop(self._items.popleft())
+                elif self.overflow == "drop_newest":
+                    self._drop(entry)
+                    return False
+                else:
+                    if random.random() >= self.sample_rate:
+                        self._drop(entry)
+                        return False
+                    victim = random.randrange(len(self._items))
+                    self._drop(self._items[victim])
+                    del self._items[victim]
+
+            self._items.append(entry)
+            self.enqueued += 1
+            self._cond.notify_all()
+            return True
+
+    def get(self):
+        """Block until a batch is available and return it."""
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            enqueued_at, item, _ = self._items.popleft()
+            self.in_progress += 1
+            self.last_wait = time.time() - enqueued_at
+            self.max_wait = max(self.max_wait, self.last_wait)
+            self._cond.notify_all()
+            return item
+
+    def task_done(self):
+        with self._cond:
+            self.in_progress -= 1
+            self.processed += 1
+
+    def pending(self) -> int:
+        """Queued plus in-progress batches"""
+        with self._cond:
+            return len(self._items) + self.in_progress
+
+    def _drop(self, entry):
+        self.dropped_batches += 1
+        self.dropped_packets += entry[2]
+
+    def stats(self) -> dict:
+        with self._cond:
+            oldest = self._items[0][0] if self._items else None
+            return {
+                "depth": len(self._items),
+                "maxsize": self.maxsize,
+                "overflow": self.overflow,
+                "in_progress": self.in_progress,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "dropped_batches": self.dropped_batches,
+                "dropped_packets": self.dropped_packets,
+                "blocked_seconds": round(self.blocked_seconds, 3),
+                "lag": round(time.time() - oldest, 3) if oldest else 0,
+                "last_wait": round(self.last_wait, 3),
+                "max_wait": round(self.max_wait, 3),
+            }
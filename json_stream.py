@@ -0,0 +1,77 @@
+"""Streamed JSON and NDJSON response bodies.
+
+Documents and flow tables are encoded once, in chunks, while the response is
+being sent, instead of being collected into a list, converted to plain JSON
+types and dumped again. MongoDB documents keep the extended JSON form the
+dashboard reads ({"$oid": ...}, {"$date": ...}).
+"""
+
+import json
+import logging
+
+import pandas as pd
+from bson import json_util
+
+logger = logging.getLogger(__name__)
+
+# Rows or documents encoded per chunk of the response body
+CHUNK_SIZE = 1000
+
+MIMETYPES = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+
+def response_format(args) -> str:
+    """`format` query parameter (json or ndjson); raises ValueError otherwise."""
+    fmt = args.get("format", "json")
+    if fmt not in MIMETYPES:
+        raise ValueError(f"Unknown format: {fmt}")
+    return fmt
+
+
+def document_chunks(documents, chunk_size: int = CHUNK_SIZE):
+    """Lists of up to `chunk_size` extended-JSON encoded documents."""
+    chunk = []
+    for doc in documents:
+        chunk.append(json_util.dumps(doc))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def frame_chunks(df: pd.DataFrame, chunk_size: int = CHUNK_SIZE):
+    """Lists of up to `chunk_size` JSON encoded rows of `df`."""
+    for start in range(0, len(df), chunk_size):
+        lines = df.iloc[start : start + chunk_size].to_json(
+            orient="records", lines=True, double_precision=15
+        )
+        yield lines.rstrip("\n").split("\n")
+
+
+def json_body(chunks, key: str, fields: dict = None):
+    """{"<key>": [items...], **fields} produced chunk by chunk."""
+    try:
+        yield f'{{"{key}": ['
+        first = True
+        for chunk in chunks:
+            yield ("" if first else ",") + ",".join(chunk)
+            first = False
+        yield "]"
+        for name, value in (fields or {}).items():
+            yield f", {json.dumps(name)}: {json.dumps(value)}"
+        yield "}"
+    except Exception as e:
+        # The status line is already sent; the client sees a truncated body
+        logger.error(f"Failed to stream {key}: {e}")
+        raise
+
+
+def ndjson_body(chunks):
+    """One item per line."""
+    try:
+        for chunk in chunks:
+            yield "\n".join(chunk) + "\n"
+    except Exception as e:
+        logger.error(f"Failed to stream NDJSON: {e}")
+        raise
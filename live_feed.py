@@ -0,0 +1,142 @@
+"""Throttled live packet feed for the dashboard.
+
+The capture path only calls LiveFeed.record() per packet: a few counter
+increments and a reservoir-sampling decision under the feed's own small lock.
+Packet details are rendered only for the packets kept in the sample. Every
+`interval` seconds a publisher thread emits one "packet_feed" event with the
+sampled packets, the interval's packet/byte/protocol counters and rates.
+
+Clients are broadcast to through the "feed" room. A client that sends its own
+sampling ratio (see configure_client) leaves the room and gets its own,
+further subsampled, copy of each event.
+"""
+
+import logging
+import random
+import time
+from datetime import datetime
+
+import pytz
+
+from async_runtime import native_sleep, native_threading, start_thread
+
+logger = logging.getLogger(__name__)
+
+FEED_ROOM = "feed"
+VN_TZ = pytz.timezone("Asia/Ho_Chi_Minh")
+PROTOCOL_NAMES = {1: "ICMP", 6: "TCP", 17: "UDP"}
+
+
+class LiveFeed:
+    def __init__(
+        self,
+        emit,
+        interval: float = 0.25,
+        max_samples: int = 20,
+        total_count=None,
+        legacy_events: bool = False,
+    ):
+        """`emit(event, data, to=...)` sends a Socket.IO event; `total_count()`
+        returns the running total packet count included in every event."""
+        self.emit = emit
+        self.interval = interval
+        self.max_samples = max_samples
+        self.total_count = total_count or (lambda: None)
+        self.legacy_events = legacy_events
+        self.clients = {}
+        self._lock = native_threading.Lock()
+        self._reset()
+        self._last_count = 0
+        self._last_tick = time.time()
+
+    def _reset(self):
+        self._count = 0
+        self._bytes = 0
+        self._protocols = {"TCP": 0, "UDP": 0, "ICMP": 0, "Other": 0}
+        self._samples = []
+
+    def record(self, length: int, protocol: int, describe):
+        """Count one captured packet; `describe()` renders its feed entry (None
+        for frames not shown in the feed) and is only called when the packet is
+        kept in this interval's sample."""
+        with self._lock:
+            self._count += 1
+            self._bytes += length
+            self._protocols[PROTOCOL_NAMES.get(protocol, "Other")] += 1
+
+            # Reservoir sampling: every packet of the interval is equally likely
+            if len(self._samples) < self.max_samples:
+                self._samples.append(describe())
+            else:
+                slot = random.randrange(self._count)
+                if slot < self.max_samples:
+                    self._samples[slot] = describe()
+
+    def configure_client(
+        self, sid: str, sample_ratio: float = 1.0, max_samples: int = None
+    ):
+        self.clients[sid] = {
+            "sample_ratio": min(max(float(sample_ratio), 0.0), 1.0),
+            "max_samples": max_samples,
+        }
+
+    def remove_client(self, sid: str):
+        self.clients.pop(sid, None)
+
+    def snapshot(self) -> dict:
+        """Take this interval's counters and samples and start a new interval."""
+        now = time.time()
+        with self._lock:
+            count, size = self._count, self._bytes
+            protocols = self._protocols
+            samples = [s for s in self._samples if s is not None]
+            self._reset()
+        elapsed = max(now - self._last_tick, 1e-9)
+        self._last_tick = now
+        return {
+            "timestamp": datetime.fromtimestamp(now, VN_TZ).isoformat(),
+            "interval": round(elapsed, 3),
+            "count": count,
+            "bytes": size,
+            "pps": round(count / elapsed, 1),
+            "bps": round(size * 8 / elapsed, 1),
+            "protocols": protocols,
+            "packets": samples,
+            "total_packet_count": self.total_count(),
+        }
+
+    def publish(self):
+        feed = self.snapshot()
+        if not feed["count"] and not self._last_count:
+            return  # idle; the previous event already reported zero rates
+        self._last_count = feed["count"]
+
+        self.emit("packet_feed", feed, to=FEED_ROOM)
+        if self.legacy_events:
+            for packet in feed["packets"]:
+                self.emit(
+                    "new_packet",
+                    {**packet, "total_packet_count": feed["total_packet_count"]},
+                    to=FEED_ROOM,
+                )
+
+        for sid, config in list(self.clients.items()):
+            packets = [
+                p for p in feed["packets"] if random.random() < config["sample_ratio"]
+            ]
+            if config["max_samples"] is not None:
+                packets = packets[: config["max_samples"]]
+            self.emit("packet_feed", {**feed, "packets": packets}, to=sid)
+
+    def run(self):
+        while True:
+            native_sleep(self.interval)
+            try:
+                self.publish()
+            except Exception as e:
+                logger.error(f"Live feed publish failed: {e}")
+
+    def start(self):
+        # Native thread, like the capture thread that feeds record()
+        start_thread(self.run, "live-feed")
+        return self
@@ -0,0 +1,208 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are registered on a MetricsRegistry and
+rendered by `render()` for the /metrics endpoint. Values another component
+already keeps (ingest queue, DB writer, capture buffers) are registered with a
+callback and read at scrape time rather than counted twice.
+
+StageTimer times the stages of one batch (pcap write, flow extraction,
+scoring, ...) into a histogram labelled by stage and keeps the durations for
+the batch document.
+"""
+
+import logging
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from async_runtime import native_threading
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; CICFlowMeter runs on large batches take tens of seconds
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (
+        str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for v in values
+    )
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=(), fn=None):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # Read at scrape time instead of the recorded values
+        self.fn = fn
+        self._values = {}
+        self._lock = native_threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(
+                f"{self.name} takes labels {self.labels}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> list:
+        """(name, label names, label values, value) of every series."""
+        if self.fn is not None:
+            return [(self.name, (), (), self.fn())]
+        with self._lock:
+            return [
+                (self.name, self.labels, key, value)
+                for key, value in self._values.items()
+            ]
+
+    def render(self) -> list:
+        try:
+            samples = self.samples()
+        except Exception as e:
+            logger.warning(f"Could not collect metric {self.name}: {e}")
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, names, values, value in samples:
+            if value is not None:
+                labels = _format_labels(names, values)
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                }
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+
+    def samples(self) -> list:
+        with self._lock:
+            series = [
+                (key, list(s["counts"]), s["sum"]) for key, s in self._values.items()
+            ]
+        samples = []
+        bucket_labels = self.labels + ("le",)
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = _format_value(float(bound))
+                samples.append(
+                    (f"{self.name}_bucket", bucket_labels, key + (le,), cumulative)
+                )
+            samples.append((f"{self.name}_sum", self.labels, key, total))
+            samples.append((f"{self.name}_count", self.labels, key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = native_threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels=(), fn=None) -> Counter:
+        return self._register(Counter(self.prefix + name, help, labels, fn))
+
+    def gauge(self, name: str, help: str, labels=(), fn=None) -> Gauge:
+        return self._register(Gauge(self.prefix + name, help, labels, fn))
+
+    def histogram(
+        self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Wall time of the stages of one batch. Each stage is observed into
+    `histogram` (labelled stage=<name> plus `labels`) as it ends."""
+
+    def __init__(self, histogram: Histogram = None, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            if self.histogram is not None:
+                self.histogram.observe(seconds, stage=name, **self.labels)
+
+    def record(self) -> dict:
+        """Milliseconds per stage so far, and the total since the timer started."""
+        return {
+            **{name: round(s * 1000, 2) for name, s in self.stages.items()},
+            "total": round((time.perf_counter() - self.started) * 1000, 2),
+        }
@@ -0,0 +1,263 @@
+"""Lazy, versioned registry of the detection models.
+
+A model (with its scaler and extra artefacts) is loaded the first time it is
+used, or when it is selected, and warmed up on a dummy batch so the first real
+batch does not pay one-off initialisation costs. Models that are no longer
+selected can be unloaded. Load/warm-up time and the RSS growth observed while
+loading are kept per model.
+
+Versions live next to the original files:
+
+    Model/                          version "base"
+    Model/versions/<model>/<version>/   same file names as in Model/
+
+deploy() loads and validates a new version in the background and then swaps
+it in atomically. Callers take the bundle once per batch with get(), so a
+batch already in flight finishes on the version it started with. The active
+version per model is persisted in Model/active_versions.json.
+"""
+
+import gc
+import json
+import logging
+import time
+from pathlib import Path
+
+import psutil
+
+from async_runtime import native_threading, start_thread
+
+logger = logging.getLogger(__name__)
+
+BASE_VERSION = "base"
+
+
+class ModelRegistry:
+    def __init__(self, loaders: dict, root: Path, warmup=None):
+        """`loaders` maps a model name to a function loading its bundle (a dict
+        with at least "model") from a model directory; `warmup(name, bundle)`
+        runs a dummy prediction and returns False if the bundle is unusable."""
+        self.loaders = loaders
+        self.root = Path(root)
+        self.warmup = warmup
+        self._bundles = {}
+        self._stats = {name: {"loaded": False} for name in loaders}
+        self._deployments = {}
+        self._locks = {name: native_threading.Lock() for name in loaders}
+        self._process = psutil.Process()
+        self._state_file = self.root / "active_versions.json"
+        self._active = {name: BASE_VERSION for name in loaders}
+        self._active.update(self._read_active_versions())
+
+    # ---- lookup -------------------------------------------------------------
+
+    def get(self, name: str, version: str = None) -> dict:
+        """Return the active bundle for `name`, loading it on first use.
+
+        With `version`, make sure that version is the active one first (used by
+        inference workers to follow the version chosen in the main process).
+        """
+        bundle = self._bundles.get(name)
+        if bundle is not None and version in (None, bundle["version"]):
+            return bundle
+        if version is not None and version != self._active.get(name):
+            return self.deploy(name, version, background=False, persist=False)
+        return self.load(name)
+
+    def active_version(self, name: str) -> str:
+        return self._active[name]
+
+    def pin(self, name: str) -> dict:
+        """Name and active version of `name` without loading it, for callers
+        whose models run in another process."""
+        if name not in self.loaders:
+            raise ValueError(f"Unknown model: {name}")
+        return {"name": name, "version": self._active[name]}
+
+    def versions(self, name: str) -> list:
+        versions_dir = self.root / "versions" / name
+        if not versions_dir.is_dir():
+            return [BASE_VERSION]
+        return [BASE_VERSION] + sorted(p.name for p in versions_dir.iterdir() if p.is_dir())
+
+    def version_dir(self, name: str, version: str) -> Path:
+        if version == BASE_VERSION:
+            return self.root
+        path = self.root / "versions" / name / version
+        if not path.is_dir():
+            raise ValueError(f"Unknown version {version} for model {name}")
+        return path
+
+    # ---- loading ------------------------------------------------------------
+
+    def _build(self, name: str, version: str) -> dict:
+        """Load and warm up one version of a model without installing it."""
+        rss_before = self._process.memory_info().rss
+        started = time.perf_counter()
+        bundle = self.loaders[name](self.version_dir(name, version))
+        bundle["name"] = name
+        bundle["version"] = version
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        if self.warmup is not None and self.warmup(name, bundle) is False:
+            raise ValueError(f"Model {name} version {version} failed validation")
+        warmup_seconds = time.perf_counter() - started
+
+        bundle["stats"] = {
+            "loaded": True,
+            "version": version,
+            "load_seconds": round(load_seconds, 4),
+            "warmup_seconds": round(warmup_seconds, 4),
+            "rss_delta_bytes": self._process.memory_info().rss - rss_before,
+            "loaded_at": time.time(),
+        }
+        logger.info(
+            f"Loaded model {name} version {version} in {load_seconds:.3f}s "
+            f"(warm-up {warmup_seconds:.3f}s)"
+        )
+        return bundle
+
+    def load(self, name: str) -> dict:
+        if name not in self.loaders:
+            raise ValueError(f"Unknown model: {name}")
+
+        with self._locks[name]:
+            bundle = self._bundles.get(name)
+            if bundle is not None:
+                return bundle
+            bundle = self._build(name, self._active[name])
+            self._bundles[name] = bundle
+            self._stats[name] = bundle["stats"]
+            return bundle
+
+    def deploy(
+        self,
+        name: str,
+        version: str,
+        background: bool = True,
+        persist: bool = True,
+        validate=None,
+    ):
+        """Load and validate `version` of `name`, then swap it in atomically.
+
+        In the background the call returns immediately; progress is reported by
+        deployments(). Otherwise the new bundle is returned (or the error raised).
+        With `persist`, the version stays active across restarts. With
+        `validate(name, version)`, loading and validation happen there (e.g. in
+        an inference worker) and only the active version changes here.
+        """
+        if name not in self.loaders:
+            raise ValueError(f"Unknown model: {name}")
+        self.version_dir(name, version)  # fail fast on unknown versions
+
+        def run():
+            self._deployments[name] = {"version": version, "state": "loading"}
+            try:
+                if validate is None:
+                    bundle = self._build(name, version)
+                else:
+                    validate(name, version)
+                    bundle = None
+            except Exception as e:
+                self._deployments[name] = {
+                    "version": version,
+                    "state": "failed",
+                    "error": str(e),
+                }
+                logger.error(f"Deploying model {name} version {version} failed: {e}")
+                raise
+
+            with self._locks[name]:
+                previous = self._active[name]
+                if bundle is not None:
+                    self._bundles[name] = bundle
+                    self._stats[name] = bundle["stats"]
+                elif self._bundles.pop(name, None) is not None:
+                    self._stats[name] = {**self._stats[name], "loaded": False}
+                self._active[name] = version
+                if persist:
+                    self._write_active_versions()
+            self._deployments[name] = {
+                "version": version,
+                "state": "active",
+                "previous": previous,
+                "swapped_at": time.time(),
+            }
+            logger.info(f"Model {name} now serving version {version}")
+            return bundle
+
+        if not background:
+            return run()
+
+        def run_logged():
+            try:
+                run()
+            except Exception:
+                pass  # already recorded in deployments()
+
+        start_thread(run_logged, f"deploy-{name}")
+        return None
+
+    def unload(self, name: str):
+        with self._locks[name]:
+            if self._bundles.pop(name, None) is None:
+                return
+            self._stats[name] = {**self._stats[name], "loaded": False}
+        gc.collect()
+        logger.info(f"Unloaded model {name}")
+
+    def select(self, name: str, keep: tuple = ()) -> dict:
+        """Load `name` and unload every other model not listed in `keep`."""
+        bundle = self.load(name)
+        for other in self.loaders:
+            if other != name and other not in keep:
+                self.unload(other)
+        return bundle
+
+    def loaded(self) -> list:
+        return list(self._bundles)
+
+    # ---- reporting / persistence -------------------------------------------
+
+    def deployments(self) -> dict:
+        return {
+            name: {
+                "active": self._active[name],
+                "available": self.versions(name),
+                "deployment": self._deployments.get(name),
+            }
+            for name in self.loaders
+        }
+
+    def stats(self) -> dict:
+        return {
+            "models": {
+                name: {**stats, "active_version": self._active[name]}
+                for name, stats in self._stats.items()
+            },
+            "rss_bytes": self._process.memory_info().rss,
+        }
+
+    def _read_active_versions(self) -> dict:
+        try:
+            with open(self._state_file, encoding="utf-8") as f:
+                active = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Could not read {self._state_file}: {e}")
+            return {}
+
+        valid = {}
+        for name, version in active.items():
+            if name in self.loaders and version in self.versions(name):
+                valid[name] = version
+        return valid
+
+    def _write_active_versions(self):
+        try:
+            with open(self._state_file, "w", encoding="utf-8") as f:
+                json.dump(self._active, f, indent=2)
+        except Exception as e:
+            logger.warning(f"Could not write {self._state_file}: {e}")
@@ -22,13 +22,3 @@ all_predictions = []
 sniff_thread = None
 sniff_control = Event()
 is_sniffing = False
-total_packet_count = 0
-
-
-def get_total_packet_count():
-    return total_packet_count
-
-
-def set_total_packet_count(val):
-    global total_packet_count
-    total_packet_count = val
@@ -0,0 +1,385 @@
+"""Compact packet records for the capture pipeline.
+
+Instead of keeping a Scapy Packet object per captured frame, the sniffer path
+appends the raw frame bytes to a preallocated, reused PacketBuffer. Closing a
+batch hands a PacketRecords object to the workers: all frames back to back in
+one bytes object plus NumPy arrays of offsets, lengths, timestamps and link
+types. Header fields are decoded lazily, for the whole batch at once, into a
+NumPy structured array (HEADER_DTYPE); a Scapy packet is only built again
+when a record is indexed or iterated.
+"""
+
+import logging
+import socket
+import struct
+
+import numpy as np
+from scapy.all import conf
+
+logger = logging.getLogger(__name__)
+
+# pcap link types with the size of the link-layer header in front of IP
+LINKTYPE_NULL = 0  # 4-byte address family, host byte order
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108  # 4-byte address family, network byte order
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = 0x8100
+AF_INET6_VALUES = (10, 24, 28, 30)  # Linux, BSDs and macOS values in loopback headers
+
+PCAP_MAGIC = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+SNAPLEN = 65535
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("ts", "i8"),  # capture time, µs
+        ("length", "u4"),  # frame length
+        ("ip", "?"),  # IPv4 packet
+        ("ip6", "?"),  # IPv6 packet
+        ("l4", "?"),  # IPv4 TCP or UDP with a complete transport header
+        ("proto", "u1"),  # IPv4 protocol / IPv6 next header
+        ("tcp", "?"),  # TCP over IPv4 or IPv6
+        ("src", "u4"),
+        ("dst", "u4"),
+        ("sport", "u2"),
+        ("dport", "u2"),
+        ("payload", "i4"),  # transport payload bytes, from the IP total length
+        ("header", "u2"),  # transport header bytes
+        ("flags", "u1"),  # TCP flags (IPv4 and IPv6)
+    ]
+)
+
+
+def linktype_of(packet) -> int:
+    return conf.l2types.layer2num.get(type(packet), LINKTYPE_ETHERNET)
+
+
+def parse_headers(data, offsets, lengths, ts_us, linktypes) -> np.ndarray:
+    """Decode the IPv4/TCP/UDP header fields of every frame with array gathers."""
+    n = len(offsets)
+    out = np.zeros(n, dtype=HEADER_DTYPE)
+    out["ts"] = ts_us
+    out["length"] = lengths
+    if n == 0:
+        return out
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    last = len(buf) - 1
+
+    def u8(pos):
+        return buf[np.clip(pos, 0, last)].astype(np.int64)
+
+    def u16(pos):
+        return (u8(pos) << 8) | u8(pos + 1)
+
+    def u32(pos):
+        return (u16(pos) << 16) | u16(pos + 2)
+
+    offsets = offsets.astype(np.int64)
+    end = offsets + lengths
+
+    # Link layer: where the IP header starts and whether it carries IPv4
+    eth = linktypes == LINKTYPE_ETHERNET
+    ethertype = u16(offsets + 12)
+    vlan = eth & (ethertype == ETHERTYPE_VLAN)
+    ethertype = np.where(vlan, u16(offsets + 16), ethertype)
+    sll = linktypes == LINKTYPE_LINUX_SLL
+    loop = (linktypes == LINKTYPE_NULL) | (linktypes == LINKTYPE_LOOP)
+    raw = (linktypes == LINKTYPE_RAW) | (linktypes == LINKTYPE_IPV4)
+
+    l3 = offsets.copy()
+    l3[eth] += 14 + 4 * vlan[eth]
+    l3[sll] += 16
+    l3[loop] += 4
+    sll_type = u16(offsets + 14)
+    family = np.where(u8(offsets) == 0, u8(offsets + 3), u8(offsets))
+    ip = (
+        (eth & (ethertype == ETHERTYPE_IPV4))
+        | (sll & (sll_type == ETHERTYPE_IPV4))
+        | (loop & (family == 2))
+        | raw
+    )
+    ip6 = (
+        (eth & (ethertype == ETHERTYPE_IPV6))
+        | (sll & (sll_type == ETHERTYPE_IPV6))
+        | (loop & np.isin(family, AF_INET6_VALUES))
+        | raw
+    )
+
+    # IPv4
+    version_ihl = u8(l3)
+    ip &= ((version_ihl >> 4) == 4) & (l3 + 20 <= end)
+    ip6 &= ((version_ihl >> 4) == 6) & (l3 + 40 <= end)
+    ihl = (version_ihl & 0x0F) * 4
+    proto = u8(l3 + 9)
+    first_fragment = (u16(l3 + 6) & 0x1FFF) == 0
+
+    # TCP / UDP
+    l4 = l3 + ihl
+    tcp = ip & first_fragment & (proto == 6) & (l4 + 20 <= end)
+    udp = ip & first_fragment & (proto == 17) & (l4 + 8 <= end)
+    transport = tcp | udp
+    header = np.where(tcp, (u8(l4 + 12) >> 4) * 4, np.where(udp, 8, 0))
+
+    # IPv6 fixed header only (no extension header walk): protocol and TCP flags
+    next_header = u8(l3 + 6)
+    tcp6 = ip6 & (next_header == 6) & (l3 + 60 <= end)
+
+    out["ip"] = ip
+    out["ip6"] = ip6
+    out["l4"] = transport
+    out["proto"] = np.where(ip, proto, np.where(ip6, next_header, 0))
+    out["tcp"] = tcp | tcp6
+    out["src"] = np.where(ip, u32(l3 + 12), 0)
+    out["dst"] = np.where(ip, u32(l3 + 16), 0)
+    out["sport"] = np.where(transport, u16(l4), 0)
+    out["dport"] = np.where(transport, u16(l4 + 2), 0)
+    out["payload"] = np.where(transport, np.maximum(u16(l3 + 2) - ihl - header, 0), 0)
+    out["header"] = header
+    out["flags"] = np.where(tcp, u8(l4 + 13), np.where(tcp6, u8(l3 + 53), 0))
+    return out
+
+
+def decode_frame(frame: bytes, linktype: int = LINKTYPE_ETHERNET):
+    """Scalar counterpart of parse_headers for one frame.
+
+    Returns (src, dst, proto, sport, dport, payload, header, flags, l4) with
+    dotted-quad addresses, or None when the frame does not carry IPv4.
+    """
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            ethertype = int.from_bytes(frame[12:14], "big")
+            l3 = 14
+            if ethertype == ETHERTYPE_VLAN:
+                ethertype = int.from_bytes(frame[16:18], "big")
+                l3 = 18
+            if ethertype != ETHERTYPE_IPV4:
+                return None
+        elif linktype == LINKTYPE_LINUX_SLL:
+            if int.from_bytes(frame[14:16], "big") != ETHERTYPE_IPV4:
+                return None
+            l3 = 16
+        elif linktype in (LINKTYPE_NULL, LINKTYPE_LOOP):
+            if 2 not in (frame[0], frame[3]):
+                return None
+            l3 = 4
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4):
+            l3 = 0
+        else:
+            return None
+
+        version_ihl, _, ip_len, _, fragment, _, proto = struct.unpack_from(
+            "!BBHHHBB", frame, l3
+        )
+        if version_ihl >> 4 != 4:
+            return None
+        src = socket.inet_ntoa(frame[l3 + 12 : l3 + 16])
+        dst = socket.inet_ntoa(frame[l3 + 16 : l3 + 20])
+    except (IndexError, struct.error, OSError):
+        return None
+
+    ihl = (version_ihl & 0x0F) * 4
+    l4 = l3 + ihl
+    first_fragment = fragment & 0x1FFF == 0
+    if first_fragment and proto == 6 and len(frame) >= l4 + 20:
+        sport, dport = struct.unpack_from("!HH", frame, l4)
+        header = (frame[l4 + 12] >> 4) * 4
+        flags = frame[l4 + 13]
+    elif first_fragment and proto == 17 and len(frame) >= l4 + 8:
+        sport, dport = struct.unpack_from("!HH", frame, l4)
+        header = 8
+        flags = 0
+    else:
+        return src, dst, proto, 0, 0, 0, 0, 0, False
+    payload = max(ip_len - ihl - header, 0)
+    return src, dst, proto, sport, dport, payload, header, flags, True
+
+
+def ip_strings(addresses: np.ndarray) -> np.ndarray:
+    """Dotted-quad strings for IPv4 addresses stored as integers."""
+    return np.array(
+        [
+            f"{a >> 24}.{(a >> 16) & 255}.{(a >> 8) & 255}.{a & 255}"
+            for a in addresses.astype(np.int64).tolist()
+        ],
+        dtype=object,
+    )
+
+
+class PacketRecords:
+    """One batch of captured frames, stored compactly."""
+
+    def __init__(self, data: bytes, offsets, lengths, ts_us, linktypes):
+        self.data = data
+        self.offsets = offsets
+        self.lengths = lengths
+        self.ts_us = ts_us
+        self.linktypes = linktypes
+        self._headers = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + sum(
+            a.nbytes for a in (self.offsets, self.lengths, self.ts_us, self.linktypes)
+        )
+
+    @property
+    def headers(self) -> np.ndarray:
+        """Decoded header fields (HEADER_DTYPE), parsed on first access."""
+        if self._headers is None:
+            self._headers = parse_headers(
+                self.data, self.offsets, self.lengths, self.ts_us, self.linktypes
+            )
+        return self._headers
+
+    def frame(self, i: int) -> bytes:
+        start = int(self.offsets[i])
+        return self.data[start : start + int(self.lengths[i])]
+
+    def packet(self, i: int):
+        """Dissect record `i` into a Scapy packet."""
+        layer = conf.l2types.num2layer.get(int(self.linktypes[i]), conf.raw_layer)
+        pkt = layer(self.frame(i))
+        pkt.time = int(self.ts_us[i]) / 1_000_000
+        return pkt
+
+    def __getitem__(self, i: int):
+        return self.packet(range(len(self))[i])
+
+    def __iter__(self):
+        return (self.packet(i) for i in range(len(self)))
+
+
+class PacketBuffer:
+    """Preallocated buffer collecting the raw frames of the batch being filled.
+
+    The storage is reused from batch to batch and only grows (by doubling) when
+    a batch outgrows it; take() copies the filled part out as PacketRecords.
+    """
+
+    def __init__(self, capacity: int = 5000, frame_bytes: int = 1536):
+        self._data = bytearray(capacity * frame_bytes)
+        self._offsets = np.empty(capacity, dtype=np.int64)
+        self._lengths = np.empty(capacity, dtype=np.uint32)
+        self._ts = np.empty(capacity, dtype=np.int64)
+        self._linktypes = np.empty(capacity, dtype=np.uint16)
+        self._count = 0
+        self._used = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return self._used
+
+    def append(self, frame: bytes, ts: float, linktype: int = LINKTYPE_ETHERNET):
+        size = len(frame)
+        if self._used + size > len(self._data):
+            self._data.extend(bytes(max(len(self._data), size)))
+        if self._count == len(self._offsets):
+            self._grow()
+
+        i = self._count
+        self._data[self._used : self._used + size] = frame
+        self._offsets[i] = self._used
+        self._lengths[i] = size
+        self._ts[i] = int(round(float(ts) * 1_000_000))
+        self._linktypes[i] = linktype
+        self._count += 1
+        self._used += size
+
+    def _grow(self):
+        capacity = len(self._offsets) * 2
+        for name in ("_offsets", "_lengths", "_ts", "_linktypes"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def take(self) -> PacketRecords:
+        """Return the buffered frames as PacketRecords and start a new batch."""
+        n = self._count
+        records = PacketRecords(
+            bytes(memoryview(self._data)[: self._used]),
+            self._offsets[:n].copy(),
+            self._lengths[:n].copy(),
+            self._ts[:n].copy(),
+            self._linktypes[:n].copy(),
+        )
+        self._count = 0
+        self._used = 0
+        return records
+
+
+def read_pcap(path):
+    """Yield (frame, ts, linktype) from a classic pcap file without dissecting
+    the frames. pcapng files are not supported."""
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 24:
+            raise ValueError(f"{path} is not a pcap file")
+        for endian in ("<", ">"):
+            magic = struct.unpack(endian + "I", header[:4])[0]
+            if magic in (PCAP_MAGIC, PCAP_MAGIC_NS):
+                break
+        else:
+            raise ValueError(f"{path} is not a classic pcap file (pcapng is not supported)")
+
+        divisor = 1_000_000 if magic == PCAP_MAGIC else 1_000_000_000
+        linktype = struct.unpack(endian + "I", header[20:24])[0] & 0x0FFFFFFF
+        record = struct.Struct(endian + "IIII")
+        while True:
+            head = f.read(16)
+            if len(head) < 16:
+                return
+            sec, frac, incl, _ = record.unpack(head)
+            frame = f.read(incl)
+            if len(frame) < incl:
+                return
+            yield frame, sec + frac / divisor, linktype
+
+
+def write_pcap(path, records: PacketRecords) -> int:
+    """Write the records as a classic pcap file; returns the number written.
+
+    A pcap file has a single link type, so records with another link type than
+    the first one are skipped.
+    """
+    linktype = int(records.linktypes[0]) if len(records) else LINKTYPE_ETHERNET
+    keep = np.flatnonzero(records.linktypes == linktype)
+    if len(keep) < len(records):
+        logger.warning(
+            f"Skipping {len(records) - len(keep)} records with another link type "
+            f"than {linktype} in {path}"
+        )
+
+    ts = records.ts_us[keep]
+    lengths = records.lengths[keep]
+    record_headers = np.empty(
+        len(keep), dtype=[("sec", "<u4"), ("usec", "<u4"), ("incl", "<u4"), ("orig", "<u4")]
+    )
+    record_headers["sec"] = ts // 1_000_000
+    record_headers["usec"] = ts % 1_000_000
+    record_headers["incl"] = lengths
+    record_headers["orig"] = lengths
+
+    data = memoryview(records.data)
+    chunks = [struct.pack("<IHHiIII", PCAP_MAGIC, 2, 4, 0, 0, SNAPLEN, linktype)]
+    for header, start, size in zip(
+        record_headers, records.offsets[keep].tolist(), lengths.tolist()
+    ):
+        chunks.append(header.tobytes())
+        chunks.append(data[start : start + size])
+
+    with open(path, "wb") as f:
+        f.writelines(chunks)
+    return len(keep)
@@ -0,0 +1,84 @@
+"""Vectorized packet statistics for a batch of PacketRecords.
+
+Works on the decoded header arrays (see packet_records.HEADER_DTYPE) with
+array operations only: boolean masks for the protocol distribution, bitwise
+ANDs for the TCP flag counts, np.unique for distinct addresses, and
+percentiles/histograms of packet sizes and inter-arrival times.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from flow_extractor import ACK, CWR, ECE, FIN, PSH, RST, SYN, URG
+
+TCP_FLAGS = {
+    "SYN": SYN,
+    "ACK": ACK,
+    "FIN": FIN,
+    "RST": RST,
+    "PSH": PSH,
+    "URG": URG,
+    "ECE": ECE,
+    "CWR": CWR,
+}
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Upper bounds of the histogram buckets; the last bucket counts everything above
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 1518)
+IAT_BUCKETS_US = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+
+def percentiles(values: np.ndarray) -> dict:
+    if len(values) == 0:
+        return {f"p{p}": None for p in PERCENTILES}
+    values = np.percentile(values, PERCENTILES)
+    return {f"p{p}": float(v) for p, v in zip(PERCENTILES, values)}
+
+
+def histogram(values: np.ndarray, bounds: tuple) -> dict:
+    """Counts per bucket; bucket i holds values <= bounds[i] (and > bounds[i-1])."""
+    buckets = np.searchsorted(np.asarray(bounds), values, side="left")
+    counts = np.bincount(buckets, minlength=len(bounds) + 1)
+    return {"bounds": list(bounds), "counts": counts.tolist()}
+
+
+def batch_stats(records) -> dict:
+    """Statistics of one batch: protocols, TCP flags, bytes, distinct IPv4
+    addresses, and packet size / inter-arrival time distributions."""
+    h = records.headers
+    n = len(h)
+    lengths = h["length"].astype(np.int64)
+    proto = h["proto"]
+    ip_any = h["ip"] | h["ip6"]
+
+    tcp = h["tcp"]
+    udp = ip_any & (proto == 17)
+    icmp = h["ip"] & (proto == 1)
+    flags = h["flags"][tcp]
+
+    iat = np.clip(np.diff(h["ts"]), 0, None)
+
+    return {
+        "total_packets": n,
+        "total_bytes": int(lengths.sum()),
+        "protocol_distribution": {
+            "TCP": int(tcp.sum()),
+            "UDP": int(udp.sum()),
+            "ICMP": int(icmp.sum()),
+            "Other": int(n - tcp.sum() - udp.sum() - icmp.sum()),
+        },
+        "flag_count": {
+            name: int(np.count_nonzero(flags & mask)) for name, mask in TCP_FLAGS.items()
+        },
+        "src_ip_count": len(np.unique(h["src"][h["ip"]])),
+        "dst_ip_count": len(np.unique(h["dst"][h["ip"]])),
+        "start_time": datetime.fromtimestamp(h["ts"][0] / 1_000_000) if n else None,
+        "end_time": datetime.fromtimestamp(h["ts"][-1] / 1_000_000) if n else None,
+        "average_packet_size": float(lengths.mean()) if n else 0,
+        "packet_size_percentiles": percentiles(lengths),
+        "packet_size_histogram": histogram(lengths, SIZE_BUCKETS),
+        "iat_percentiles_us": percentiles(iat),
+        "iat_histogram_us": histogram(iat, IAT_BUCKETS_US),
+    }
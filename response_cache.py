@@ -0,0 +1,208 @@
+"""In-process cache for the dashboard's polled read endpoints.
+
+Responses are cached per path and query string with a TTL, in an LRU bounded
+by entry count and total bytes. Every cached view declares tags ("batches",
+"flows", "model", ...); `invalidate(tag)` drops the entries of that tag when
+the data behind them changes. A response computed while one of its tags was
+invalidated is not stored, so an invalidation can never be undone by a request
+that read the old data.
+
+Cached responses carry a content ETag and `Cache-Control: no-cache`, so
+polling clients revalidate with If-None-Match and get 304 Not Modified while
+the content is unchanged. The ETag is a hash of the body, so on a miss a
+streamed response is read completely before it is sent, as long as it fits in
+one entry; larger ones are streamed on without an ETag and not cached.
+"""
+
+import hashlib
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from async_runtime import native_threading
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 30.0,
+        enabled: bool = True,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Larger responses are not worth evicting everything else for
+        self.max_entry_bytes = max_bytes // 4
+        self.ttl = ttl
+        self.enabled = enabled
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._generations = {}
+        # Also invalidated from native threads, e.g. when a capture ends
+        self._lock = native_threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.skipped = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires"] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry: dict, generations: tuple) -> bool:
+        """Store `entry` unless one of its tags was invalidated since
+        `generations` was taken or it is too large."""
+        size = len(entry["body"])
+        with self._lock:
+            stale = generations != self._generation(entry["tags"])
+            if stale or size > self.max_entry_bytes:
+                self.skipped += 1
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, *tags):
+        """Drop the cached responses of any of `tags`."""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            stale = [k for k, e in self._entries.items() if set(e["tags"]) & set(tags)]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        self._bytes -= len(self._entries.pop(key)["body"])
+
+    def _generation(self, tags) -> tuple:
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def cached(self, *tags, ttl: float = None):
+        """Decorator caching a GET view's 200 responses under `tags`."""
+        ttl = self.ttl if ttl is None else ttl
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                key = (request.path, tuple(sorted(request.args.items(multi=True))))
+                entry = self.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    return self._respond(entry, "HIT")
+
+                self.misses += 1
+                with self._lock:
+                    generations = self._generation(tags)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+                def entry_for(body: bytes) -> dict:
+                    return {
+                        "body": body,
+                        "mimetype": response.mimetype,
+                        "headers": {
+                            k: v
+                            for k, v in response.headers.items()
+                            if k.lower().startswith("x-")
+                        },
+                        "etag": hashlib.sha1(body).hexdigest(),
+                        "tags": tags,
+                        "expires": time.monotonic() + ttl,
+                    }
+
+                if response.is_streamed:
+                    body, rest = self._collect(response.response)
+                    if body is None:
+                        self.skipped += 1
+                        response.response = rest
+                        response.headers["X-Cache"] = "MISS"
+                        return response
+                else:
+                    body = response.get_data()
+
+                entry = entry_for(body)
+                self.put(key, entry, generations)
+                return self._respond(entry, "MISS")
+
+            return wrapper
+
+        return decorator
+
+    def _collect(self, chunks):
+        """Read a streamed body while it fits in one entry: (body, None), or
+        (None, the chunks read so far followed by the rest) once it does not."""
+        chunks = iter(chunks)
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            parts.append(chunk)
+            size += len(chunk)
+            if size > self.max_entry_bytes:
+                return None, itertools.chain(parts, chunks)
+        return b"".join(parts), None
+
+    def _respond(self, entry: dict, status: str) -> Response:
+        response = Response(
+            entry["body"], mimetype=entry["mimetype"], headers=entry["headers"]
+        )
+        response.set_etag(entry["etag"])
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Cache"] = status
+        response.make_conditional(request)
+        if response.status_code == 304:
+            self.not_modified += 1
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = len(self._entries)
+            size = self._bytes
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "skipped": self.skipped,
+        }
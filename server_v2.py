@@ -1,40 +1,80 @@
-from flask import Flask, jsonify, request
+# First import: monkey-patches the standard library when SERVER_MODE=gevent
+from async_runtime import (
+    SERVER_MODE,
+    WORKER_PROCESS,
+    native_threading,
+    on_signal,
+    start_thread,
+)
+from flask import Flask, Response, jsonify, request, stream_with_context
 from concurrent.futures import ThreadPoolExecutor
 import threading
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 import logging
 from pathlib import Path
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import atexit
 import signal
+import shutil
 import sys
-from function2 import handle_packet
+from function2 import (
+    handle_packet,
+    handle_frame,
+    flush_batch,
+    flow_table,
+    STREAMING_FLOWS,
+    batching_status,
+    ingest_status,
+    db_writer,
+    db_writer_status,
+    flow_rollups,
+    inference_pool,
+    live_feed,
+    metrics,
+    reset_total_packet_count,
+    total_packet_count,
+)
+from live_feed import FEED_ROOM
 from flask_cors import CORS
-from scapy.all import sniff
+from capture import BACKENDS, make_capture
+from flow_queries import MAX_PAGE_SIZE, count_flows, ensure_indexes, find_page
+from flow_store import flow_columns, flows_csv, read_flow_page
+from response_cache import ResponseCache
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from json_stream import (
+    MIMETYPES,
+    document_chunks,
+    frame_chunks,
+    json_body,
+    ndjson_body,
+    response_format,
+)
 import numpy as np
 import os
-from bson import ObjectId, json_util
-import json
+from bson import ObjectId
 from socket_instance import socketio, app
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
 from functools import wraps
-import pandas as pd
 
-from collections import Counter
 from bson.regex import Regex
 from model_state import set_model
+from detectors import model_members, registry
 
 capture_interface = "Wi-Fi"
 
 os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
 
+# Inference pool workers import this module too (see function2.start_pipeline)
+log_handlers = [logging.StreamHandler()]
+if not WORKER_PROCESS:
+    log_handlers.append(logging.FileHandler("app.log"))
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("app.log")],
+    handlers=log_handlers,
 )
 logger = logging.getLogger(__name__)
 
@@ -43,6 +83,36 @@ lock = threading.Lock()
 
 load_dotenv()
 
+# Capture backend (see capture.py): "scapy", "af_packet" or "pcap"
+capture_backend = os.getenv("CAPTURE_BACKEND", "scapy").lower()
+capture_options = {
+    "tpacket_v3": os.getenv("CAPTURE_TPACKET_V3", "0") == "1",
+    "pcap_path": os.getenv("CAPTURE_PCAP_PATH"),
+    "speed": float(os.getenv("CAPTURE_REPLAY_SPEED", 0)),
+}
+
+# Cache of the polled dashboard read endpoints (see response_cache.py)
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_ENTRIES", 256)),
+    max_bytes=int(float(os.getenv("RESPONSE_CACHE_MB", 64)) * 1024 * 1024),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", 30)),
+    enabled=os.getenv("RESPONSE_CACHE", "1") == "1",
+)
+# /api/status counters change with every packet, so it is only cached briefly
+STATUS_CACHE_TTL = 1.0
+
+# Cache tags whose responses change when a collection is written
+CACHE_TAGS_BY_COLLECTION = {"batches": ("batches",), "flow_rollups": ("flows",)}
+
+
+def invalidate_written(collection: str):
+    tags = CACHE_TAGS_BY_COLLECTION.get(collection)
+    if tags:
+        response_cache.invalidate(*tags)
+
+
+db_writer.on_write(invalidate_written)
+
 try:
     mongo_uri = os.environ.get("MONGO_URI")
     if not mongo_uri:
@@ -53,13 +123,19 @@ try:
         serverSelectionTimeoutMS=5000,
         tls=True,
         tlsAllowInvalidCertificates=True,  # For testing only
+        connect=not WORKER_PROCESS,
     )
-    client.server_info()  # Test connection
     db = client["network_monitor"]
     batches_collection = db["batches"]
     alerts_collection = db["alerts"]
     flows_collection = db["flows"]
-    logger.info("Successfully connected to MongoDB")
+    if not WORKER_PROCESS:
+        client.server_info()  # Test connection
+        logger.info("Successfully connected to MongoDB")
+        try:
+            ensure_indexes(flows_collection)
+        except Exception as e:
+            logger.warning(f"Could not create flow indexes: {e}")
 except Exception as e:
     logger.error(f"Failed to connect to MongoDB: {e}")
     sys.exit(1)
@@ -72,19 +148,20 @@ ALERT_DIR = BASE_DIR / "alerts"
 MODEL_DIR = BASE_DIR / "Model"
 
 required_dirs = [OUTPUT_DIR, CSV_OUTPUT_DIR, ALERT_DIR, CICFLOWMETER_DIR, MODEL_DIR]
-for directory in required_dirs:
-    try:
-        directory.mkdir(parents=True, exist_ok=True)
-    except Exception as e:
-        logger.error(f"Failed to create directory {directory}: {e}")
-        sys.exit(1)
+if not WORKER_PROCESS:
+    for directory in required_dirs:
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+        except Exception as e:
+            logger.error(f"Failed to create directory {directory}: {e}")
+            sys.exit(1)
 
 packet_count = 0
 packet_buffer = []
 file_index = 0
 all_predictions = []
 sniff_thread = None
-sniff_control = threading.Event()
+sniff_control = native_threading.Event()
 is_sniffing = False
 
 
@@ -99,6 +176,10 @@ def cleanup():
     if sniff_thread and sniff_thread.is_alive():
         sniff_control.set()
     executor.shutdown(wait=False)
+    if not db_writer.flush(timeout=10):
+        logger.warning("Shutting down with unwritten documents in the DB write queue")
+    if inference_pool is not None:
+        inference_pool.shutdown()
     if "client" in globals():
         client.close()
     logger.info("Cleanup complete")
@@ -111,26 +192,39 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 
-def run_sniff():
-    """Wrapper function for sniff that respects the stop signal"""
-    sniff(
-        iface=capture_interface,
-        prn=handle_packet,
-        store=False,
-        stop_filter=lambda x: sniff_control.is_set(),
+def make_capture_backend(backend: str, iface: str, options: dict):
+    return make_capture(
+        backend,
+        iface=iface,
+        on_packet=handle_packet,
+        on_frame=handle_frame,
+        **options,
     )
 
 
+def run_sniff():
+    """Run the configured capture backend until the stop signal"""
+    try:
+        make_capture_backend(capture_backend, capture_interface, capture_options).run(
+            sniff_control
+        )
+    except Exception as e:
+        logger.error(f"Capture failed: {e}")
+
+    if not sniff_control.is_set():
+        # The source ended on its own, e.g. a pcap replay reached the end
+        flush_batch()
+        stop_packet_capture()
+
+
 def start_packet_capture():
     global sniff_thread, is_sniffing
     if not is_sniffing:
         sniff_control.clear()
-        sniff_thread = threading.Thread(
-            target=run_sniff,
-            daemon=True,
-        )
-        sniff_thread.start()
+        # Native thread: the capture loop would starve the event loop in gevent mode
+        sniff_thread = start_thread(run_sniff, "capture")
         is_sniffing = True
+        response_cache.invalidate("status")
         socketio.emit("capture_status", {"is_sniffing": True})
         logger.info("Packet capture started")
         return True
@@ -142,7 +236,10 @@ def stop_packet_capture():
     if is_sniffing:
         sniff_control.set()
         is_sniffing = False
-        set_total_packet_count(0)
+        if STREAMING_FLOWS:
+            flow_table.flush()
+        reset_total_packet_count()
+        response_cache.invalidate("status")
         socketio.emit("capture_status", {"is_sniffing": False})
         socketio.emit("new_packet", {"total_packet_count": 0})
         logger.info("Packet capture stopped")
@@ -157,16 +254,38 @@ def stop_packet_capture():
 
 @app.route("/api/capture/interface", methods=["POST"])
 def update_capture_interface():
-    global capture_interface
+    """Set the capture interface and optionally the capture backend and its
+    options (pcap_path, speed, tpacket_v3)"""
+    global capture_interface, capture_backend
     try:
         data = request.get_json()
         new_iface = data.get("iface")
-        if not new_iface:
+        backend = data.get("backend", capture_backend)
+        if not new_iface and backend != "pcap":
             return jsonify({"error": "iface is required"}), 400
 
-        capture_interface = new_iface
-        logger.info(f"Interface updated to: {capture_interface}")
-        return jsonify({"message": f"Interface set to {capture_interface}"}), 200
+        options = {
+            **capture_options,
+            **{k: data[k] for k in ("pcap_path", "speed", "tpacket_v3") if k in data},
+        }
+        try:
+            make_capture_backend(backend, new_iface or capture_interface, options)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        capture_interface = new_iface or capture_interface
+        capture_backend = backend
+        capture_options.update(options)
+        logger.info(f"Capture set to {capture_backend} on {capture_interface}")
+        return (
+            jsonify(
+                {
+                    "message": f"Interface set to {capture_interface}",
+                    "backend": capture_backend,
+                }
+            ),
+            200,
+        )
     except Exception as e:
         logger.error(f"Failed to update interface: {e}")
         return jsonify({"error": str(e)}), 500
@@ -180,7 +299,13 @@ def get_capture_interface():
     try:
         available_ifaces = list(psutil.net_if_addrs().keys())
         return jsonify(
-            {"iface": capture_interface, "available_ifaces": available_ifaces}
+            {
+                "iface": capture_interface,
+                "available_ifaces": available_ifaces,
+                "backend": capture_backend,
+                "available_backends": list(BACKENDS),
+                **capture_options,
+            }
         )
     except Exception as e:
         logger.error(f"Failed to get interfaces: {e}")
@@ -324,6 +449,7 @@ def protected_route(current_user):
 
 
 @app.route("/api/status", methods=["GET"])
+@response_cache.cached("status", ttl=STATUS_CACHE_TTL)
 def api_status():
     """Return server status"""
     try:
@@ -331,11 +457,15 @@ def api_status():
             {
                 "status": "running" if is_sniffing else "stopped",
                 "packet_count": packet_count,
-                "total_packet_count": get_total_packet_count(),
+                "total_packet_count": total_packet_count(),
                 "buffer_size": len(packet_buffer),
                 "last_processed": file_index,
                 "is_sniffing": is_sniffing,
                 "thread_alive": sniff_thread.is_alive() if sniff_thread else False,
+                "batching": batching_status(),
+                "ingest": ingest_status(),
+                "db_writer": db_writer_status(),
+                "response_cache": response_cache.stats(),
             }
         )
     except Exception as e:
@@ -343,16 +473,53 @@ def api_status():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Pipeline metrics in the Prometheus text format"""
+    try:
+        return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+    except Exception as e:
+        logger.error(f"Metrics error: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @app.route("/api/batches/all", methods=["GET"])
+@response_cache.cached("batches")
 def get_all_batches():
-    """Lấy toàn bộ batches từ MongoDB (không phân trang)"""
+    """Lấy toàn bộ batches từ MongoDB, streamed.
 
-    def parse_json(data):
-        return json.loads(json_util.dumps(data))
+    Optional: limit/skip paging, fields=a,b projection, format=ndjson.
+    """
+    try:
+        fmt = response_format(request.args)
+        limit = int(request.args.get("limit", 0))
+        skip = int(request.args.get("skip", 0))
+        if limit < 0 or skip < 0:
+            raise ValueError("limit and skip must not be negative")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     try:
-        batches = list(batches_collection.find())
-        return jsonify({"data": parse_json(batches), "total": len(batches)})
+        fields = request.args.get("fields")
+        projection = {f: 1 for f in fields.split(",")} if fields else None
+        total = batches_collection.count_documents({})
+        cursor = (
+            batches_collection.find({}, projection)
+            .sort("_id", 1)
+            .skip(skip)
+            .limit(limit)
+        )
+        chunks = document_chunks(cursor)
+        if fmt == "ndjson":
+            body = ndjson_body(chunks)
+        else:
+            meta = {"limit": limit, "skip": skip} if limit or skip else {}
+            body = json_body(chunks, "data", {"total": total, **meta})
+        return Response(
+            stream_with_context(body),
+            mimetype=MIMETYPES[fmt],
+            headers={"X-Total-Count": str(total)},
+        )
     except Exception as e:
         logger.error(f"Failed to fetch all batches: {e}")
         return jsonify({"error": str(e)}), 500
@@ -397,6 +564,10 @@ def delete_batch(batch_id):
             files_to_delete.append(Path(batch["pcap_file_path"]))
         if batch.get("csv_file_path"):
             files_to_delete.append(Path(batch["csv_file_path"]))
+        if batch.get("flows_file_path") and batch["flows_file_path"] != batch.get(
+            "csv_file_path"
+        ):
+            files_to_delete.append(Path(batch["flows_file_path"]))
 
         # Try to delete each file
         deleted_files = []
@@ -420,6 +591,7 @@ def delete_batch(batch_id):
 
         # Delete from database
         result = batches_collection.delete_one({"_id": ObjectId(batch_id)})
+        response_cache.invalidate("batches")
 
         response = {
             "message": "Batch deleted successfully",
@@ -454,6 +626,7 @@ def update_batch(batch_id):
 
         if result.modified_count == 0:
             return jsonify({"error": "Batch not found or no changes made"}), 404
+        response_cache.invalidate("batches")
 
         return jsonify({"message": "Batch updated successfully"})
     except Exception as e:
@@ -464,27 +637,41 @@ def update_batch(batch_id):
 from flask import send_file
 
 
+def batch_flows_path(batch) -> str:
+    """Flow table of a batch (CSV for batches stored before FLOW_STORE existed)"""
+    if not batch:
+        return None
+    return batch.get("flows_file_path") or batch.get("csv_file_path")
+
+
+# /api/csv filters: query parameter -> flow table column
+FLOW_FILTERS = {
+    "src_ip": "Src IP",
+    "dst_ip": "Dst IP",
+    "protocol": "Protocol",
+    "label": "Label",
+}
+
+
 @app.route("/api/download/csv/<batch_id>")
 def download_csv(batch_id):
     try:
         batch = batches_collection.find_one({"_id": ObjectId(batch_id)})
-        if not batch or not batch.get("csv_file_path"):
+        flows_path = batch_flows_path(batch)
+        if not flows_path:
             return jsonify({"error": "CSV file not found"}), 404
 
-        csv_path = batch["csv_file_path"]
-        if not os.path.exists(csv_path):
+        if not os.path.exists(flows_path):
             return jsonify({"error": "CSV file missing from disk"}), 404
 
-        df = pd.read_csv(csv_path)
-
-        # 🆕 Thêm cột Label
-        df["Label"] = "Attack" if batch.get("is_attack", False) else "Benign"
-
-        # Lưu file tạm
-        temp_path = csv_path.replace(".csv", "_labeled.csv")
-        df.to_csv(temp_path, index=False)
-
-        return send_file(temp_path, as_attachment=True)
+        # 🆕 Thêm cột Label (giữ nhãn theo từng flow nếu đã có)
+        label = "Attack" if batch.get("is_attack", False) else "Benign"
+        return send_file(
+            flows_csv(flows_path, label),
+            mimetype="text/csv",
+            as_attachment=True,
+            download_name=f"{batch['batch_name']}.csv",
+        )
 
     except Exception as e:
         logger.error(f"Failed to download CSV for batch {batch_id}: {e}")
@@ -541,31 +728,78 @@ def get_batch_detail(batch_id):
         return jsonify({"error": str(e)}), 500
 
 
+def flow_rows_response(fmt, chunks, columns, total, skip, limit):
+    """Streamed /api/csv response: the rows as NDJSON, or the rows with the
+    columns and the paging in one JSON object."""
+    if fmt == "ndjson":
+        body = ndjson_body(chunks)
+    else:
+        body = json_body(
+            chunks,
+            "rows",
+            {"columns": columns, "total": total, "skip": skip, "limit": limit},
+        )
+    return Response(
+        stream_with_context(body),
+        mimetype=MIMETYPES[fmt],
+        headers={"X-Total-Count": str(total)},
+    )
+
+
 @app.route("/api/csv/<batch_id>")
 def get_csv_data(batch_id):
     try:
         batch = batches_collection.find_one({"_id": ObjectId(batch_id)})
-        if not batch or not batch.get("csv_file_path"):
+        flows_path = batch_flows_path(batch)
+        if not flows_path:
             return jsonify({"error": "CSV file not found"}), 404
 
-        csv_path = batch["csv_file_path"]
-        if not os.path.exists(csv_path):
+        if not os.path.exists(flows_path):
             return jsonify({"error": "CSV file missing from disk"}), 404
 
-        df = pd.read_csv(csv_path)
+        try:
+            fmt = response_format(request.args)
+            limit = int(request.args.get("limit", 0))
+            skip = int(request.args.get("skip", 0))
+            if limit < 0 or skip < 0:
+                raise ValueError("limit and skip must not be negative")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Optional column projection (?columns=a,b) and filters (?src_ip=...)
+        columns = request.args.get("columns")
+        columns = columns.split(",") if columns else None
+        batch_label = "Attack" if batch.get("is_attack", False) else "Benign"
+        has_labels = "Label" in flow_columns(flows_path)
+        filters = []
+        for param, column in FLOW_FILTERS.items():
+            value = request.args.get(param)
+            if value is None:
+                continue
+            if column == "Protocol":
+                try:
+                    value = int(value)
+                except ValueError:
+                    return jsonify({"error": "protocol must be an integer"}), 400
+            if column == "Label" and not has_labels:
+                # Batch-level label: the whole batch matches or nothing does
+                if value != batch_label:
+                    return flow_rows_response(fmt, (), columns or [], 0, skip, limit)
+                continue
+            filters.append((column, "==", value))
+
+        df, total = read_flow_page(flows_path, columns, filters, skip, limit)
 
         # 🆕 Thêm cột Label nếu chưa có
-        if "Label" not in df.columns:
-            df["Label"] = "Attack" if batch.get("is_attack", False) else "Benign"
-        else:
-            df["Label"] = "Attack" if batch.get("is_attack", False) else "Benign"
+        if not has_labels and (columns is None or "Label" in columns):
+            df["Label"] = batch_label
 
         df = df.replace([np.inf, -np.inf], ["Infinity", "-Infinity"])
         df = df.fillna("null")
 
-        result = {"columns": df.columns.tolist(), "rows": df.to_dict("records")}
-
-        return jsonify(result)
+        return flow_rows_response(
+            fmt, frame_chunks(df), df.columns.tolist(), total, skip, limit
+        )
 
     except Exception as e:
         logger.error(f"Failed to get CSV data for batch {batch_id}: {e}")
@@ -581,11 +815,21 @@ def get_flows():
     - dst_ip (Dst IP)
     - protocol (Protocol)
     - label (Label)
-    - limit, skip
+    - limit, skip, hoặc cursor (meta.next_cursor của trang trước)
+    - count: exact (mặc định), estimated, none
     """
     try:
-        limit = int(request.args.get("limit", 100))
-        skip = int(request.args.get("skip", 0))
+        try:
+            limit = int(request.args.get("limit", 100))
+            skip = int(request.args.get("skip", 0))
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+            if skip < 0:
+                raise ValueError("skip must not be negative")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        cursor = request.args.get("cursor")
+        count_mode = request.args.get("count", "exact")
 
         query = {}
 
@@ -620,12 +864,13 @@ def get_flows():
         if label:
             query["Label"] = label
 
-        raw_flows = list(
-            flows_collection.find(query, {"_id": 0})
-            .sort("Timestamp", -1)
-            .skip(skip)
-            .limit(limit)
-        )
+        try:
+            raw_flows, next_cursor = find_page(
+                flows_collection, query, limit, skip, cursor
+            )
+            total, total_exact = count_flows(flows_collection, query, count_mode)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # ✅ Clean các giá trị không hợp lệ như Infinity
         import math
@@ -633,22 +878,24 @@ def get_flows():
         def clean_value(val):
             if isinstance(val, float) and (math.isinf(val) or math.isnan(val)):
                 return None
+            if isinstance(val, datetime.datetime):
+                return val.isoformat()
             return val
 
         def clean_dict(d):
-            return {k: clean_value(v) for k, v in d.items()}
+            return {k: clean_value(v) for k, v in d.items() if k != "_id"}
 
         flows = [clean_dict(f) for f in raw_flows]
 
-        total = flows_collection.count_documents(query)
-
         return jsonify(
             {
                 "data": flows,
                 "meta": {
                     "total": total,
+                    "total_exact": total_exact,
                     "limit": limit,
                     "skip": skip,
+                    "next_cursor": next_cursor,
                     "filters": query,
                 },
             }
@@ -660,58 +907,29 @@ def get_flows():
 
 
 @app.route("/api/flows/summary", methods=["GET"])
+@response_cache.cached("flows")
 def get_flow_summary():
+    """Flow summary from the per-minute/hour rollups. Optional `start` and
+    `end` (ISO 8601, flow timestamps' local time) and `granularity`
+    (minute or hour)"""
     try:
-        flows = list(
-            flows_collection.find(
-                {},
-                {
-                    "_id": 0,
-                    "Src IP": 1,
-                    "Dst IP": 1,
-                    "Dst Port": 1,
-                    "Protocol": 1,
-                    "Timestamp": 1,
-                },
+        try:
+            start, end = (
+                datetime.datetime.fromisoformat(request.args[k])
+                if request.args.get(k)
+                else None
+                for k in ("start", "end")
             )
-        )
-
-        # Bộ đếm
-        src_ips = Counter()
-        dst_ips = Counter()
-        dst_ports = Counter()
-        protocols = Counter()
-        traffic_time = Counter()
-
-        for flow in flows:
-            src_ips[flow.get("Src IP")] += 1
-            dst_ips[flow.get("Dst IP")] += 1
-            dst_ports[str(flow.get("Dst Port"))] += 1
-            proto = flow.get("Protocol")
-            protocols[str(proto)] += 1
-
-            ts = flow.get("Timestamp")
-            try:
-                t = datetime.datetime.strptime(ts, "%d/%m/%Y %I:%M:%S %p")
-                label = t.isoformat()  # chuyển sang dạng chuẩn ISO 8601
-                traffic_time[label] += 1
-            except Exception:
-                continue
+        except ValueError:
+            return jsonify({"error": "start and end must be ISO 8601 datetimes"}), 400
 
-        def top_n(counter):
-            return [{"name": k, "value": v} for k, v in counter.most_common(10)]
+        try:
+            summary = flow_rollups.summary(start, end, request.args.get("granularity"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         return jsonify(
-            {
-                "top_source_ips": top_n(src_ips),
-                "top_destination_ips": top_n(dst_ips),
-                "top_destination_ports": top_n(dst_ports),
-                "top_protocols": top_n(protocols),
-                "traffic_over_time": [
-                    {"time": k, "count": v} for k, v in sorted(traffic_time.items())
-                ],
-                "updated_at": datetime.datetime.utcnow().isoformat(),
-            }
+            {**summary, "updated_at": datetime.datetime.utcnow().isoformat()}
         )
 
     except Exception as e:
@@ -773,16 +991,27 @@ def api_stop_capture():
         return jsonify({"error": str(e)}), 500
 
 
-from model_state import set_model, get_total_packet_count, set_total_packet_count
+from model_state import set_model
 
 
 @app.route("/api/model/select", methods=["POST"])
 def select_model():
     data = request.get_json()
     model_name = data.get("model")
-    if model_name not in ["autoencoder", "kmeans", "svm"]:
+    if model_name not in ["autoencoder", "kmeans", "svm", "ensemble"]:
         return jsonify({"status": "error", "message": "Invalid model"}), 400
+    try:
+        # Load + warm up the new model(s) before switching, then free the others.
+        # With an inference pool the workers load them on first use instead
+        members = model_members(model_name)
+        if inference_pool is None:
+            for name in members:
+                registry.select(name, keep=members)
+    except Exception as e:
+        logger.error(f"Failed to load model {model_name}: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
     set_model(model_name)  # ✅ cập nhật model qua setter
+    response_cache.invalidate("model")
     return jsonify({"status": "success", "model": model_name})
 
 
@@ -790,10 +1019,45 @@ from model_state import get_model  # thêm dòng này
 
 
 @app.route("/api/model/current", methods=["GET"])
+@response_cache.cached("model")
 def get_current_model():
     return jsonify({"model": get_model()})  # ✅ dùng getter
 
 
+@app.route("/api/model/registry", methods=["GET"])
+def get_model_registry():
+    """Loaded models with their load/warm-up times and memory growth"""
+    return jsonify({"current": get_model(), **registry.stats()})
+
+
+@app.route("/api/model/versions", methods=["GET"])
+def get_model_versions():
+    """Available and active version of each model, with the last deployment"""
+    return jsonify({"current": get_model(), "models": registry.deployments()})
+
+
+@app.route("/api/model/deploy", methods=["POST"])
+def deploy_model():
+    """Load and validate a model version in the background, then swap it in"""
+    data = request.get_json() or {}
+    model_name = data.get("model")
+    version = data.get("version")
+    if model_name not in ["autoencoder", "kmeans", "svm"] or not version:
+        return jsonify({"status": "error", "message": "model and version required"}), 400
+    try:
+        registry.deploy(
+            model_name,
+            version,
+            validate=inference_pool.validate if inference_pool is not None else None,
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    return (
+        jsonify({"status": "deploying", "model": model_name, "version": version}),
+        202,
+    )
+
+
 @socketio.on("connect")
 def handle_connect():
     logger.info("Client connected")
@@ -813,6 +1077,7 @@ def handle_start_capture():
 @socketio.on("connect")
 def handle_connect():
     logger.info("Client connected")
+    join_room(FEED_ROOM)
 
     socketio.emit(
         "capture_status", {"is_sniffing": is_sniffing, "packet_count": packet_count}
@@ -822,6 +1087,23 @@ def handle_connect():
 @socketio.on("disconnect")
 def handle_disconnect():
     logger.info("Client disconnected")
+    live_feed.remove_client(request.sid)
+
+
+@socketio.on("feed_config")
+def handle_feed_config(data):
+    """Per-client live feed sampling: {"sample_ratio": 0.1, "max_samples": 5};
+    a ratio of 1 without max_samples returns the client to the shared feed"""
+    data = data or {}
+    sample_ratio = float(data.get("sample_ratio", 1.0))
+    max_samples = data.get("max_samples")
+    max_samples = int(max_samples) if max_samples is not None else None
+    if sample_ratio >= 1 and max_samples is None:
+        live_feed.remove_client(request.sid)
+        join_room(FEED_ROOM)
+    else:
+        live_feed.configure_client(request.sid, sample_ratio, max_samples)
+        leave_room(FEED_ROOM)
 
 
 # Add debug event handler
@@ -835,23 +1117,28 @@ def handle_debug(data):
 # Startup and Shutdown
 # --------------------------
 
-atexit.register(cleanup)
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+if not WORKER_PROCESS:
+    atexit.register(cleanup)
+    on_signal(signal.SIGINT, signal_handler)
+    on_signal(signal.SIGTERM, signal_handler)
 
 if __name__ == "__main__":
     HOST = os.getenv("BACKEND_HOST", "0.0.0.0")
     PORT = int(os.getenv("BACKEND_PORT", 5000))
 
     try:
-        socketio.run(
-            app,
-            host=HOST,
-            port=PORT,
-            allow_unsafe_werkzeug=True,
-            use_reloader=False,
-            debug=True,
-        )
+        logger.info(f"Starting server in {SERVER_MODE} mode on {HOST}:{PORT}")
+        if SERVER_MODE == "gevent":
+            socketio.run(app, host=HOST, port=PORT, log_output=False)
+        else:
+            socketio.run(
+                app,
+                host=HOST,
+                port=PORT,
+                allow_unsafe_werkzeug=True,
+                use_reloader=False,
+                debug=True,
+            )
     except Exception as e:
         logger.error(f"Failed to start server: {e}")
         sys.exit(1)
@@ -1,3 +1,4 @@
+from async_runtime import ASYNC_MODE, call_in_hub
 from flask import Flask
 from flask_socketio import SocketIO
 from flask_cors import CORS
@@ -5,12 +6,20 @@ from flask_cors import CORS
 app = Flask(__name__)
 CORS(app)
 
-socketio = SocketIO(
+
+class ServerSocketIO(SocketIO):
+    def emit(self, *args, **kwargs):
+        """Emits from capture and batch worker threads are run by the event
+        loop in gevent mode."""
+        return call_in_hub(super().emit, *args, **kwargs)
+
+
+socketio = ServerSocketIO(
     app,
     cors_allowed_origins=["http://localhost:3000"],
     logger=False,
     engineio_logger=False,
-    async_mode="threading",
+    async_mode=ASYNC_MODE,
     ping_timeout=60000,
     ping_interval=25000,
     allow_upgrades=True,
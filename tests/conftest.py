@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# The backend reads its configuration at import time; never the real database
+os.environ["MONGO_URI"] = "mongodb://localhost"
+os.environ.setdefault("AU_BACKEND", "numpy")
+os.environ.setdefault("SERVER_MODE", "dev")
+
+
+@pytest.fixture(scope="session")
+def pipeline(tmp_path_factory):
+    """function2 against an in-memory mongomock database, with its log file
+    and batch artifacts in a temporary directory."""
+    mongomock = pytest.importorskip("mongomock")
+    import pymongo
+
+    pymongo.MongoClient = mongomock.MongoClient
+    workdir = tmp_path_factory.mktemp("pipeline")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import function2
+    finally:
+        os.chdir(cwd)
+    function2.BATCH_DIR = workdir / "batches"
+    function2.BATCH_DIR.mkdir()
+    yield function2
+    function2.db_writer.flush(30)
+
+
+@pytest.fixture
+def db(pipeline):
+    """The pipeline's database, emptied before each test."""
+    for name in ("batches", "flows", "alerts", "flow_rollups"):
+        pipeline.db[name].delete_many({})
+    return pipeline.db
+
+
+def wait_for_batches(pipeline, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = pipeline.batch_queue.stats()
+        if stats["depth"] == 0 and stats["in_progress"] == 0:
+            return
+        time.sleep(0.01)
+    raise TimeoutError("Batches still pending")
+
+
+def tcp_udp_frames(count: int = 600, seed: int = 0) -> list:
+    """(frame bytes, timestamp) of TCP and UDP packets between a few hosts."""
+    import random
+
+    from scapy.all import IP, TCP, UDP, Ether, Raw
+
+    rng = random.Random(seed)
+    frames = []
+    ts = 1_700_000_000.0
+    for _ in range(count):
+        ts += rng.random() * 0.01
+        src, dst = f"10.0.0.{rng.randint(1, 5)}", f"192.168.1.{rng.randint(1, 3)}"
+        if rng.random() < 0.5:
+            l4 = TCP(sport=rng.choice([1234, 2345]), dport=80, flags="PA")
+        else:
+            l4 = UDP(sport=rng.choice([5353, 6000]), dport=53)
+        packet = Ether() / IP(src=src, dst=dst) / l4 / Raw(b"x" * rng.randint(0, 200))
+        frames.append((bytes(packet), ts))
+    return frames
+
+
+def packet_records(frames):
+    from packet_records import PacketBuffer
+
+    buffer = PacketBuffer(len(frames))
+    for frame, ts in frames:
+        buffer.append(frame, ts)
+    return buffer.take()
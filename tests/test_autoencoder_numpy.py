@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from autoencoder_numpy import (
+    H5_PATH,
+    MODEL_DIR,
+    WEIGHTS_PATH,
+    NumpyAutoencoder,
+    export_weights,
+    file_sha256,
+    parity_check,
+    parity_samples,
+)
+
+tf = pytest.importorskip("tensorflow")
+
+
+@pytest.fixture(scope="module")
+def models():
+    keras_model = tf.keras.models.load_model(H5_PATH, compile=False)
+    threshold = np.load(MODEL_DIR / "autoencoder_train_info.npz")["threshold"].item()
+    return keras_model, NumpyAutoencoder.load(), threshold
+
+
+def test_forward_pass_matches_keras(models):
+    keras_model, numpy_model, threshold = models
+    features = numpy_model.layers[0][0].shape[0]
+    data = np.vstack(
+        [
+            parity_samples(numpy_model, threshold, rows=1000, seed=7),
+            np.zeros((1, features), dtype=np.float32),
+            np.ones((1, features), dtype=np.float32),
+        ]
+    )
+
+    np.testing.assert_allclose(
+        numpy_model.predict(data), keras_model.predict(data, verbose=0), atol=1e-5
+    )
+    assert parity_check(keras_model, numpy_model, data, threshold)
+
+
+def test_checked_in_weights_are_exported_from_the_h5_model(models, tmp_path):
+    keras_model, numpy_model, _ = models
+    assert numpy_model.source_sha256 == file_sha256(H5_PATH)
+
+    exported = np.load(export_weights(keras_model, tmp_path / "weights.npz"))
+    checked_in = np.load(WEIGHTS_PATH)
+    assert sorted(exported.files) == sorted(checked_in.files)
+    for name in checked_in.files:
+        np.testing.assert_array_equal(exported[name], checked_in[name])
@@ -0,0 +1,11 @@
+import pytest
+
+from capture import make_capture
+
+
+def test_pcap_replay_speed_is_converted_and_checked():
+    assert make_capture("pcap", pcap_path="replay.pcap", speed="2").speed == 2.0
+
+    for speed in ("fast", None, -1, "nan"):
+        with pytest.raises(ValueError):
+            make_capture("pcap", pcap_path="replay.pcap", speed=speed)
@@ -0,0 +1,32 @@
+from conftest import tcp_udp_frames
+
+
+class ListQueue:
+    def __init__(self):
+        self.batches = []
+
+    def put(self, item, packets):
+        self.batches.append(item)
+        return True
+
+
+def test_closed_batches_keep_every_frame_and_recycle_buffers(pipeline, monkeypatch):
+    queue = ListQueue()
+    monkeypatch.setattr(pipeline, "batch_queue", queue)
+    monkeypatch.setattr(pipeline.batch_policy, "max_packets", 100)
+    pipeline.flush_batch()
+    pipeline.reset_total_packet_count()
+    buffers = {id(pipeline.packet_buffer)} | {id(b) for b in pipeline.spare_buffers}
+
+    frames = tcp_udp_frames(250)
+    for frame, ts in frames:
+        pipeline.handle_frame(frame, ts)
+    pipeline.flush_batch()
+
+    assert [len(records) for records, _ in queue.batches] == [100, 100, 50]
+    stored = [r.frame(i) for r, _ in queue.batches for i in range(len(r))]
+    assert stored == [frame for frame, _ in frames]
+    assert pipeline.total_packet_count() == 250
+    # Closing swapped between the same two buffers instead of allocating
+    in_use = {id(pipeline.packet_buffer)} | {id(b) for b in pipeline.spare_buffers}
+    assert in_use == buffers
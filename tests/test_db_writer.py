@@ -0,0 +1,54 @@
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect
+
+from db_writer import DbWriter
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class LostReply:
+    """Collection whose first bulk write is applied but reported as a network
+    error, as when the connection drops before the server's reply arrives."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = 0
+
+    def bulk_write(self, requests, ordered=True):
+        self.calls += 1
+        result = self.collection.bulk_write(requests, ordered=ordered)
+        if self.calls == 1:
+            raise AutoReconnect("connection closed")
+        return result
+
+
+@pytest.fixture
+def database():
+    return mongomock.MongoClient().db
+
+
+def test_inserts_are_retried_once_written(database):
+    flaky = LostReply(database.batches)
+    writer = DbWriter({"batches": flaky}, flush_interval=0, backoff=0).start()
+
+    writer.insert_one("batches", {"batch_index": 0})
+    assert writer.flush(10)
+
+    assert flaky.calls == 2
+    assert database.batches.count_documents({}) == 1
+    assert (writer.written, writer.failed) == (1, 0)
+
+
+def test_increments_are_not_retried_after_an_unknown_outcome(database):
+    flaky = LostReply(database.flow_rollups)
+    writer = DbWriter({"flow_rollups": flaky}, flush_interval=0, backoff=0).start()
+
+    writer.bulk(
+        "flow_rollups", [UpdateOne({"_id": "m"}, {"$inc": {"flows": 5}}, upsert=True)]
+    )
+    assert writer.flush(10)
+
+    assert flaky.calls == 1
+    assert database.flow_rollups.find_one({"_id": "m"})["flows"] == 5
+    assert writer.failed == 1
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+import flow_store
+from flow_store import FORMATS, read_flow_page, read_flows, write_flows
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def flows():
+    return pd.DataFrame(
+        {
+            "Flow ID": [f"flow-{i}" for i in range(6)],
+            "Flow Duration": [10, 20, 30, 40, 50, 60],
+            "Label": ["BENIGN", "DDoS", "BENIGN", "DDoS", "DDoS", "BENIGN"],
+        }
+    )
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_read_flows_selects_columns_and_rows(flows, tmp_path, fmt):
+    path = write_flows(flows, tmp_path / "flows", fmt)
+
+    df = read_flows(
+        path,
+        columns=["Flow ID", "Missing"],
+        filters=[("Label", "==", "DDoS"), ("Flow Duration", ">", 20)],
+    )
+
+    assert df.columns.tolist() == ["Flow ID"]
+    assert df["Flow ID"].tolist() == ["flow-3", "flow-4"]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_read_flow_page_keeps_only_the_page(flows, tmp_path, fmt, monkeypatch):
+    monkeypatch.setattr(flow_store, "CSV_CHUNK_ROWS", 2)
+    monkeypatch.setattr(flow_store, "ROW_GROUP_SIZE", 2)
+    path = write_flows(flows, tmp_path / "flows", fmt)
+    benign = [("Label", "==", "BENIGN")]
+
+    df, total = read_flow_page(path, ["Flow ID"], benign, skip=1, limit=1)
+    assert (df["Flow ID"].tolist(), total) == (["flow-2"], 3)
+
+    df, total = read_flow_page(path, filters=benign, skip=1)
+    assert (df["Flow ID"].tolist(), total) == (["flow-2", "flow-5"], 3)
+    assert df.columns.tolist() == flows.columns.tolist()
+
+    df, total = read_flow_page(path, ["Flow ID"], benign, skip=5, limit=2)
+    assert (df.columns.tolist(), len(df), total) == (["Flow ID"], 0, 3)
@@ -0,0 +1,24 @@
+from conftest import packet_records, tcp_udp_frames
+
+from inference_pool import InferencePool
+
+
+def test_pool_mode_loads_models_in_workers_only(pipeline, monkeypatch):
+    for name in pipeline.registry.loaded():
+        pipeline.registry.unload(name)
+    flows = pipeline.extract_features_native(packet_records(tcp_udp_frames()), 0)
+    features = pipeline.build_features(flows, "ensemble")
+
+    pool = InferencePool(1)
+    try:
+        monkeypatch.setattr(pipeline, "inference_pool", pool)
+        bundles = pipeline.model_bundles("ensemble")
+        predictions, info = pipeline.score_features("ensemble", features, bundles)
+    finally:
+        pool.shutdown()
+
+    assert len(predictions) == len(features)
+    assert set(info["model_version"]) == set(pipeline.ENSEMBLE_MEMBERS)
+    assert all(d["predictions"] for d in info["detectors"].values())
+    # Only the versions were pinned here; the worker loaded the models
+    assert pipeline.registry.loaded() == []
@@ -0,0 +1,48 @@
+from flask import Flask, Response, stream_with_context
+
+from response_cache import ResponseCache
+
+app = Flask(__name__)
+
+
+def streamed_view(cache, parts):
+    @cache.cached("batches")
+    def view():
+        return Response(stream_with_context(iter(parts)), mimetype="application/json")
+
+    return view
+
+
+def get(view, **headers):
+    with app.test_request_context("/api/batches/all", headers=headers):
+        response = view()
+        body = response.get_data()
+    return response, body
+
+
+def test_streamed_miss_sends_the_etag_of_the_hit():
+    cache = ResponseCache()
+    view = streamed_view(cache, ['{"data": [', "1, 2", "]}"])
+
+    miss, body = get(view)
+    hit, _ = get(view)
+
+    assert miss.headers["X-Cache"] == "MISS" and hit.headers["X-Cache"] == "HIT"
+    assert body == b'{"data": [1, 2]}'
+    assert miss.get_etag()[0] and miss.get_etag() == hit.get_etag()
+
+    cache.clear()
+    revalidated, _ = get(view, **{"If-None-Match": f'"{miss.get_etag()[0]}"'})
+    assert revalidated.status_code == 304
+
+
+def test_streamed_response_too_large_to_cache_is_passed_on():
+    cache = ResponseCache(max_bytes=64)
+    parts = ["x" * 10] * 5
+    view = streamed_view(cache, parts)
+
+    response, body = get(view)
+
+    assert body == "".join(parts).encode()
+    assert response.get_etag() == (None, None)
+    assert cache.stats()["entries"] == 0
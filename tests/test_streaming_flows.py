@@ -0,0 +1,29 @@
+from conftest import tcp_udp_frames, wait_for_batches
+
+
+def test_streamed_flows_are_stored_once(pipeline, db, monkeypatch):
+    monkeypatch.setattr(pipeline, "STREAMING_FLOWS", True)
+    emitted = pipeline.flow_table.emitted
+
+    for frame, ts in tcp_udp_frames():
+        pipeline.handle_frame(frame, ts)
+    pipeline.flush_batch()
+    wait_for_batches(pipeline)
+
+    pipeline.flow_table.flush()
+    with pipeline.finished_lock:
+        rows = pipeline.finished_flows.copy()
+        pipeline.finished_flows.clear()
+    pipeline.process_finished_flows(rows, 0)
+    assert pipeline.db_writer.flush(30)
+
+    flows = pipeline.flow_table.emitted - emitted
+    assert flows == len(rows) > 0
+    assert db.flows.count_documents({}) == flows
+    assert db.flows.count_documents({"batch_index": {"$exists": True}}) == 0
+    minutes = db.flow_rollups.find({"granularity": "minute"})
+    assert sum(doc["flows"] for doc in minutes) == flows
+    # The batch itself is still saved, without scoring its flows again
+    batch = db.batches.find_one()
+    assert batch["scoring_mode"] == "stream"
+    assert batch["attack_flow_count"] is None